@@ -1,20 +1,44 @@
 # app.py (Final Verified Version)
-from flask import Flask, request, jsonify, render_template
+# Flask 介面：解析請求、呼叫 astro_engine 計算並輸出回應。命盤計算本身都在 astro_engine，
+# 其他程式需要計算命盤時請直接匯入 astro_engine，不必載入這個模組（Flask、.env 與啟動時的星曆準備）。
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 import datetime
+import time
 import pytz
-import swisseph as swe
 import json
 import os
 import logging
-import math
 from functools import wraps
+from contextlib import nullcontext
 from dotenv import load_dotenv
 
-load_dotenv() # 在應用程式啟動時從 .env 載入變數
+import astro_engine
+import chart_cache
+import aspect_timing
+import compute_backend
+import chart_metrics
+import timezones
+import chart_formats
+import chart_fields
+import chart_session
+import relationship_charts
+import http_cache
+import rectification
+import house_systems
+from house_systems import HouseSystem
+from display_format import zodiac_format_many
+# 端點使用的計算函式與常數
+from astro_engine import (
+    PLANET_IDS, ASPECTS, BASE_PLANETS, EPHE_PATH_CONFIG,
+    get_midpoint, julian_days, position_fn_for, compute_positions, required_points, ephemeris_body,
+    calculate_astrology_chart, calculate_astrology_chart_batch,
+    chart_args_from_payload, chart_kwargs_from_payload, fields_from_payload, pair_compute_fields,
+    list_aspects, list_interchart_aspects, get_planet_overlays_in_houses,
+    format_chart_data_for_display, iter_synastry_pairs, positions_with_nodes, rectify_chunk,
+)
 
-# --- Import our downloader script ---
-import swiss_ephe_downloader
+load_dotenv() # 在應用程式啟動時從 .env 載入變數
 
 
 # Configure logging
@@ -47,402 +71,43 @@ all_timezones = pytz.all_timezones
 # print(json.dumps(list(all_timezones)))
 
 # ==============================================================================
-# --- Run the downloader and set the ephemeris path at startup ---
+# --- 啟動時準備星曆（見 astro_engine.init）---
 # ==============================================================================
-# Use the path defined in the downloader to ensure consistency
-# EPHE_PATH_CONFIG = swiss_ephe_downloader.EPHE_DIR
-EPHE_PATH_CONFIG = os.path.abspath(swiss_ephe_downloader.EPHE_DIR) # 確保是絕對路徑
-print(f"DEBUG: EPHE_PATH_CONFIG is set to: {EPHE_PATH_CONFIG}")
-try:
-    # This will trigger downloads on the server if files are missing
-    swiss_ephe_downloader.ensure_ephe_files_exist()
-    # Then, tell the swisseph engine where to find them
-    swe.set_ephe_path(EPHE_PATH_CONFIG)
-    logging.info(f"Successfully set Swisseph ephemeris path to: {EPHE_PATH_CONFIG}")
-except Exception as e:
-    logging.critical(f"FATAL ERROR: Could not set up or download ephemeris files. App cannot run. Error: {e}", exc_info=True)
+# 缺少核心星曆檔時在此下載，並設定星曆路徑、計算後端與快速星曆表，第一個請求不必等待。
+astro_engine.init()
 # ==============================================================================
 
 
 
-PLANET_IDS = {
-    "太陽": swe.SUN, "月亮": swe.MOON, "水星": swe.MERCURY, "金星": swe.VENUS,
-    "火星": swe.MARS, "木星": swe.JUPITER, "土星": swe.SATURN, "天王": swe.URANUS,
-    "海王": swe.NEPTUNE, "冥王": swe.PLUTO, "凱龍": swe.CHIRON, "穀神": swe.CERES,
-    "智神": swe.PALLAS, "婚神": swe.JUNO, "灶神": swe.VESTA,
-    "愛神": swe.AST_OFFSET + 433, "莉莉絲": swe.MEAN_APOG, "靈神": swe.AST_OFFSET + 16,
-    "人龍": swe.PHOLUS, "北交": swe.MEAN_NODE,
-}
-
-ZODIAC_SIGNS = [
-    "牡羊", "金牛", "雙子", "巨蟹", "獅子", "處女",
-    "天秤", "天蠍", "射手", "摩羯", "水瓶", "雙魚",
-]
+# 批次端點單次請求最多可包含的命盤數量
+MAX_BATCH_SIZE = int(os.getenv("ASTRO_MAX_BATCH_SIZE", "500"))
 
-ASPECTS = {
-    "合相": 0, "十二分相": 30, "半刑": 45, "六合": 60, "五分相": 72,
-    "刑": 90, "拱": 120, "補八分相": 135, "倍五分相": 144, "梅花形相": 150, "沖": 180,
-}
+# 合盤矩陣：單次請求最多可計算的配對數
+MAX_SYNASTRY_PAIRS = int(os.getenv("ASTRO_MAX_SYNASTRY_PAIRS", "50000"))
 
-DEFAULT_ORB = {
-    "合相": 8, "沖": 8, "拱": 6, "刑": 6, "六合": 5, "梅花形相": 4,
-    "半刑": 3, "補八分相": 3, "十二分相": 3, "五分相": 2.5, "倍五分相": 2.5,
-}
+# fields 在各端點可額外選取的區段（命盤欄位見 chart_fields.CHART_FIELDS）
+PAIR_SECTIONS = ("inter_aspects", "overlays")                 # 比較盤、行運盤
+SYNASTRY_SECTIONS = ("summary", "inter_aspects", "overlays")  # 合盤矩陣的每個配對
+RELATIONSHIP_SECTIONS = ("natal_charts",)                      # 組合盤、時空中點盤
+# 關係盤不輸出本命盤時，兩張基礎盤只需要星體位置與宮頭（略過相位、宮位落點與顯示字串）
+RELATIONSHIP_BASE_FIELDS = chart_fields.FieldSelection(
+    chart=("planet_positions", "house_cusps", "latitude", "longitude", "house_system"), planet=("lon", "speed"))
 
-FOUR_ANGLES_AND_NODES = ['上升', '下降', '天頂', '天底', '宿命', '福點', '北交', '南交']
-HOUSE_DEFINING_POINTS = ['上升', '下降', '天頂', '天底']
+# 行運時間軸：可用的步長（日）、單次請求的最大步數與最長期間（日）
+TIMELINE_STEPS = {"hour": 1 / 24, "day": 1.0}
+MAX_TIMELINE_STEPS = int(os.getenv("ASTRO_MAX_TIMELINE_STEPS", "20000"))
+MAX_TIMELINE_DAYS = float(os.getenv("ASTRO_MAX_TIMELINE_DAYS", "3660"))
 
-PLANETS_THAT_CAN_RETROGRADE = [
-    "水星", "金星", "火星", "木星", "土星", "天王", "海王", "冥王",
-    "凱龍", "穀神", "智神", "婚神", "灶神", "愛神", "莉莉絲", "靈神", "人龍"
-]
-
-BASE_PLANETS = [
-    "太陽", "月亮", "水星", "金星", "火星", "木星", "土星",
-    "天王", "海王", "冥王", "北交"
-]
+# 出生時間校正：單次請求的最大候選數、事件數與回傳的最佳候選數上限
+MAX_RECTIFICATION_CANDIDATES = int(os.getenv("ASTRO_MAX_RECTIFICATION_CANDIDATES", "5000"))
+MAX_RECTIFICATION_EVENTS = int(os.getenv("ASTRO_MAX_RECTIFICATION_EVENTS", "100"))
+MAX_RECTIFICATION_TOP = 100
 
 # ==============================================================================
 # Helper Functions (輔助函數)
 # ==============================================================================
-def dms_format(deg: float) -> str:
-    """將十進制度數轉換為度、分的 60 進制格式 (含四捨五入與進位處理)"""
-    
-    # 你之前遇到的 NoneType 錯誤，如果這個函數在其他地方也可能接收 None，建議保留這行
-    # 例如：
-    # if deg is None:
-    #     return "N/A" # 或者 "00°00'"
-
-    d = int(deg)  # 取整數度數
-    minutes_decimal = (deg - d) * 60  # 將小數部分轉換為分鐘（含小數）
-    m = round(minutes_decimal)  # **關鍵：在這裡對分鐘進行四捨五入**
-
-    # 處理分鐘的進位（如果四捨五入後分鐘達到 60）
-    if m >= 60:
-        d += 1
-        m = 0
-    
-    # 不再計算和處理秒數
-
-    # 格式化為 XX°YY' (只顯示度數和分鐘)
-    # 使用 zfill 確保兩位數格式（例如 5 變成 05）
-    return f"{str(d).zfill(2)}°{str(m).zfill(2)}'"
-
-def degree_format(deg: float) -> str:
-    # OLD: return f"{deg:.2f}°"
-    # NEW: Use the new DMS formatter
-    return dms_format(deg)
-
-def zodiac_format(deg: float) -> str:
-    sign_idx = int(deg // 30)
-    deg_in_sign = deg % 30
-    return f"{ZODIAC_SIGNS[sign_idx]}({degree_format(deg_in_sign)})"
-
-def get_midpoint(deg1: float, deg2: float) -> float:
-    rad1 = math.radians(deg1)
-    rad2 = math.radians(deg2)
-    x = math.cos(rad1) + math.cos(rad2)
-    y = math.sin(rad1) + math.sin(rad2)
-    mid_rad = math.atan2(y, x)
-    return (math.degrees(mid_rad) + 360) % 360
-
-def compute_positions(jd_ut: float, planet_names_to_calculate: list):
-    # 注意：現在不再需要在每個函數內都呼叫 set_ephe_path
-    # 因為我們已經在應用程式啟動時全域設定好了。
-    pos = {}
-    speeds = {}
-    for name in planet_names_to_calculate:
-        pid = PLANET_IDS.get(name)
-        if pid is None:
-            app.logger.warning(f"WARNING: Planet name '{name}' not found in PLANET_IDS, skipping.")
-            continue
-        try:
-            xx, ret_code = swe.calc_ut(jd_ut, pid, swe.FLG_SWIEPH | swe.FLG_SPEED)
-            if ret_code < 0:
-                error_string = swe.get_errstr(ret_code) if hasattr(swe, 'get_errstr') else "未知錯誤"
-                raise Exception(f"Swisseph 計算 {name} 時發生錯誤: {error_string}。")
-            pos[name] = xx[0]
-            speeds[name] = xx[3]
-        except Exception as e:
-            app.logger.error(f"計算天體 {name} (PID: {pid}) 時發生錯誤: {e}", exc_info=True)
-            pos[name] = 0.0
-            speeds[name] = 0.0
-    if "北交" in pos and "北交" in speeds:
-        pos["南交"] = (pos["北交"] + 180) % 360
-        speeds["南交"] = -speeds.get("北交", 0.0)
-    return pos, speeds
-
-def compute_four_angles(jd_tt: float, lat: float, lon: float):
-    try:
-        cusps_output_raw, ascmc_raw = swe.houses(jd_tt, lat, lon, b"P")
-        cusps_dict_formatted = {i + 1: cusps_output_raw[i] for i in range(12)}
-        angles_data = {
-            "上升": ascmc_raw[0], "下降": (ascmc_raw[0] + 180) % 360,
-            "天頂": ascmc_raw[1], "天底": (ascmc_raw[1] + 180) % 360,
-            "宿命": ascmc_raw[3], "cusps": cusps_dict_formatted,
-        }
-        return angles_data
-    except Exception as e:
-        app.logger.error(f"計算四軸時發生錯誤: {e}", exc_info=True)
-        raise Exception(f"計算四軸時發生錯誤，請檢查經緯度及時間設定，或星曆檔案: {e}")
-
-# ==============================================================================
-# --- 請用此版本【完整取代】您 app.py 中的舊函式 ---
-# ==============================================================================
-
-def calculate_astrology_chart(year, month, day, hour, minute, latitude, longitude, timezone_str, optional_planets=None, generate_image=False):
-    """
-    核心計算函式。此版本已加入「智慧依賴處理」邏輯，
-    例如當使用者勾選福點時，會自動在內部計算其依賴的太陽、月亮和上升。
-    """
-    try:
-        swe.set_ephe_path(EPHE_PATH_CONFIG)
-        
-        # --- 1. 時間與儒略日計算 (此部分邏輯不變) ---
-        if timezone_str == "Asia/Chongqing":
-            utc_offset = datetime.timedelta(hours=8)
-            fixed_tz = datetime.timezone(utc_offset, name="UTC+08:00 (Astrological Correction for Chengdu)")
-            local_dt = datetime.datetime(year, month, day, hour, minute, 0, tzinfo=fixed_tz)
-        else:
-            try:
-                local_tz = pytz.timezone(timezone_str)
-                local_dt = local_tz.localize(datetime.datetime(year, month, day, hour, minute, 0))
-            except pytz.UnknownTimeZoneError:
-                app.logger.warning(f"無效的時區名稱: '{timezone_str}'")
-                return {
-                    "error": f"您手動輸入的時區 '{timezone_str}' 無效。請檢查拼寫，或從下拉選單中選擇。",
-                    "error_type": "invalid_timezone"
-                }
-        utc_dt = local_dt.astimezone(pytz.utc)
-        jd_ut = swe.julday(utc_dt.year, utc_dt.month, utc_dt.day, utc_dt.hour + utc_dt.minute / 60 + utc_dt.second / 3600)
-        delta_t_seconds = swe.deltat(jd_ut)
-        jd_tt = jd_ut + delta_t_seconds / (24 * 3600)
-
-        # --- 2. 【核心修改】智慧依賴處理 ---
-        # user_requested_planets 是使用者真正想看到的「菜單」
-        user_requested_planets = set(optional_planets if optional_planets is not None else [])
-        
-        # planets_to_calculate 是廚師為了做菜需要準備的「備料單」
-        planets_to_calculate = user_requested_planets.copy()
-        
-        # 如果菜單上有「福點」，備料單就必須加入「太陽、月亮、上升」
-        if "福點" in user_requested_planets:
-            planets_to_calculate.update({"太陽", "月亮", "上升"})
-        
-        # 如果菜單上有任何宮位相關的點，備料單就必須加入「上升」
-        if any(p in user_requested_planets for p in ["上升", "下降", "天頂", "天底", "宿命"]):
-            planets_to_calculate.add("上升")
-        
-        app.logger.info(f"使用者請求: {user_requested_planets}")
-        app.logger.info(f"內部實際計算: {planets_to_calculate}")
-        
-        # --- 3. 使用「備料單」進行計算 ---
-        planets_for_swisseph = [p for p in planets_to_calculate if p in PLANET_IDS]
-        positions_raw, speeds_raw = compute_positions(jd_ut, planets_for_swisseph)
-        
-        # 無論如何都計算四軸和宮位，因為它們是基礎結構
-        angles_data = compute_four_angles(jd_tt, latitude, longitude)
-        
-        # 4. 將所有計算出的點統一格式，存入一個內部字典，以防 'float' object is not subscriptable 錯誤
-        internal_points = {}
-        for name, lon in positions_raw.items():
-            internal_points[name] = {'lon': lon, 'speed': speeds_raw.get(name, 0.0)}
-        for name in ["上升", "下降", "天頂", "天底", "宿命"]:
-            if angles_data.get(name) is not None:
-                internal_points[name] = {'lon': angles_data[name], 'speed': 0.0}
-        
-        # 只有當所有備料都齊全時，才製作「福點」這道菜
-        if "福點" in planets_to_calculate and all(k in internal_points for k in ["太陽", "月亮", "上升"]):
-            sun_lon = internal_points["太陽"]["lon"]
-            moon_lon = internal_points["月亮"]["lon"]
-            asc_lon = internal_points["上升"]["lon"]
-            is_day_chart = (sun_lon - asc_lon + 360) % 360 >= 180
-            pof_lon = compute_part_of_fortune(sun_lon, moon_lon, asc_lon, is_day_chart)
-            internal_points["福點"] = {'lon': pof_lon, 'speed': 0.0}
-        else:
-            is_day_chart = False # 預設值
-
-        # 5. 【核心修改】過濾最終輸出結果
-        # 準備上菜，只上客戶點的菜
-        final_planet_positions = {}
-        # 這裡我們遍歷的是客戶的「原始菜單」，而不是廚師的「備料單」
-        for name in user_requested_planets:
-            if name in internal_points:
-                info = internal_points[name]
-                house_num, hdeg = find_house(info['lon'], angles_data['cusps'])
-                final_planet_positions[name] = {
-                    'lon': info['lon'], 'speed': info.get('speed', 0.0), 'house': house_num, 'hdeg': hdeg,
-                    'is_retrograde': bool(name in PLANETS_THAT_CAN_RETROGRADE and info.get('speed', 0.0) < 0),
-                    'retrograde_label': "逆行" if (name in PLANETS_THAT_CAN_RETROGRADE and info.get('speed', 0.0) < 0) else "",
-                    'zodiac_position_formatted': zodiac_format(info['lon'])
-                }
-        
-        # 同樣，相位也只顯示客戶點的星體之間的相位
-        all_aspects = list_aspects(internal_points)
-        final_aspects = [asp for asp in all_aspects if asp['p1_name'] in user_requested_planets and asp['p2_name'] in user_requested_planets]
-
-        # 6. 回傳結果 (使用與您原始碼完全相同的完整結構)
-        return {
-            "local_time": local_dt.strftime("%Y-%m-%d %H:%M:%S %Z%z"),
-            "utc_time": utc_dt.strftime("%Y-%m-%d %H:%M:%S %Z%z"),
-            "julian_day_ut": jd_ut, 
-            "delta_t_seconds": delta_t_seconds, 
-            "julian_day_tt": jd_tt,
-            "latitude": latitude, 
-            "longitude": longitude,
-            "ephemeris_path_status": {"status": "OK", "message": f"星曆檔案路徑已從 {EPHE_PATH_CONFIG} 載入。"},
-            "debug_info": {"is_day_chart": is_day_chart},
-            "house_cusps": angles_data['cusps'],
-            "planet_positions": final_planet_positions,  # 使用已過濾的、只包含使用者所選星體的結果
-            "aspects": final_aspects,  # 使用已過濾的、只包含使用者所選星體之間相位的結果
-            "chart_image_b64": "placeholder_for_base64_image_string" if generate_image else None,
-        }
-    except Exception as e:
-        app.logger.error(f"計算命盤時發生錯誤: {e}", exc_info=True)
-        return {"error": str(e)}
-        
-def compute_part_of_fortune(sun_lon: float, moon_lon: float, asc_lon: float, is_day: bool) -> float:
-    return (asc_lon + moon_lon - sun_lon) % 360 if is_day else (asc_lon + sun_lon - moon_lon) % 360
-
-def find_house(deg: float, cusps_dict: dict):
-    if not isinstance(cusps_dict, dict) or len(cusps_dict) < 12:
-        return 1, 0.0
-
-    cusps_list = [cusps_dict.get(i, 0.0) for i in range(1, 13)]
-
-    for i in range(1, 13):
-        start_cusp = cusps_list[i - 1]
-        end_cusp = cusps_list[i % 12]
-
-        d_start, d_end, d_deg = start_cusp, end_cusp, deg
-        if d_end < d_start:
-            d_end += 360
-            if d_deg < d_start:
-                d_deg += 360
-
-        if d_start <= d_deg < d_end:
-            relative_degree = (deg - start_cusp + 360) % 360
-            return i, relative_degree
-    app.logger.warning(f"無法為度數 {deg} 找到宮位。預設返回第一宮。宮頭: {cusps_list}")
-    return 1, 0.0
-
-def aspect_between(p1_name: str, p2_name: str, lon_a: float, lon_b: float, speed_a: float, speed_b: float):
-    diff_current = abs(lon_a - lon_b)
-    diff_current = min(diff_current, 360 - diff_current)
-
-    result_aspect = None
-    for asp_name, target_angle in ASPECTS.items():
-        orb = DEFAULT_ORB.get(asp_name, 3)
-        current_deviation = abs(diff_current - target_angle)
-
-        if current_deviation <= orb:
-            aspect_type = ""
-            is_p1_moving = (p1_name in PLANETS_THAT_CAN_RETROGRADE or p1_name in ["太陽", "月亮"])
-            is_p2_moving = (p2_name in PLANETS_THAT_CAN_RETROGRADE or p2_name in ["太陽", "月亮"])
-            is_two_fixed_points = (p1_name in FOUR_ANGLES_AND_NODES and p2_name in FOUR_ANGLES_AND_NODES)
-
-            if (is_p1_moving or is_p2_moving) and not is_two_fixed_points:
-                dt_factor = 1 / 24
-                lon_a_next = (lon_a + speed_a * dt_factor) % 360
-                lon_b_next = (lon_b + speed_b * dt_factor) % 360
-                diff_next = abs(lon_a_next - lon_b_next)
-                diff_next = min(diff_next, 360 - diff_next)
-                next_deviation = abs(diff_next - target_angle)
-                if next_deviation < current_deviation - 1e-9:
-                    aspect_type = "入相"
-                elif next_deviation > current_deviation + 1e-9:
-                    aspect_type = "出相"
-                else:
-                    aspect_type = "入相"
-            result_aspect = asp_name, current_deviation, aspect_type
-            break
-    return result_aspect
-
-def format_chart_data_for_display(raw_chart_data):
-    if "error" in raw_chart_data: return raw_chart_data
-    output = {
-        "timestamps": {
-            "local_time": raw_chart_data["local_time"], "utc_time": raw_chart_data["utc_time"],
-            "julian_day_ut": f"{raw_chart_data.get('julian_day_ut', 0):.6f}",
-            "delta_t_seconds": raw_chart_data.get('delta_t_seconds', 0),
-            "julian_day_tt": f"{raw_chart_data.get('julian_day_tt', 0):.6f}"
-        },
-        "birth_info": {"latitude": f"{raw_chart_data['latitude']:.2f}", "longitude": f"{raw_chart_data['longitude']:.2f}"},
-        "ephemeris_path_status": raw_chart_data.get("ephemeris_path_status", {"status": "Unknown", "message": "N/A"}),
-        "debug_info": raw_chart_data.get("debug_info", {}),
-        "house_cusps": [{"house_number": i, "zodiac_position_formatted": zodiac_format(raw_chart_data["house_cusps"][i])} for i in range(1, 13)],
-        "planet_positions": {},
-        "aspects": raw_chart_data["aspects"]
-    }
-    for name, info in raw_chart_data["planet_positions"].items():
-        formatted_info = info.copy()
-        formatted_info['house_display'] = f"{int(info['house'])}宮" if info.get('house') is not None else ""
-        formatted_info['hdeg_display'] = f"{info['hdeg']:.2f}°" if info.get('hdeg') is not None else ""
-        output["planet_positions"][name] = formatted_info
-    return output
-
-def list_aspects(detailed_points_info: dict):
-    res = []
-    keys = list(detailed_points_info.keys())
-    for i in range(len(keys)):
-        for j in range(i + 1, len(keys)):
-            p1_name, p2_name = keys[i], keys[j]
-            p1_info, p2_info = detailed_points_info.get(p1_name), detailed_points_info.get(p2_name)
-            if not p1_info or not p2_info: continue
-
-            definitional_oppositions = [
-                {"上升", "下降"}, {"天頂", "天底"}, {"北交", "南交"},
-            ]
-            current_pair = {p1_name, p2_name}
-            if any(current_pair == pair for pair in definitional_oppositions):
-                continue
-
-            p1_lon, p2_lon = p1_info['lon'], p2_info['lon']
-            p1_speed, p2_speed = p1_info.get('speed', 0.0), p2_info.get('speed', 0.0)
-
-            asp_info = aspect_between(p1_name, p2_name, p1_lon, p2_lon, p1_speed, p2_speed)
-            if asp_info:
-                asp_name, orb_val, aspect_type = asp_info
-                res.append({
-                    "p1_name": p1_name, "p2_name": p2_name, "aspect_name": asp_name,
-                    "aspect_type": aspect_type, "orb": orb_val,
-                    "p1_details": p1_info, "p2_details": p2_info
-                })
-    return sorted(res, key=lambda item: (ASPECTS.get(item["aspect_name"], 361), item["orb"]))
-
-def list_interchart_aspects(chart1_points: dict, chart2_points: dict):
-    res = []
-    for p1_name, p1_info in chart1_points.items():
-        for p2_name, p2_info in chart2_points.items():
-            if not p1_info or 'lon' not in p1_info or not p2_info or 'lon' not in p2_info:
-                continue
-            p1_lon, p2_lon = p1_info['lon'], p2_info['lon']
-            p1_speed, p2_speed = p1_info.get('speed', 0.0), p2_info.get('speed', 0.0)
-            asp_info = aspect_between(p1_name, p2_name, p1_lon, p2_lon, p1_speed, p2_speed)
-            if asp_info:
-                asp_name, orb_val, aspect_type = asp_info
-                res.append({
-                    "p1_name": p1_name, "p2_name": p2_name, "aspect_name": asp_name,
-                    "aspect_type": aspect_type, "orb": orb_val,
-                    "p1_details": p1_info, "p2_details": p2_info
-                })
-    return sorted(res, key=lambda item: (ASPECTS.get(item["aspect_name"], 361), item["orb"]))
-
-def get_planet_overlays_in_houses(source_chart_points: dict, target_chart_cusps: dict):
-    overlays = []
-    for planet_name in source_chart_points.keys():
-        planet_info = source_chart_points.get(planet_name)
-        if not planet_info or 'lon' not in planet_info:
-            continue
-        house_in_target, deg_in_target_house = find_house(planet_info['lon'], target_chart_cusps)
-        overlays.append({
-            "planet_name": planet_name,
-            "zodiac_position_formatted": zodiac_format(planet_info['lon']),
-            "retrograde_label": planet_info.get('retrograde_label', ''),
-            "house_in_target_chart": house_in_target,
-            "degree_in_target_house": deg_in_target_house
-        })
-    return overlays
+def invalid_fields_response(e: ValueError):
+    return jsonify({"error": str(e), "error_type": "invalid_fields"}), 400
 
 # ==============================================================================
 # API Routes (API 路由)
@@ -474,6 +139,80 @@ def api_key_required(f):
 # --- End of API Security ---
 # ==============================================================================
 
+def _ephemeris_state():
+    return http_cache.ephemeris_state(astro_engine.EPHE_PATH_CONFIG, astro_engine.FAST_EPHEMERIS)
+
+# 裝飾器：回應只由請求內容與星曆狀態決定的端點（見 http_cache.cacheable）。
+# debug_timing 的回應含有耗時，不快取。
+cacheable_response = http_cache.cacheable(_ephemeris_state, skip=lambda data: debug_timing_requested(data))
+
+def precomputed_response(payload, max_age=86400):
+    """回傳 timezones.PrecomputedPayload：If-None-Match 相符時回 304，用戶端接受 gzip 時回傳壓縮版本。"""
+    if request.if_none_match.contains(payload.etag):
+        response = Response(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = Response(payload.gzip_body, mimetype=payload.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payload.body, mimetype=payload.mimetype)
+    response.set_etag(payload.etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# --- 效能量測 (chart_metrics) ---
+def timed_jsonify(payload):
+    """jsonify 並記錄序列化耗時。"""
+    with chart_metrics.stage("jsonify"):
+        return jsonify(payload)
+
+def formatted_chart_response(payload: dict, mimetype: str, batch=False):
+    """
+    依協商好的格式輸出命盤（batch=True 時 payload 為批次結果）。
+    normalized 以索引引用星體；批次的 MessagePack 使用欄式表格，單盤的 MessagePack 使用 normalized 結構。
+    """
+    if mimetype == chart_formats.JSON_MIMETYPE:
+        response = timed_jsonify(payload)
+    else:
+        with chart_metrics.stage("serialize"):
+            if mimetype == chart_formats.NORMALIZED_MIMETYPE:
+                body = chart_formats.normalize_batch(payload) if batch else chart_formats.normalize_chart(payload)
+                response = Response(app.json.dumps(body), mimetype=mimetype)
+            elif mimetype == chart_formats.COLUMNAR_MIMETYPE:
+                response = Response(app.json.dumps(chart_formats.columnar_batch(payload)), mimetype=mimetype)
+            else:
+                body = chart_formats.columnar_batch(payload) if batch else chart_formats.normalize_chart(payload)
+                response = Response(chart_formats.pack(body), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def debug_timing_requested(data) -> bool:
+    return isinstance(data, dict) and bool(data.get('debug_timing', False))
+
+def rounded_timings(timings: dict) -> dict:
+    return {name: round(ms, 3) for name, ms in timings.items()}
+
+@app.before_request
+def _start_request_timer():
+    if chart_metrics.ENABLED:
+        g.request_started_at = time.perf_counter()
+
+@app.after_request
+def _record_request_time(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        chart_metrics.observe_request(request.endpoint, time.perf_counter() - started_at)
+    return response
+
+# 用戶端接受時以 brotli / gzip 壓縮回應（見 http_cache.compress_response）
+app.after_request(http_cache.compress_response)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文字格式的各階段耗時與快取統計（需設定 ASTRO_METRICS=1 才會累積耗時）。"""
+    body = chart_metrics.render_prometheus(chart_cache.cache_stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 # 定義 API 接口 (這段程式碼放在應用程式初始化之後，運行之前)
 
 @app.route('/api/timezones')
@@ -481,8 +220,14 @@ def get_timezones():
     """
     提供所有 IANA 時區名稱的 API 接口
     """
-    # 將 all_timezones 列表轉換為 JSON 格式回傳
-    return jsonify(list(all_timezones)) # 使用上面定義的 all_timezones
+    # 內容固定不變：回傳預先產生的 JSON（支援 ETag 與 gzip）
+    return precomputed_response(timezones.timezone_list_payload())
+
+@app.route('/api/v1/cache/stats')
+@api_key_required
+def get_cache_stats():
+    """回傳計算快取的命中／未命中統計。"""
+    return jsonify(chart_cache.cache_stats())
 
 @app.route('/')
 def index():
@@ -492,105 +237,272 @@ def index():
 # ... (這裡的所有 API 路由，從 /calculate_single_chart 到 /calculate_composite_chart，都保持不變) ...
 # ... 我將省略貼上這部分相同的程式碼，請直接從您的 app13.py 複製過來 ...
 @app.route('/calculate_single_chart', methods=['POST'])
+@cacheable_response
 def calculate_single_chart_api():
     data = request.get_json(force=True)
     try:
-        raw_chart_data = calculate_astrology_chart(
-            int(data['year']), int(data['month']), int(data['day']),
-            int(data['hour']), int(data['minute']),
-            float(data['latitude']), float(data['longitude']),
-            data['timezone'], data.get('optional_planets', []))
-        if "error" in raw_chart_data:
-            app.logger.error(f"單盤計算錯誤: {raw_chart_data['error']}")
-            return jsonify(raw_chart_data), 400
-        formatted_output = format_chart_data_for_display(raw_chart_data)
+        fields = fields_from_payload(data)
+    except ValueError as e:
+        return invalid_fields_response(e)
+    try:
+        debug_timing = debug_timing_requested(data)
+        with chart_metrics.trace() if debug_timing else nullcontext({}) as timings:
+            raw_chart_data = calculate_astrology_chart(
+                int(data['year']), int(data['month']), int(data['day']),
+                int(data['hour']), int(data['minute']),
+                float(data['latitude']), float(data['longitude']),
+                data['timezone'], data.get('optional_planets', []),
+                fields=fields, **chart_kwargs_from_payload(data))
+            if "error" in raw_chart_data:
+                app.logger.error(f"單盤計算錯誤: {raw_chart_data['error']}")
+                return jsonify(raw_chart_data), 400
+            formatted_output = format_chart_data_for_display(fields.apply(raw_chart_data), fields)
         formatted_output['chart_type'] = 'single'
-        return jsonify(formatted_output)
+        if debug_timing:
+            formatted_output.setdefault('debug_info', {})['timings_ms'] = rounded_timings(timings)
+        return timed_jsonify(formatted_output)
     except Exception as e:
         app.logger.error(f"後端發生未知錯誤: {e}", exc_info=True)
         return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
 
+# ==============================================================================
+# 增量重算的命盤工作階段（見 chart_session）
+# ==============================================================================
+def _session_julian_day(inputs: dict) -> float:
+    _, utc_dt = timezones.resolve(datetime.datetime(int(inputs['year']), int(inputs['month']), int(inputs['day']),
+                                                    int(inputs['hour']), int(inputs['minute']), 0), inputs['timezone'])
+    return julian_days(utc_dt)[0]
+
+def _session_positions(inputs: dict, jd_ut: float, names=None):
+    """精確計算工作階段需要的星體位置；names 未提供時為選星推出的全部天體。"""
+    if names is None:
+        names = [p for p in required_points(set(inputs.get('optional_planets', []))) if p in PLANET_IDS]
+    with chart_metrics.stage("calc_ut"):
+        return compute_positions(jd_ut, names, inputs.get('precision') or "full")
+
+def _session_chart(inputs: dict, positions):
+    """以工作階段的輸入與星體位置計算顯示用命盤，格式同 /calculate_single_chart。"""
+    fields = fields_from_payload(inputs)
+    raw_chart_data = calculate_astrology_chart(
+        *chart_args_from_payload(inputs, '', inputs.get('optional_planets', [])),
+        fields=fields, positions=positions, **chart_kwargs_from_payload(inputs))
+    if "error" in raw_chart_data:
+        return raw_chart_data
+    formatted_output = format_chart_data_for_display(fields.apply(raw_chart_data), fields)
+    formatted_output['chart_type'] = 'single'
+    return formatted_output
+
+def _session_error_response(e: Exception):
+    # UnknownTimeZoneError 是 KeyError 的子類別，必須先判斷
+    if isinstance(e, pytz.UnknownTimeZoneError):
+        return jsonify({"error": f"無效的時區名稱: {e}", "error_type": "invalid_timezone"}), 400
+    if isinstance(e, KeyError):
+        return jsonify({"error": f"請求的 JSON 中缺少必要欄位: {e}"}), 400
+    return jsonify({"error": f"欄位格式錯誤: {e}"}), 400
+
+@app.route('/api/chart_session', methods=['POST'])
+def create_chart_session_api():
+    """
+    建立增量重算的工作階段：payload 與 /calculate_single_chart 相同，
+    回傳 {"session_id", "recomputed": "full", "chart": <同 /calculate_single_chart 的輸出>}。
+    之後以 POST /api/chart_session/<session_id> 送出變動的欄位即可。
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+    inputs = chart_session.session_inputs(data)
+    try:
+        fields_from_payload(inputs)
+    except ValueError as e:
+        return invalid_fields_response(e)
+    try:
+        jd_ut = _session_julian_day(inputs)
+        positions = _session_positions(inputs, jd_ut)
+        chart = _session_chart(inputs, positions)
+    except (KeyError, TypeError, ValueError, pytz.UnknownTimeZoneError) as e:
+        return _session_error_response(e)
+    if "error" in chart:
+        return jsonify(chart), 400
+    session_id = chart_session.create(chart_session.ChartSession(inputs, jd_ut, positions, chart))
+    return timed_jsonify({"session_id": session_id, "recomputed": "full", "chart": chart})
+
+@app.route('/api/chart_session/<session_id>', methods=['POST'])
+def update_chart_session_api(session_id):
+    """
+    更新工作階段：只需送出變動的欄位，其餘沿用上一次的輸入。
+    只改經緯度時沿用星體位置、只重算宮位；時間變動一小時內由錨點外推星體位置；其餘變動全部重算。
+    回傳 {"session_id", "recomputed": "none" | "location" | "time" | "full", "diff": {...}}，
+    diff 見 chart_session.chart_diff；include_chart 為 true 時另附完整的 chart。
+    """
+    session = chart_session.get(session_id)
+    if session is None:
+        return jsonify({"error": "找不到工作階段，可能已過期，請重新建立", "error_type": "session_not_found"}), 404
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+    include_chart = bool(data.get('include_chart', False))
+
+    with session.lock:
+        inputs = {**session.inputs, **chart_session.session_inputs(data)}
+        try:
+            fields_from_payload(inputs)
+        except ValueError as e:
+            return invalid_fields_response(e)
+        try:
+            jd_ut = _session_julian_day(inputs)
+            recomputed = session.classify(inputs, jd_ut)
+            if recomputed == "none":
+                positions, chart = session.positions, session.chart
+            else:
+                if recomputed == "location":
+                    positions = session.positions
+                elif recomputed == "time":
+                    positions, stationary = session.extrapolate(jd_ut)
+                    stationary = [name for name in stationary if name in PLANET_IDS]
+                    if stationary:
+                        exact_lons, exact_speeds = _session_positions(inputs, jd_ut, stationary)
+                        positions[0].update(exact_lons)
+                        positions[1].update(exact_speeds)
+                else:
+                    positions = _session_positions(inputs, jd_ut)
+                chart = _session_chart(inputs, positions)
+        except (KeyError, TypeError, ValueError, pytz.UnknownTimeZoneError) as e:
+            return _session_error_response(e)
+        if "error" in chart:
+            return jsonify(chart), 400
+        diff = chart_session.chart_diff(session.chart, chart)
+        session.update(inputs, jd_ut, positions, chart, anchor=(recomputed == "full"))
+
+    response = {"session_id": session_id, "recomputed": recomputed, "diff": diff}
+    if include_chart:
+        response["chart"] = chart
+    return timed_jsonify(response)
+
+@app.route('/api/chart_session/<session_id>', methods=['DELETE'])
+def delete_chart_session_api(session_id):
+    if not chart_session.delete(session_id):
+        return jsonify({"error": "找不到工作階段", "error_type": "session_not_found"}), 404
+    return jsonify({"session_id": session_id, "deleted": True})
+
 @app.route('/calculate_comparison_chart', methods=['POST'])
+@cacheable_response
 def calculate_comparison_chart_api():
     data = request.get_json(force=True)
+    try:
+        fields = fields_from_payload(data, PAIR_SECTIONS)
+    except ValueError as e:
+        return invalid_fields_response(e)
     try:
         optional_planets = data.get('optional_planets', [])
-        c1_raw = calculate_astrology_chart(
-            int(data['chart1_year']), int(data['chart1_month']), int(data['chart1_day']),
-            int(data['chart1_hour']), int(data['chart1_minute']),
-            float(data['chart1_latitude']), float(data['chart1_longitude']),
-            data['chart1_timezone'], optional_planets)
+        chart_kwargs = {**chart_kwargs_from_payload(data), "fields": pair_compute_fields(fields)}
+        # 兩張命盤彼此獨立，交給計算後端（可能平行）一起計算
+        c1_raw, c2_raw = compute_backend.run_all([
+            (calculate_astrology_chart, chart_args_from_payload(data, 'chart1_', optional_planets), chart_kwargs),
+            (calculate_astrology_chart, chart_args_from_payload(data, 'chart2_', optional_planets), chart_kwargs),
+        ])
         if "error" in c1_raw:
             c1_raw["error_source"] = "chart1"
             app.logger.error(f"比較盤計算錯誤 (命盤A): {c1_raw.get('error', 'N/A')}")
             return jsonify(c1_raw), 400
-        
-        c2_raw = calculate_astrology_chart(
-            int(data['chart2_year']), int(data['chart2_month']), int(data['chart2_day']),
-            int(data['chart2_hour']), int(data['chart2_minute']),
-            float(data['chart2_latitude']), float(data['chart2_longitude']),
-            data['chart2_timezone'], optional_planets)
         if "error" in c2_raw:
             c2_raw["error_source"] = "chart2"
             app.logger.error(f"比較盤計算錯誤 (命盤B): {c2_raw.get('error', 'N/A')}")
             return jsonify(c2_raw), 400
-        response_data = {
-            "chart_type": "comparison",
-            "chart1_data": format_chart_data_for_display(c1_raw),
-            "chart2_data": format_chart_data_for_display(c2_raw),
-            "inter_aspects": list_interchart_aspects(c1_raw['planet_positions'], c2_raw['planet_positions']),
-            "chart1_planets_in_chart2_houses": get_planet_overlays_in_houses(c1_raw['planet_positions'], c2_raw['house_cusps']),
-            "chart2_planets_in_chart1_houses": get_planet_overlays_in_houses(c2_raw['planet_positions'], c1_raw['house_cusps']),
-        }
-        return jsonify(response_data)
+        response_data = {"chart_type": "comparison"}
+        if fields.chart:
+            response_data["chart1_data"] = format_chart_data_for_display(fields.apply(c1_raw), fields)
+            response_data["chart2_data"] = format_chart_data_for_display(fields.apply(c2_raw), fields)
+        if fields.wants("inter_aspects"):
+            response_data["inter_aspects"] = fields.filter_aspects(list_interchart_aspects(c1_raw['planet_positions'], c2_raw['planet_positions']))
+        if fields.wants("overlays"):
+            response_data["chart1_planets_in_chart2_houses"] = get_planet_overlays_in_houses(c1_raw['planet_positions'], c2_raw['house_cusps'])
+            response_data["chart2_planets_in_chart1_houses"] = get_planet_overlays_in_houses(c2_raw['planet_positions'], c1_raw['house_cusps'])
+        return timed_jsonify(response_data)
     except Exception as e:
         app.logger.error(f"後端發生未知錯誤: {e}", exc_info=True)
         return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
     
 @app.route('/calculate_transit_chart', methods=['POST'])
+@cacheable_response
 def calculate_transit_chart_api():
     data = request.get_json(force=True)
+    try:
+        fields = fields_from_payload(data, PAIR_SECTIONS)
+    except ValueError as e:
+        return invalid_fields_response(e)
     try:
         optional_planets = data.get('optional_planets', [])
-        natal_raw = calculate_astrology_chart(
-            int(data['natal_year']), int(data['natal_month']), int(data['natal_day']),
-            int(data['natal_hour']), int(data['natal_minute']),
-            float(data['natal_latitude']), float(data['natal_longitude']),
-            data['natal_timezone'], optional_planets)
+        chart_kwargs = {**chart_kwargs_from_payload(data), "fields": pair_compute_fields(fields)}
+        natal_raw, transit_raw = compute_backend.run_all([
+            (calculate_astrology_chart, chart_args_from_payload(data, 'natal_', optional_planets), chart_kwargs),
+            (calculate_astrology_chart, chart_args_from_payload(data, 'transit_', optional_planets), chart_kwargs),
+        ])
         if "error" in natal_raw:
             natal_raw["error_source"] = "chart1"
             app.logger.error(f"行運盤計算錯誤 (本命盤): {natal_raw.get('error', 'N/A')}")
             return jsonify(natal_raw), 400
-        
-        transit_raw = calculate_astrology_chart(
-            int(data['transit_year']), int(data['transit_month']), int(data['transit_day']),
-            int(data['transit_hour']), int(data['transit_minute']),
-            float(data['transit_latitude']), float(data['transit_longitude']),
-            data['transit_timezone'], optional_planets)
         if "error" in transit_raw:
             transit_raw["error_source"] = "chart2"
             app.logger.error(f"行運盤計算錯誤 (行運盤): {transit_raw.get('error', 'N/A')}")
             return jsonify(transit_raw), 400
-        response_data = {
-            "chart_type": "transit",
-            "natal_chart_data": format_chart_data_for_display(natal_raw),
-            "transit_chart_data": format_chart_data_for_display(transit_raw),
-            "inter_aspects": list_interchart_aspects(natal_raw['planet_positions'], transit_raw['planet_positions']),
-            "natal_planets_in_transit_houses": get_planet_overlays_in_houses(natal_raw['planet_positions'], transit_raw['house_cusps']),
-            "transit_planets_in_natal_houses": get_planet_overlays_in_houses(transit_raw['planet_positions'], natal_raw['house_cusps']),
-        }
-        return jsonify(response_data)
+        response_data = {"chart_type": "transit"}
+        if fields.chart:
+            response_data["natal_chart_data"] = format_chart_data_for_display(fields.apply(natal_raw), fields)
+            response_data["transit_chart_data"] = format_chart_data_for_display(fields.apply(transit_raw), fields)
+        if fields.wants("inter_aspects"):
+            response_data["inter_aspects"] = fields.filter_aspects(list_interchart_aspects(natal_raw['planet_positions'], transit_raw['planet_positions']))
+        if fields.wants("overlays"):
+            response_data["natal_planets_in_transit_houses"] = get_planet_overlays_in_houses(natal_raw['planet_positions'], transit_raw['house_cusps'])
+            response_data["transit_planets_in_natal_houses"] = get_planet_overlays_in_houses(transit_raw['planet_positions'], natal_raw['house_cusps'])
+        return timed_jsonify(response_data)
     except Exception as e:
         app.logger.error(f"後端發生未知錯誤: {e}", exc_info=True)
         return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
 
+def relationship_base_charts(data: dict, optional_planets, fields):
+    """
+    組合盤的兩張本命盤，回傳 (命盤A, 命盤B, 錯誤回應或 None)。
+    fields 選取 natal_charts 時（未提供 fields 時也是）本命盤要輸出，照常計算；
+    否則只取星體位置與宮頭，成本只剩兩次（可能已快取的）星曆與宮位查詢。
+    """
+    if fields.wants("natal_charts"):
+        chart_kwargs = {**chart_kwargs_from_payload(data),
+                        "fields": fields.widened(chart=RELATIONSHIP_BASE_FIELDS.chart)}
+    else:
+        chart_kwargs = {**chart_kwargs_from_payload(data), "display_fields": False, "fields": RELATIONSHIP_BASE_FIELDS}
+    c1_raw, c2_raw = compute_backend.run_all([
+        (calculate_astrology_chart, chart_args_from_payload(data, 'chart1_', optional_planets), chart_kwargs),
+        (calculate_astrology_chart, chart_args_from_payload(data, 'chart2_', optional_planets), chart_kwargs),
+    ])
+    for raw, source in ((c1_raw, "chart1"), (c2_raw, "chart2")):
+        if "error" in raw:
+            raw["error_source"] = source
+            return c1_raw, c2_raw, (jsonify(raw), 400)
+    return c1_raw, c2_raw, None
+
+def natal_charts_payload(c1_raw: dict, c2_raw: dict, fields):
+    if not fields.wants("natal_charts"):
+        return {}
+    return {
+        "natal_chart1_data": format_chart_data_for_display(fields.apply(c1_raw), fields),
+        "natal_chart2_data": format_chart_data_for_display(fields.apply(c2_raw), fields),
+    }
+
 @app.route('/calculate_composite_chart', methods=['POST'])
+@cacheable_response
 def calculate_composite_chart_api():
+    """
+    組合盤：兩張本命盤各點與宮頭的中點（見 relationship_charts）。
+    fields 可加上 natal_charts 區段；提供 fields 而未選 natal_charts 時不輸出兩張本命盤，也不計算它們的相位與顯示欄位。
+    """
     data = request.get_json(force=True)
     if not data:
         return jsonify({"error": "請求中未提供 JSON 數據"}), 400
     try:
-        # 【核心修正 1】: 建立一個內部專用的計算列表
+        fields = fields_from_payload(data, RELATIONSHIP_SECTIONS)
+    except ValueError as e:
+        return invalid_fields_response(e)
+    try:
         # 取得使用者真正想看的星體
         user_requested_planets = data.get('optional_planets', [])
         
@@ -604,45 +516,22 @@ def calculate_composite_chart_api():
         app.logger.info(f"組合盤計算 - 使用者請求: {user_requested_planets}")
         app.logger.info(f"組合盤計算 - 內部基礎盤計算使用: {list(planets_for_base_charts)}")
 
-        # 【核心修正 2】: 使用新的列表來計算兩個基礎盤
-        # 確保 c1_raw 和 c2_raw 中一定會包含 '上升' 和 '天頂' 的資料
-        c1_raw = calculate_astrology_chart(
-            int(data['chart1_year']), int(data['chart1_month']), int(data['chart1_day']),
-            int(data['chart1_hour']), int(data['chart1_minute']),
-            float(data['chart1_latitude']), float(data['chart1_longitude']),
-            data['chart1_timezone'], list(planets_for_base_charts)) # <-- 使用修正後的列表
-        if "error" in c1_raw:
-            c1_raw["error_source"] = "chart1"
-            return jsonify(c1_raw), 400
+        # c1_raw 和 c2_raw 中一定會包含 '上升' 和 '天頂' 的資料
+        c1_raw, c2_raw, error_response = relationship_base_charts(data, list(planets_for_base_charts), fields)
+        if error_response is not None:
+            return error_response
 
-        c2_raw = calculate_astrology_chart(
-            int(data['chart2_year']), int(data['chart2_month']), int(data['chart2_day']),
-            int(data['chart2_hour']), int(data['chart2_minute']),
-            float(data['chart2_latitude']), float(data['chart2_longitude']),
-            data['chart2_timezone'], list(planets_for_base_charts)) # <-- 使用修正後的列表
-        if "error" in c2_raw:
-            c2_raw["error_source"] = "chart2"
-            return jsonify(c2_raw), 400
-        
-        # --- 後續的中點計算邏輯 (大部分不變) ---
-        
-        composite_positions_raw = {}
-        # 【核心修正 3】: 這裡遍歷使用者原始請求的列表，確保最終結果符合使用者預期
-        for name in user_requested_planets:
-            # 確保星體存在於兩個基礎盤中，並且是 PLANET_IDS 定義的一部分
-            if name in c1_raw['planet_positions'] and name in c2_raw['planet_positions'] and name in PLANET_IDS:
-                lon1 = c1_raw['planet_positions'][name]['lon']
-                lon2 = c2_raw['planet_positions'][name]['lon']
-                composite_positions_raw[name] = {'lon': get_midpoint(lon1, lon2), 'speed': 0}
-        
-        # 中點盤的四軸計算現在是安全的，因為 c1_raw 和 c2_raw 中必有 '上升' 和 '天頂'
-        mc1 = c1_raw['planet_positions']['天頂']['lon']
-        mc2 = c2_raw['planet_positions']['天頂']['lon']
-        composite_mc_deg = get_midpoint(mc1, mc2)
+        # 所有星體、上升、天頂與 12 個宮頭一次取中點
+        midpoint_names = [name for name in user_requested_planets if name in PLANET_IDS] + ["上升", "天頂"]
+        midpoints, composite_cusps_dict = relationship_charts.composite_positions(
+            {name: info['lon'] for name, info in c1_raw['planet_positions'].items()},
+            {name: info['lon'] for name, info in c2_raw['planet_positions'].items()},
+            c1_raw['house_cusps'], c2_raw['house_cusps'], midpoint_names)
+        composite_asc_deg, composite_mc_deg = midpoints["上升"], midpoints["天頂"]
 
-        asc1 = c1_raw['planet_positions']['上升']['lon']
-        asc2 = c2_raw['planet_positions']['上升']['lon']
-        composite_asc_deg = get_midpoint(asc1, asc2)
+        # 這裡遍歷使用者原始請求的列表，確保最終結果符合使用者預期
+        composite_positions_raw = {name: {'lon': midpoints[name], 'speed': 0}
+                                   for name in user_requested_planets if name in PLANET_IDS and name in midpoints}
 
         # 將組合盤的四軸加入（如果使用者有勾選它們）
         if '上升' in user_requested_planets:
@@ -653,41 +542,94 @@ def calculate_composite_chart_api():
             composite_positions_raw['天頂'] = {'lon': composite_mc_deg, 'speed': 0}
         if '天底' in user_requested_planets:
             composite_positions_raw['天底'] = {'lon': (composite_mc_deg + 180) % 360, 'speed': 0}
-        
-        # ... (後續的宿命、福點、宮位等計算邏輯不變) ...
-        # ... (此處省略，保持您原始程式碼的邏輯即可) ...
 
         # 組合盤的最終格式化與回傳
-        composite_cusps_dict = {i: get_midpoint(c1_raw['house_cusps'][i], c2_raw['house_cusps'][i]) for i in range(1, 13)}
-        
         final_composite_positions = {}
-        for name, info in composite_positions_raw.items():
-            house_num, hdeg = find_house(info['lon'], composite_cusps_dict)
-            final_composite_positions[name] = { 'lon': info['lon'], 'speed': 0, 'house': house_num, 'hdeg': hdeg, 'is_retrograde': False, 'retrograde_label': "", 'zodiac_position_formatted': zodiac_format(info['lon']) }
+        composite_names = list(composite_positions_raw)
+        composite_lons = [composite_positions_raw[name]['lon'] for name in composite_names]
+        composite_houses, composite_hdegs = HouseSystem(composite_cusps_dict).locate_many(composite_lons)
+        for name, lon, house_num, hdeg, formatted in zip(composite_names, composite_lons, composite_houses, composite_hdegs, zodiac_format_many(composite_lons)):
+            final_composite_positions[name] = { 'lon': lon, 'speed': 0, 'house': house_num, 'hdeg': hdeg, 'is_retrograde': False, 'retrograde_label': "", 'zodiac_position_formatted': formatted }
 
         composite_raw = {
             "local_time": "Composite Chart", "utc_time": "N/A",
             "latitude": (c1_raw['latitude'] + c2_raw['latitude']) / 2, 
             "longitude": get_midpoint(c1_raw['longitude'], c2_raw['longitude']),
+            "house_system": c1_raw['house_system'],
             "house_cusps": composite_cusps_dict,
             "planet_positions": final_composite_positions,
-            "aspects": list_aspects(final_composite_positions)
+            "aspects": list_aspects(final_composite_positions) if fields.wants("aspects") else None
         }
 
-        return jsonify({
+        return timed_jsonify({
             "chart_type": "composite",
-            "composite_chart_data": format_chart_data_for_display(composite_raw),
-            "natal_chart1_data": format_chart_data_for_display(c1_raw),
-            "natal_chart2_data": format_chart_data_for_display(c2_raw),
+            "composite_chart_data": format_chart_data_for_display(fields.apply(composite_raw), fields),
+            **natal_charts_payload(c1_raw, c2_raw, fields),
         })
     except Exception as e:
         app.logger.error(f"組合盤後端發生未知錯誤: {e}", exc_info=True)
         return jsonify({"error": f"組合盤伺服器內部錯誤: {e}"}), 500   
+
+@app.route('/calculate_davison_chart', methods=['POST'])
+@cacheable_response
+def calculate_davison_chart_api():
+    """
+    時空中點盤 (Davison)：在兩人出生 UTC 時刻的中點（精確到秒）與出生地的中點起一張命盤，
+    時間以 UTC 表示。欄位與組合盤相同；fields 可加上 natal_charts 區段（未提供 fields 時會輸出兩張本命盤）。
+    """
+    data = request.get_json(force=True)
+    if not data:
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+    try:
+        fields = fields_from_payload(data, RELATIONSHIP_SECTIONS)
+    except ValueError as e:
+        return invalid_fields_response(e)
+    try:
+        optional_planets = data.get('optional_planets', [])
+        args1 = chart_args_from_payload(data, 'chart1_', optional_planets)
+        args2 = chart_args_from_payload(data, 'chart2_', optional_planets)
+        utc_mid = relationship_charts.midpoint_moment(timezones.to_utc(datetime.datetime(*args1[:5]), args1[7]),
+                                                      timezones.to_utc(datetime.datetime(*args2[:5]), args2[7]))
+        latitude, longitude = relationship_charts.midpoint_location(args1[5], args1[6], args2[5], args2[6])
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"無效的時區名稱: {e}", "error_type": "invalid_timezone"}), 400
+    except KeyError as e:
+        return jsonify({"error": f"請求的 JSON 中缺少必要欄位: {e}", "error_type": "missing_field"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"欄位格式錯誤: {e}", "error_type": "invalid_field"}), 400
+    try:
+        chart_kwargs = chart_kwargs_from_payload(data)
+        davison_call = (calculate_astrology_chart,
+                        (utc_mid.year, utc_mid.month, utc_mid.day, utc_mid.hour, utc_mid.minute,
+                         latitude, longitude, "UTC", optional_planets),
+                        {**chart_kwargs, "second": utc_mid.second, "fields": fields})
+        if fields.wants("natal_charts"):
+            # 本命盤與時空中點盤彼此獨立，交給計算後端一起計算
+            natal_kwargs = {**chart_kwargs, "fields": fields}
+            davison_raw, c1_raw, c2_raw = compute_backend.run_all([
+                davison_call, (calculate_astrology_chart, args1, natal_kwargs), (calculate_astrology_chart, args2, natal_kwargs)])
+        else:
+            davison_raw, = compute_backend.run_all([davison_call])
+            c1_raw = c2_raw = None
+        for raw, source in ((davison_raw, "davison"), (c1_raw, "chart1"), (c2_raw, "chart2")):
+            if raw is not None and "error" in raw:
+                raw["error_source"] = source
+                return jsonify(raw), 400
+        return timed_jsonify({
+            "chart_type": "davison",
+            "davison_chart_data": format_chart_data_for_display(fields.apply(davison_raw), fields),
+            **(natal_charts_payload(c1_raw, c2_raw, fields) if c1_raw is not None else {}),
+        })
+    except Exception as e:
+        app.logger.error(f"時空中點盤後端發生未知錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"時空中點盤伺服器內部錯誤: {e}"}), 500
+
 # ==============================================================================
 # --- NEW: API Endpoint for AI/Gemini Integration ---
 # ==============================================================================
 @app.route('/api/v1/chart/single', methods=['POST'])
 @api_key_required # 使用我們上面定義的裝飾器來保護這個端點
+@cacheable_response
 def calculate_single_chart_for_ai():
     """
     這個端點專為 AI 整合設計。
@@ -697,21 +639,37 @@ def calculate_single_chart_for_ai():
     if not data:
         return jsonify({"error": "請求中未提供 JSON 數據"}), 400
         
+    try:
+        response_format = chart_formats.negotiate(request)
+    except chart_formats.UnsupportedFormat as e:
+        return jsonify({"error": str(e), "error_type": "unsupported_format"}), 406
+    try:
+        fields = fields_from_payload(data)
+    except ValueError as e:
+        return invalid_fields_response(e)
+
     try:
         # 直接呼叫核心計算函式
-        raw_chart_data = calculate_astrology_chart(
-            int(data['year']), int(data['month']), int(data['day']),
-            int(data['hour']), int(data['minute']),
-            float(data['latitude']), float(data['longitude']),
-            data['timezone'], data.get('optional_planets', []))
+        debug_timing = debug_timing_requested(data)
+        with chart_metrics.trace() if debug_timing else nullcontext({}) as timings:
+            raw_chart_data = calculate_astrology_chart(
+                int(data['year']), int(data['month']), int(data['day']),
+                int(data['hour']), int(data['minute']),
+                float(data['latitude']), float(data['longitude']),
+                data['timezone'], data.get('optional_planets', []),
+                with_perfection_times=bool(data.get('aspect_timing', False)),
+                fields=fields, **chart_kwargs_from_payload(data))
 
         # 檢查計算過程中是否有錯誤，如果有的話直接回傳
         if "error" in raw_chart_data:
             app.logger.error(f"AI API - 單盤計算錯誤: {raw_chart_data['error']}")
             return jsonify(raw_chart_data), 400
 
-        # 成功：直接回傳原始的、未經格式化的 JSON 數據
-        return jsonify(raw_chart_data)
+        raw_chart_data = fields.apply(raw_chart_data)
+        if debug_timing:
+            raw_chart_data.setdefault('debug_info', {})['timings_ms'] = rounded_timings(timings)
+        # 成功：回傳原始的、未經格式化的數據（預設 JSON，可協商為 normalized / MessagePack）
+        return formatted_chart_response(raw_chart_data, response_format)
 
     except KeyError as e:
         app.logger.error(f"AI API - 請求中缺少必要欄位: {e}", exc_info=True)
@@ -720,6 +678,332 @@ def calculate_single_chart_for_ai():
         app.logger.error(f"AI API - 後端發生未知錯誤: {e}", exc_info=True)
         return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
 
+@app.route('/api/v1/chart/batch', methods=['POST'])
+@api_key_required
+@cacheable_response
+def calculate_batch_charts_for_ai():
+    """
+    批次版本的 AI 端點。請求格式為 {"charts": [<與 /api/v1/chart/single 相同的 payload>, ...]}，
+    回傳 {"count": N, "results": [...]}，每一筆結果帶有 index 與 ok 欄位，
+    單筆失敗時只在該筆回報 error，其餘命盤照常回傳。
+    請求層級的 fields（見 chart_fields）與 precision 套用到每一筆，單筆的 payload 也可以自行指定。
+    """
+    data = request.get_json(force=True, silent=True)
+    entries = data.get('charts') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "請求中必須提供非空的 charts 列表"}), 400
+    if len(entries) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"單次批次最多 {MAX_BATCH_SIZE} 筆命盤，收到 {len(entries)} 筆"}), 413
+    try:
+        response_format = chart_formats.negotiate(request, columnar=True)
+    except chart_formats.UnsupportedFormat as e:
+        return jsonify({"error": str(e), "error_type": "unsupported_format"}), 406
+    if isinstance(data, dict) and data.get('fields'):
+        # 請求層級的 fields 套用到沒有自行指定 fields 的每一筆
+        try:
+            fields_from_payload(data)
+        except ValueError as e:
+            return invalid_fields_response(e)
+        entries = [{'fields': data['fields'], **entry} if isinstance(entry, dict) else entry for entry in entries]
+    if isinstance(data, dict) and data.get('precision'):
+        entries = [{'precision': data['precision'], **entry} if isinstance(entry, dict) else entry for entry in entries]
+
+    if response_format == chart_formats.COLUMNAR_MIMETYPE:
+        # 欄式格式不輸出顯示用字串，計算時直接略過
+        entries = [{**entry, 'display_fields': False} if isinstance(entry, dict) else entry for entry in entries]
+
+    try:
+        results = calculate_astrology_chart_batch(entries)
+        failed = sum(1 for item in results if not item["ok"])
+        if failed:
+            app.logger.warning(f"AI API - 批次計算完成，{failed}/{len(results)} 筆失敗")
+        return formatted_chart_response({"count": len(results), "failed": failed, "results": results}, response_format, batch=True)
+    except Exception as e:
+        app.logger.error(f"AI API - 批次計算發生未知錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
+
+@app.route('/api/v1/chart/synastry_matrix', methods=['POST'])
+@api_key_required
+def synastry_matrix_api():
+    """
+    一對多／多對多合盤：{"subject": {...}} 或 {"subjects": [...]}，加上 {"candidates": [...]}。
+    每個人的欄位與 /api/v1/chart/single 相同，可另帶 id；optional_planets、house_system、precision 為全體共用。
+    每張命盤只計算一次（相同出生資料也只算一次），以 NDJSON 串流回傳：
+    type=chart_error（個別命盤失敗）、每個配對一行 type=pair、最後一行 type=summary。
+    summary_only 為 true 時，配對只回傳相容度摘要；include_overlays 為 false 時不回傳宮位落點。
+    fields 可選取配對的區段 (summary / inter_aspects / overlays) 與相位中星體資料的子欄位。
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+    subjects = data.get('subjects', [data['subject']] if 'subject' in data else None)
+    candidates = data.get('candidates')
+    if not isinstance(subjects, list) or not subjects or not isinstance(candidates, list) or not candidates:
+        return jsonify({"error": "請求中必須提供 subject（或 subjects 列表）與非空的 candidates 列表"}), 400
+    if len(subjects) + len(candidates) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"單次最多 {MAX_BATCH_SIZE} 筆命盤，收到 {len(subjects) + len(candidates)} 筆"}), 413
+    if len(subjects) * len(candidates) > MAX_SYNASTRY_PAIRS:
+        return jsonify({"error": f"單次最多 {MAX_SYNASTRY_PAIRS} 個配對，收到 {len(subjects) * len(candidates)} 個"}), 413
+
+    try:
+        fields = fields_from_payload(data, SYNASTRY_SECTIONS)
+    except ValueError as e:
+        return invalid_fields_response(e)
+
+    optional_planets = data.get('optional_planets', BASE_PLANETS)
+    summary_only = bool(data.get('summary_only', False))
+    include_overlays = bool(data.get('include_overlays', True))
+    # 各人的命盤只用於跨盤計算，不需要個別命盤的相位與時間字串
+    compute_fields = ["house_cusps"] + [f"planet_positions.{name}" for name in
+                                        sorted(pair_compute_fields(fields).planet | {"lon", "speed", "is_retrograde"})]
+    people = [("subject", i, person) for i, person in enumerate(subjects)] + \
+             [("candidate", i, person) for i, person in enumerate(candidates)]
+
+    try:
+        # 相同出生資料的人只計算一次
+        unique_entries, entry_index, person_entry = [], {}, []
+        for _, _, person in people:
+            entry = person
+            if isinstance(person, dict):
+                entry = {key: value for key, value in person.items() if key != 'id'}
+                entry.update(optional_planets=optional_planets, house_system=data.get('house_system'),
+                             precision=data.get('precision'), fields=compute_fields)
+            key = json.dumps(entry, sort_keys=True, ensure_ascii=False, default=str)
+            if key not in entry_index:
+                entry_index[key] = len(unique_entries)
+                unique_entries.append(entry)
+            person_entry.append(entry_index[key])
+        results = calculate_astrology_chart_batch(unique_entries)
+    except Exception as e:
+        app.logger.error(f"AI API - 合盤矩陣發生未知錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
+
+    resolved = {"subject": [], "candidate": []}
+    chart_errors = []
+    for (role, index, person), entry_pos in zip(people, person_entry):
+        ref = {"index": index}
+        if isinstance(person, dict) and 'id' in person:
+            ref["id"] = person['id']
+        result = results[entry_pos]
+        if result["ok"]:
+            resolved[role].append((ref, result["chart"]))
+        else:
+            error = {key: value for key, value in result.items() if key not in ("index", "ok")}
+            chart_errors.append({"type": "chart_error", "role": role, **ref, **error})
+
+    def generate():
+        for error in chart_errors:
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+        pair_count = 0
+        try:
+            for row in iter_synastry_pairs(resolved["subject"], resolved["candidate"], summary_only, include_overlays, fields):
+                pair_count += 1
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        except Exception as e:
+            app.logger.error(f"合盤矩陣計算錯誤: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "error": f"伺服器內部錯誤: {e}"}, ensure_ascii=False) + "\n"
+        yield json.dumps({
+            "type": "summary", "subjects": len(subjects), "candidates": len(candidates),
+            "charts_computed": len(unique_entries), "failed_charts": len(chart_errors), "pairs": pair_count,
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _timeline_transit_bodies(names):
+    """將行運星體名稱轉為 {名稱: (天體 ID, 位移角度)}，南交以北交 + 180° 表示。"""
+    return {name: ephemeris_body(name) for name in names if ephemeris_body(name) is not None}
+
+@app.route('/api/v1/chart/transit_timeline', methods=['POST'])
+@api_key_required
+def transit_timeline_api():
+    """
+    行運時間軸：計算一段期間內行運星體對本命盤的所有精確相位，以 NDJSON 串流回傳。
+    本命盤只計算一次；每一步只對行運星體呼叫 swe.calc_ut，偏差變號時以 Brent 法求出精確時刻。
+    請求欄位：natal_* 本命資料、start / end（ISO 格式當地時間）、step（hour 或 day）
+    或 step_hours、timezone（預設同本命時區）、transit_planets、aspects、include_samples，
+    以及 precision（fast 時行運位置以快速星曆表內插，見 fast_ephemeris）。
+    step 只決定 sample 的間隔；掃描步長另依行運天體的最大速度細分，較大的 step 不會漏掉精確相位。
+    每行一個 JSON：第一行 type=natal，接著依時間順序的 type=hit（及 type=sample），最後一行 type=summary。
+    fields 只影響第一行的本命盤內容。
+    """
+    data = request.get_json(force=True, silent=True)
+    if not data:
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+    try:
+        fields = fields_from_payload(data)
+    except ValueError as e:
+        return invalid_fields_response(e)
+
+    try:
+        natal_raw = calculate_astrology_chart(
+            int(data['natal_year']), int(data['natal_month']), int(data['natal_day']),
+            int(data['natal_hour']), int(data['natal_minute']),
+            float(data['natal_latitude']), float(data['natal_longitude']),
+            data['natal_timezone'], data.get('natal_optional_planets', data.get('optional_planets', [])),
+            fields=fields.widened(chart=("planet_positions",)), **chart_kwargs_from_payload(data))
+        if "error" in natal_raw:
+            natal_raw["error_source"] = "natal"
+            return jsonify(natal_raw), 400
+
+        timeline_tz = data.get('timezone', data['natal_timezone'])
+        start_utc = timezones.to_utc(datetime.datetime.fromisoformat(data['start']), timeline_tz)
+        end_utc = timezones.to_utc(datetime.datetime.fromisoformat(data['end']), timeline_tz)
+        jd_start, jd_end = julian_days(start_utc)[0], julian_days(end_utc)[0]
+        if jd_end <= jd_start:
+            return jsonify({"error": "end 必須晚於 start"}), 400
+        if jd_end - jd_start > MAX_TIMELINE_DAYS:
+            return jsonify({"error": f"時間範圍過長：單次最多 {MAX_TIMELINE_DAYS:g} 日"}), 400
+
+        if 'step_hours' in data:
+            step_days = float(data['step_hours']) / 24
+        else:
+            step_days = TIMELINE_STEPS.get(data.get('step', 'day'))
+        if not step_days or step_days <= 0:
+            return jsonify({"error": f"step 必須是 {list(TIMELINE_STEPS)} 之一，或提供正數的 step_hours"}), 400
+        if (jd_end - jd_start) / step_days > MAX_TIMELINE_STEPS:
+            return jsonify({"error": f"時間範圍過長：單次最多 {MAX_TIMELINE_STEPS} 步"}), 400
+
+        transit_bodies = _timeline_transit_bodies(data.get('transit_planets', BASE_PLANETS))
+        aspect_names = data.get('aspects', list(ASPECTS))
+        aspects = {name: ASPECTS[name] for name in aspect_names if name in ASPECTS}
+        if not transit_bodies or not aspects:
+            return jsonify({"error": "transit_planets 與 aspects 至少需包含一個有效項目"}), 400
+    except KeyError as e:
+        return jsonify({"error": f"請求的 JSON 中缺少必要欄位: {e}"}), 400
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"無效的時區名稱: {e}", "error_type": "invalid_timezone"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"欄位格式錯誤: {e}"}), 400
+
+    natal_points = {name: info['lon'] for name, info in natal_raw['planet_positions'].items()}
+    include_samples = bool(data.get('include_samples', False))
+
+    def generate():
+        yield json.dumps({"type": "natal", "chart": fields.apply(natal_raw)}, ensure_ascii=False) + "\n"
+        hit_count = 0
+        try:
+            for kind, item in aspect_timing.iter_transit_hits(
+                    transit_bodies, natal_points, aspects, jd_start, jd_end, step_days, include_samples,
+                    position_fn_for(data.get('precision'))):
+                if kind == "hit":
+                    hit_count += 1
+                yield json.dumps({"type": kind, **item}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            app.logger.error(f"行運時間軸計算錯誤: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "error": f"伺服器內部錯誤: {e}"}, ensure_ascii=False) + "\n"
+        yield json.dumps({"type": "summary", "hits": hit_count, "jd_start": jd_start, "jd_end": jd_end}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/v1/chart/rectify', methods=['POST'])
+@api_key_required
+@cacheable_response
+def rectify_birth_time_api():
+    """
+    出生時間校正：在時間窗內每 step_minutes 分鐘取一個候選出生時間，依人生事件的條件評分，回傳分數最高的候選。
+    請求欄位：year、month、day、latitude、longitude、timezone、start / end（ISO 格式當地時間，
+    預設為出生日整天）、step_minutes（預設 2）、house_system、top（預設 10）、
+    events（[{"date": ISO 格式當地時間, "label", "weight", "criteria"}, ...]，條件格式見 rectification）。
+    本命星體位置每小時精確計算一次，候選之間以外推重用；啟用行程池時候選會分段平行評分。
+    """
+    data = request.get_json(force=True, silent=True)
+    if not data:
+        return jsonify({"error": "請求中未提供 JSON 數據"}), 400
+
+    try:
+        year, month, day = int(data['year']), int(data['month']), int(data['day'])
+        latitude, longitude, tz = float(data['latitude']), float(data['longitude']), data['timezone']
+        house_system_name, hsys = house_systems.resolve_house_system(data.get('house_system'))
+        birth_date = datetime.datetime(year, month, day)
+        start = datetime.datetime.fromisoformat(data['start']) if 'start' in data else birth_date
+        end = (datetime.datetime.fromisoformat(data['end']) if 'end' in data
+               else birth_date + datetime.timedelta(days=1, minutes=-1))
+        step_minutes = float(data.get('step_minutes', 2))
+        top = int(data.get('top', 10))
+        if step_minutes <= 0:
+            return jsonify({"error": "step_minutes 必須大於 0", "error_type": "invalid_field"}), 400
+        if end < start:
+            return jsonify({"error": "end 不可早於 start", "error_type": "invalid_field"}), 400
+        if (end - start).total_seconds() / 60 / step_minutes + 1 > MAX_RECTIFICATION_CANDIDATES:
+            return jsonify({"error": f"候選時間過多：單次最多 {MAX_RECTIFICATION_CANDIDATES} 個，請縮小時間窗或加大 step_minutes",
+                            "error_type": "too_many_candidates"}), 400
+        if not 1 <= top <= MAX_RECTIFICATION_TOP:
+            return jsonify({"error": f"top 必須是 1 ~ {MAX_RECTIFICATION_TOP}", "error_type": "invalid_field"}), 400
+
+        raw_events = data['events']
+        if not isinstance(raw_events, list) or not raw_events:
+            return jsonify({"error": "events 必須是非空的列表", "error_type": "invalid_field"}), 400
+        if len(raw_events) > MAX_RECTIFICATION_EVENTS:
+            return jsonify({"error": f"事件過多：單次最多 {MAX_RECTIFICATION_EVENTS} 個", "error_type": "too_many_events"}), 400
+
+        bodies = set(PLANET_IDS) | {"南交"}
+        candidates = []
+        for local_time in rectification.candidate_times(start, end, step_minutes):
+            utc_time = timezones.to_utc(local_time, tz)
+            jd_ut, _, jd_tt = julian_days(utc_time)
+            candidates.append((local_time, utc_time, jd_ut, jd_tt))
+        jd_first, jd_last = candidates[0][2], candidates[-1][2]
+        jd_center = (jd_first + jd_last) / 2
+        natal_sun = positions_with_nodes(jd_center, ["太陽"])["太陽"][0]
+
+        events = []
+        for item in raw_events:
+            if not isinstance(item, dict):
+                raise TypeError("每個事件都必須是 JSON 物件")
+            criteria = rectification.parse_criteria(item.get('criteria'), bodies, ASPECTS)
+            event_utc = timezones.to_utc(datetime.datetime.fromisoformat(item['date']), item.get('timezone', tz))
+            jd_event = julian_days(event_utc)[0]
+            progressed_sun = positions_with_nodes(rectification.progressed_jd(jd_center, jd_event), ["太陽"])["太陽"][0]
+            events.append({
+                "label": item.get('label'), "date": item['date'], "weight": float(item.get('weight', 1.0)),
+                "criteria": criteria, "transits": positions_with_nodes(jd_event, rectification.transit_bodies(criteria)),
+                "solar_arc": (progressed_sun - natal_sun) % 360,
+            })
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"無效的時區名稱: {e}", "error_type": "invalid_timezone"}), 400
+    except KeyError as e:
+        return jsonify({"error": f"請求的 JSON 中缺少必要欄位: {e}", "error_type": "missing_field"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"欄位格式錯誤: {e}", "error_type": "invalid_field"}), 400
+
+    try:
+        # 本命星體位置：每小時一個錨點精確計算，候選由最近的錨點外推
+        natal_names = rectification.natal_bodies(events)
+        anchors = [
+            ({name: lon for name, (lon, _) in positions.items()}, {name: speed for name, (_, speed) in positions.items()})
+            for positions in (positions_with_nodes(jd, natal_names)
+                              for jd in rectification.anchor_times(jd_first, jd_last))
+        ]
+        work = [(jd_tt, rectification.positions_near_anchor(anchors, jd_first, jd_ut)) for _, _, jd_ut, jd_tt in candidates]
+        job = {"latitude": latitude, "longitude": longitude, "hsys": hsys, "events": events}
+        if compute_backend.is_parallel() and len(work) > 1:
+            parts = compute_backend.run_all([(rectify_chunk, (job, chunk)) for _, chunk in compute_backend.chunked(work)])
+            scored = [item for part in parts for item in part]
+        else:
+            scored = rectify_chunk(job, work)
+    except Exception as e:
+        app.logger.error(f"出生時間校正計算錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
+
+    best = sorted(range(len(scored)), key=lambda index: (-scored[index][0], index))[:top]
+    asc_formatted = zodiac_format_many([scored[index][2] for index in best])
+    mc_formatted = zodiac_format_many([scored[index][3] for index in best])
+    results = []
+    for index, asc_text, mc_text in zip(best, asc_formatted, mc_formatted):
+        score, matches, asc, mc = scored[index]
+        local_time, utc_time, jd_ut, _ = candidates[index]
+        results.append({
+            "local_time": local_time.isoformat(), "utc_time": utc_time.isoformat(), "julian_day_ut": jd_ut,
+            "score": round(score, 4), "ascendant": asc, "ascendant_formatted": asc_text,
+            "midheaven": mc, "midheaven_formatted": mc_text, "matches": matches,
+        })
+    return timed_jsonify({
+        "candidates": results, "scanned": len(candidates), "step_minutes": step_minutes,
+        "house_system": house_system_name, "timezone": tz,
+        "events": [{"label": event["label"], "date": event["date"], "weight": event["weight"],
+                    "criteria": len(event["criteria"])} for event in events],
+    })
+
 # --- FIX: 更新主執行區塊 ---
 # 這個區塊現在主要用於本地開發測試。
 # 在 Render 上，Gunicorn 會直接執行 'app' 物件，不會執行這個區塊的內容。
@@ -0,0 +1,134 @@
+# asgi.py
+# ASGI 服務模式：以非同步伺服器 (uvicorn) 承接連線，原本的 Flask 路由不需修改。
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port $PORT   （Procfile 的 asgi 行程）
+#   gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+#
+# 與 gunicorn 同步 worker 的差別：
+#   - 讀取請求內容、把回應送給（可能很慢的）客戶端都在事件迴圈上進行；
+#     每個 worker 能同時維持的連線數不再受限於 worker 數量。
+#   - WSGI 與 ASGI 之間的轉接交給 a2wsgi.WSGIMiddleware：Flask 應用程式（swisseph 計算、格式化、序列化）
+#     在它有上限的執行緒池中執行，串流回應 (NDJSON) 經由有長度上限的佇列送出。
+#   - 本檔只負責准入控制：處理中（計算、排隊或送出回應中）的請求超過上限時，直接回傳 429 (附 Retry-After)，
+#     不讓佇列無限制地增長；請求內容超過上限時回傳 413。
+#
+# 環境變數：
+#   ASTRO_ASGI_THREADS      計算執行緒數，預設為 CPU 核心數
+#   ASTRO_ASGI_MAX_QUEUE    在計算執行緒之外最多可排隊的請求數，預設為執行緒數的 4 倍
+#   ASTRO_ASGI_RETRY_AFTER  429 回應的 Retry-After 秒數，預設 1
+#   ASTRO_ASGI_MAX_BODY     請求內容的上限 (bytes)，預設 10 MB，超過回傳 413
+# 可與 ASTRO_COMPUTE_BACKEND=process 一起使用：批次與雙盤計算仍會再分給行程池。
+import json
+import logging
+import os
+
+from a2wsgi import WSGIMiddleware
+
+THREADS = int(os.getenv("ASTRO_ASGI_THREADS", "0")) or os.cpu_count() or 1
+MAX_QUEUE = int(os.getenv("ASTRO_ASGI_MAX_QUEUE", str(THREADS * 4)))
+RETRY_AFTER = int(os.getenv("ASTRO_ASGI_RETRY_AFTER", "1"))
+MAX_BODY = int(os.getenv("ASTRO_ASGI_MAX_BODY", str(10 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionControlledApp:
+    """
+    將 WSGI 應用程式包成 ASGI 應用程式（a2wsgi.WSGIMiddleware），並在前面加上准入控制。
+    「使用中」的請求 = 已交給 WSGIMiddleware、尚未完成的請求；超過 threads + max_queue 時回傳 429。
+    """
+
+    def __init__(self, wsgi_app, threads=THREADS, max_queue=MAX_QUEUE, retry_after=RETRY_AFTER, max_body=MAX_BODY):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.max_body = max_body
+        self.middleware = WSGIMiddleware(wsgi_app, workers=threads)
+        self.active = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self):
+        return self.threads + self.max_queue
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"不支援的 ASGI 連線類型: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                logger.info(f"ASGI 模式：計算執行緒 {self.threads} 個，最多排隊 {self.max_queue} 個請求")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.middleware.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        # 1. 在事件迴圈上讀完請求內容，慢速上傳不佔用計算執行緒，也能在計算前回傳 413
+        body, disconnected = await self._read_body(receive)
+        if disconnected:
+            return
+        if body is None:
+            await self._send_error(send, 413, f"請求內容超過上限 {self.max_body} bytes", "payload_too_large")
+            return
+
+        # 2. 准入控制
+        if self.active >= self.capacity:
+            self.rejected += 1
+            await self._send_error(send, 429, "伺服器忙碌中，請稍後再試", "overloaded",
+                                   [(b"retry-after", str(self.retry_after).encode())])
+            return
+
+        # 3. 已讀完的內容重新交給 WSGIMiddleware；之後的 receive（斷線通知）照常轉交
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        self.active += 1
+        try:
+            await self.middleware(scope, replay_receive, send)
+        finally:
+            self.active -= 1
+
+    async def _read_body(self, receive):
+        """回傳 (內容, 是否已斷線)；內容超過上限時為 None。"""
+        parts, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None, True
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return None, False
+            parts.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(parts), False
+
+    async def _send_error(self, send, status, message, error_type, extra_headers=()):
+        body = json.dumps({"error": message, "error_type": error_type}, ensure_ascii=False).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *extra_headers]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+def create_app(wsgi_app=None, **options):
+    if wsgi_app is None:
+        from app import app as wsgi_app
+    return AdmissionControlledApp(wsgi_app, **options)
+
+
+application = create_app()
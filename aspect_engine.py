@@ -0,0 +1,145 @@
+# aspect_engine.py
+# 以 NumPy 陣列一次計算所有星體配對的相位，取代逐對呼叫 aspect_between 的 Python 迴圈。
+# 輸出（包含排序、容許度數值與「入相／出相」標籤）與原本的 list_aspects 完全相同。
+import numpy as np
+
+APPLYING_LABEL = "入相"
+SEPARATING_LABEL = "出相"
+
+# 與 aspect_between 相同：以一小時後的位置判斷入相或出相
+LOOKAHEAD_DAYS = 1 / 24
+_EPSILON = 1e-9
+
+
+class AspectEngine:
+    """
+    相位計算引擎。
+
+    aspect_table 為 [(相位名稱, 角度, 容許度), ...]，順序即比對優先順序
+    （與 aspect_between 相同，取第一個落在容許度內的相位）。
+    moving_points 為會移動、需要判斷入相出相的點；fixed_points 為四軸與交點，
+    兩個 fixed_points 之間的相位不標示入相出相。excluded_pairs 為定義上必然對沖的配對。
+    """
+
+    def __init__(self, aspect_table, moving_points, fixed_points, excluded_pairs=()):
+        self.aspect_names = [name for name, _, _ in aspect_table]
+        self.aspect_angles = np.array([angle for _, angle, _ in aspect_table], dtype=float)
+        self.aspect_orbs = np.array([orb for _, _, orb in aspect_table], dtype=float)
+        self.sort_rank = {name: angle for name, angle, _ in aspect_table}
+        self.moving_points = frozenset(moving_points)
+        self.fixed_points = frozenset(fixed_points)
+        self.excluded_pairs = frozenset(frozenset(pair) for pair in excluded_pairs)
+
+    def _match(self, lon_a, lon_b, speed_a, speed_b, moving, two_fixed):
+        """
+        對一組配對陣列計算相位。回傳 (是否成相, 相位索引, 容許度, 入出相代碼)，
+        入出相代碼 0 表示不標示、1 為入相、2 為出相。
+        """
+        diff = np.abs(lon_a - lon_b)
+        diff = np.minimum(diff, 360 - diff)
+        deviation_all = np.abs(diff[:, None] - self.aspect_angles)
+        within = deviation_all <= self.aspect_orbs
+        matched = within.any(axis=1)
+        aspect_idx = within.argmax(axis=1)
+        rows = np.arange(len(diff))
+        deviation = deviation_all[rows, aspect_idx]
+        target = self.aspect_angles[aspect_idx]
+
+        lon_a_next = np.remainder(lon_a + speed_a * LOOKAHEAD_DAYS, 360)
+        lon_b_next = np.remainder(lon_b + speed_b * LOOKAHEAD_DAYS, 360)
+        diff_next = np.abs(lon_a_next - lon_b_next)
+        diff_next = np.minimum(diff_next, 360 - diff_next)
+        next_deviation = np.abs(diff_next - target)
+
+        type_code = np.where(next_deviation > deviation + _EPSILON, 2, 1)
+        type_code = np.where(moving & ~two_fixed, type_code, 0)
+        return matched, aspect_idx, deviation, type_code
+
+    def _point_arrays(self, names, infos):
+        """每個點只取值一次，轉成經度、速度、是否移動、是否為固定點四個陣列。"""
+        valid = [bool(info) and 'lon' in info for info in infos]
+        lons = np.array([info['lon'] if ok else 0.0 for info, ok in zip(infos, valid)], dtype=float)
+        speeds = np.array([info.get('speed', 0.0) if ok else 0.0 for info, ok in zip(infos, valid)], dtype=float)
+        moving = np.array([name in self.moving_points for name in names], dtype=bool)
+        fixed = np.array([name in self.fixed_points for name in names], dtype=bool)
+        return np.array(valid, dtype=bool), lons, speeds, moving, fixed
+
+    def _collect(self, names_a, names_b, infos_a, infos_b, arrays_a, arrays_b, idx_a, idx_b, groups=None):
+        """
+        將配對索引送入 _match，並組成與 list_aspects 相同格式的結果列表。
+        提供 groups（每個 B 點所屬的組別陣列與組數）時，依組別分成多個各自排序的列表。
+        """
+        if groups is not None:
+            owner, group_count = groups
+            buckets = [[] for _ in range(group_count)]
+            if len(idx_a) == 0:
+                return buckets
+        elif len(idx_a) == 0:
+            return []
+        _, lons_a, speeds_a, moving_a, fixed_a = arrays_a
+        _, lons_b, speeds_b, moving_b, fixed_b = arrays_b
+        matched, aspect_idx, deviation, type_code = self._match(
+            lons_a[idx_a], lons_b[idx_b], speeds_a[idx_a], speeds_b[idx_b],
+            moving_a[idx_a] | moving_b[idx_b], fixed_a[idx_a] & fixed_b[idx_b])
+        type_labels = ("", APPLYING_LABEL, SEPARATING_LABEL)
+
+        res = []
+        for k in np.flatnonzero(matched).tolist():
+            i, j = int(idx_a[k]), int(idx_b[k])
+            item = {
+                "p1_name": names_a[i], "p2_name": names_b[j],
+                "aspect_name": self.aspect_names[aspect_idx[k]],
+                "aspect_type": type_labels[type_code[k]], "orb": float(deviation[k]),
+                "p1_details": infos_a[i], "p2_details": infos_b[j]
+            }
+            if groups is None:
+                res.append(item)
+            else:
+                buckets[owner[j]].append(item)
+        sort_key = lambda item: (self.sort_rank.get(item["aspect_name"], 361), item["orb"])
+        if groups is None:
+            return sorted(res, key=sort_key)
+        return [sorted(bucket, key=sort_key) for bucket in buckets]
+
+    def list_aspects(self, detailed_points_info: dict):
+        """單一命盤內所有點兩兩之間的相位。"""
+        names = list(detailed_points_info.keys())
+        infos = [detailed_points_info.get(name) for name in names]
+        arrays = self._point_arrays(names, infos)
+        present = np.array([bool(info) for info in infos], dtype=bool)
+        idx_a, idx_b = np.triu_indices(len(names), k=1)
+        keep = present[idx_a] & present[idx_b]
+        if self.excluded_pairs:
+            keep &= np.array([
+                frozenset((names[i], names[j])) not in self.excluded_pairs
+                for i, j in zip(idx_a.tolist(), idx_b.tolist())
+            ], dtype=bool)
+        return self._collect(names, names, infos, infos, arrays, arrays, idx_a[keep], idx_b[keep])
+
+    def list_interchart_aspects(self, chart1_points: dict, chart2_points: dict):
+        """兩張命盤之間（A 盤每個點對 B 盤每個點）的相位。"""
+        names_a, names_b = list(chart1_points.keys()), list(chart2_points.keys())
+        infos_a, infos_b = list(chart1_points.values()), list(chart2_points.values())
+        arrays_a, arrays_b = self._point_arrays(names_a, infos_a), self._point_arrays(names_b, infos_b)
+        idx_a, idx_b = np.meshgrid(np.arange(len(names_a)), np.arange(len(names_b)), indexing='ij')
+        idx_a, idx_b = idx_a.ravel(), idx_b.ravel()
+        keep = arrays_a[0][idx_a] & arrays_b[0][idx_b]
+        return self._collect(names_a, names_b, infos_a, infos_b, arrays_a, arrays_b, idx_a[keep], idx_b[keep])
+
+    def list_interchart_aspects_many(self, chart1_points: dict, charts2_points: list):
+        """
+        一張 A 盤對多張 B 盤的跨盤相位，所有配對在同一次陣列運算中完成。
+        回傳的列表與 charts2_points 一一對應，每一項等同 list_interchart_aspects(chart1_points, 該盤)。
+        """
+        names_a, infos_a = list(chart1_points.keys()), list(chart1_points.values())
+        names_b, infos_b, owner = [], [], []
+        for n, points in enumerate(charts2_points):
+            names_b.extend(points.keys())
+            infos_b.extend(points.values())
+            owner.extend([n] * len(points))
+        arrays_a, arrays_b = self._point_arrays(names_a, infos_a), self._point_arrays(names_b, infos_b)
+        idx_a, idx_b = np.meshgrid(np.arange(len(names_a)), np.arange(len(names_b)), indexing='ij')
+        idx_a, idx_b = idx_a.ravel(), idx_b.ravel()
+        keep = arrays_a[0][idx_a] & arrays_b[0][idx_b]
+        return self._collect(names_a, names_b, infos_a, infos_b, arrays_a, arrays_b, idx_a[keep], idx_b[keep],
+                             groups=(owner, len(charts2_points)))
@@ -0,0 +1,412 @@
+# aspect_timing.py
+# 以 Swiss Ephemeris 位置與求根法 (Brent) 求出相位精確成相的時刻。
+import datetime
+import math
+
+import numpy as np
+import swisseph as swe
+
+EPHE_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
+J2000_JD = 2451545.0
+J2000_UTC = datetime.datetime(2000, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+
+# 求根的時間精度（日）。1e-5 日約 0.9 秒。
+DEFAULT_XTOL_DAYS = 1e-5
+# 求相位成相時刻時，往前或往後搜尋的最長天數
+MAX_PERFECTION_SEARCH_DAYS = 400.0
+# 第一次試探點相對於線性外插估計值的放大倍率，之後每次再加倍，但相鄰試探點的間隔不超過 _probe_gap_days，
+# 兩個試探點之間最多只有一個停滯點（否則「碰到零又折返」的成相會被跳過，或夾住多個根）
+_PROBE_OVERSHOOT = 1.25
+# 各天體最短的逆行期（日，1900–2100 年量測）；試探間隔取兩個天體中較短者的 3/4。
+# 不會逆行的天體（太陽、月亮、平均北交、莉莉絲）不限制間隔，未列出的天體（凱龍、小行星）使用預設值。
+MIN_RETROGRADE_DAYS = {
+    swe.MERCURY: 19.75, swe.VENUS: 40.75, swe.MARS: 60.0, swe.JUPITER: 117.5,
+    swe.SATURN: 133.5, swe.URANUS: 149.0, swe.NEPTUNE: 156.25, swe.PLUTO: 156.0,
+}
+NON_RETROGRADE_BODIES = frozenset({swe.SUN, swe.MOON, swe.MEAN_NODE, swe.MEAN_APOG})
+_DEFAULT_PROBE_GAP_DAYS = 0.75 * MIN_RETROGRADE_DAYS[swe.MERCURY]
+# 成相時刻先以 Newton 法求解（導數即星曆一併回傳的速度）的最多迭代次數與最遠距離（日）；
+# 距離小於最短的逆行期（水星約 20 日），區間內不可能同時有兩個停滯點，Newton 法不會跳過較近的成相。
+# 超出範圍或未收斂時改用試探夾根。
+_NEWTON_MAX_ITER = 6
+_NEWTON_MAX_DAYS = 10.0
+# 判斷「穿越零點」時，前後兩個取樣的偏差都必須小於此值，
+# 以排除 ±180° 接縫造成的假穿越。
+_CROSSING_LIMIT = 90.0
+# 行運掃描時每一步天體最多移動的角度：遠小於 _CROSSING_LIMIT，步長再大也不會把穿越當成接縫略過
+MAX_STEP_MOTION = 30.0
+# 各天體的最大日速度（°/日），以 1900–2100 年 Swiss Ephemeris 量得的最大值再略為放大；
+# 行運掃描依此決定步長。未列出的天體（例如愛神、靈神）當作與月亮一樣快。
+MAX_DAILY_MOTION = {
+    swe.SUN: 1.05, swe.MOON: 15.5, swe.MERCURY: 2.25, swe.VENUS: 1.3, swe.MARS: 0.82,
+    swe.JUPITER: 0.25, swe.SATURN: 0.14, swe.URANUS: 0.07, swe.NEPTUNE: 0.045, swe.PLUTO: 0.045,
+    swe.MEAN_NODE: 0.055, swe.MEAN_APOG: 0.12, swe.CHIRON: 0.15, swe.PHOLUS: 0.15,
+    swe.CERES: 0.5, swe.PALLAS: 0.65, swe.JUNO: 0.65, swe.VESTA: 0.6,
+}
+DEFAULT_MAX_DAILY_MOTION = MAX_DAILY_MOTION[swe.MOON]
+
+
+def wrap180(deg):
+    """將角度正規化到 [-180, 180)。可接受純量或 NumPy 陣列。"""
+    return (deg + 180) % 360 - 180
+
+
+def jd_to_utc_datetime(jd_ut: float):
+    return J2000_UTC + datetime.timedelta(days=jd_ut - J2000_JD)
+
+
+def body_position(jd_ut: float, pid: int, offset: float = 0.0):
+    """回傳天體在 jd_ut 的 (黃經, 速度)。offset 用於衍生點，例如南交 = 北交 + 180。"""
+    xx, _ = swe.calc_ut(jd_ut, pid, EPHE_FLAGS)
+    return (xx[0] + offset) % 360, xx[3]
+
+
+def aspect_targets(aspects: dict):
+    """
+    將 {相位名稱: 角度} 展開成 [(相位名稱, 帶號角度), ...]。
+    合相與沖只有一個精確點，其餘相位在 +角度 與 -角度 各有一個。
+    """
+    targets = []
+    for name, angle in aspects.items():
+        targets.append((name, float(angle)))
+        if angle % 180 != 0:
+            targets.append((name, -float(angle)))
+    return targets
+
+
+def brent_root(f, a, b, fa=None, fb=None, xtol=DEFAULT_XTOL_DAYS, maxiter=60):
+    """
+    Brent 法（與 scipy.optimize.brentq 相同的演算法）求 f 在 [a, b] 內的根。
+    f(a) 與 f(b) 必須異號。通常在數次函數呼叫內收斂。
+    """
+    if fa is None:
+        fa = f(a)
+    if fb is None:
+        fb = f(b)
+    if fa == 0:
+        return a
+    if fb == 0:
+        return b
+    if fa * fb > 0:
+        raise ValueError("brent_root: f(a) 與 f(b) 必須異號")
+
+    xpre, xcur, fpre, fcur = a, b, fa, fb
+    xblk = fblk = spre = scur = 0.0
+    for _ in range(maxiter):
+        if fpre * fcur < 0:
+            xblk, fblk = xpre, fpre
+            spre = scur = xcur - xpre
+        if abs(fblk) < abs(fcur):
+            xpre, xcur, xblk = xcur, xblk, xcur
+            fpre, fcur, fblk = fcur, fblk, fcur
+
+        delta = (xtol + 4e-16 * abs(xcur)) / 2
+        sbis = (xblk - xcur) / 2
+        if fcur == 0 or abs(sbis) < delta:
+            return xcur
+
+        if abs(spre) > delta and abs(fcur) < abs(fpre):
+            if xpre == xblk:
+                stry = -fcur * (xcur - xpre) / (fcur - fpre)
+            else:
+                dpre = (fpre - fcur) / (xpre - xcur)
+                dblk = (fblk - fcur) / (xblk - xcur)
+                stry = -fcur * (fblk * dblk - fpre * dpre) / (dblk * dpre * (fblk - fpre))
+            if 2 * abs(stry) < min(abs(spre), 3 * abs(sbis) - delta):
+                spre, scur = scur, stry
+            else:
+                spre = scur = sbis
+        else:
+            spre = scur = sbis
+
+        xpre, fpre = xcur, fcur
+        xcur += scur if abs(scur) > delta else (delta if sbis > 0 else -delta)
+        fcur = f(xcur)
+    return xcur
+
+
+def scan_step_days(transit_bodies: dict, step_days: float) -> float:
+    """行運掃描的實際步長：不超過 step_days，且最快的行運天體每一步移動不超過 MAX_STEP_MOTION 度。"""
+    fastest = max(MAX_DAILY_MOTION.get(pid, DEFAULT_MAX_DAILY_MOTION) for pid, _ in transit_bodies.values())
+    return min(step_days, MAX_STEP_MOTION / fastest)
+
+
+def hermite_turn(a, b, fa, da, fb, db):
+    """
+    兩端偏差為 fa / fb、變化率為 da / db（異號）時，以三次 Hermite 內插估計區間內的轉折時刻（變化率為 0 之處）。
+    不需要額外的星曆查詢；估計值只用來檢查轉折前是否已成相，轉折附近偏差變化平緩，不必精確。
+    """
+    h = b - a
+    slope = (fb - fa) / h
+    c2 = (3 * slope - 2 * da - db) / h
+    c3 = (da + db - 2 * slope) / (h * h)
+    # p'(t) = da + 2 c2 t + 3 c3 t²，兩端異號，(0, h) 內恰有一個根
+    if abs(c3) < 1e-15:
+        t = -da / (2 * c2) if c2 else h / 2
+    else:
+        disc = max(c2 * c2 - 3 * c3 * da, 0.0)
+        roots = [(-c2 + sign * disc ** 0.5) / (3 * c3) for sign in (1.0, -1.0)]
+        inside = [root for root in roots if 0 <= root / h <= 1]
+        t = inside[0] if inside else h / 2
+    return a + t
+
+
+def bracketed_newton(g, a, b, ga, gb, xtol=DEFAULT_XTOL_DAYS, maxiter=60):
+    """
+    在 g 變號的區間 [a, b] 內求根（Numerical Recipes 的 rtsafe）。g(x) 回傳 (值, 導數)，ga / gb 為兩端的 (值, 導數)。
+    Newton 步落在區間外或收斂太慢時改為二分，因此與 Brent 法一樣保證收斂；導數可靠時只需數次呼叫。
+    """
+    (fa, dfa), (fb, dfb) = ga, gb
+    if fa == 0:
+        return a
+    if fb == 0:
+        return b
+    if fa * fb > 0:
+        raise ValueError("bracketed_newton: g(a) 與 g(b) 必須異號")
+    lo, hi = (a, b) if fa < 0 else (b, a)
+    x, fx, dfx = (a, fa, dfa) if abs(fa) < abs(fb) else (b, fb, dfb)
+    dx_old = dx = abs(b - a)
+    for _ in range(maxiter):
+        if dfx == 0 or ((x - hi) * dfx - fx) * ((x - lo) * dfx - fx) > 0 or abs(2 * fx) > abs(dx_old * dfx):
+            dx_old, dx = dx, (hi - lo) / 2
+            x = lo + dx
+        else:
+            dx_old, dx = dx, fx / dfx
+            x -= dx
+        if abs(dx) < xtol:
+            return x
+        fx, dfx = g(x)
+        if fx == 0:
+            return x
+        if fx < 0:
+            lo = x
+        else:
+            hi = x
+    return x
+
+
+def iter_transit_hits(transit_bodies: dict, natal_points: dict, aspects: dict,
+                      jd_start: float, jd_end: float, step_days: float, include_samples=False,
+                      position_fn=body_position):
+    """
+    逐步掃描 [jd_start, jd_end]，找出行運天體對本命點的所有精確相位。
+
+    transit_bodies 為 {名稱: (天體 ID, 位移角度)}，natal_points 為 {名稱: 黃經}。
+    每一步只對每個行運天體呼叫一次 swe.calc_ut，並以 NumPy 一次比較所有
+    (行運天體, 本命點, 相位) 組合；偏差變號的區間再以 Brent 法求出精確時刻。
+    step_days 較大時，每一步再依最快天體的速度細分（見 scan_step_days），避免漏掉穿越；
+    sample 仍只在 step_days 的格點輸出。
+    以產生器依時間順序輸出 ("sample", {...}) 與 ("hit", {...})，記憶體只保留前一步。
+    position_fn 可替換位置來源（例如快速星曆表），介面同 body_position。
+    """
+    transit_names = list(transit_bodies.keys())
+    natal_names = list(natal_points.keys())
+    targets = aspect_targets(aspects)
+    natal_lons = np.array([natal_points[name] for name in natal_names], dtype=float)
+    target_angles = np.array([angle for _, angle in targets], dtype=float)
+
+    def positions_at(jd):
+        return [position_fn(jd, *transit_bodies[name]) for name in transit_names]
+
+    def sample(jd, positions):
+        return "sample", {
+            "jd_ut": jd, "utc_time": jd_to_utc_datetime(jd).isoformat(timespec="seconds"),
+            "positions": {name: {"lon": lon, "speed": speed} for name, (lon, speed) in zip(transit_names, positions)},
+        }
+
+    def deviations(lons):
+        # 形狀 (行運天體, 本命點, 相位)
+        lons = np.array(lons, dtype=float)
+        return wrap180(lons[:, None, None] - natal_lons[None, :, None] - target_angles[None, None, :])
+
+    def interval_hits(jd_a, jd_b, dev_a, dev_b):
+        crossing = (np.sign(dev_a) != np.sign(dev_b)) & (np.abs(dev_a) < _CROSSING_LIMIT) & (np.abs(dev_b) < _CROSSING_LIMIT)
+        hits = []
+        for b_idx, n_idx, t_idx in zip(*np.nonzero(crossing)):
+            b_idx, n_idx, t_idx = int(b_idx), int(n_idx), int(t_idx)
+            pid, offset = transit_bodies[transit_names[b_idx]]
+            natal_lon, target = natal_lons[n_idx], target_angles[t_idx]
+            # 前一步偏差恰為 0 時已於上一個區間輸出
+            if dev_a[b_idx, n_idx, t_idx] == 0:
+                continue
+
+            def f(jd, pid=pid, offset=offset, natal_lon=natal_lon, target=target):
+                return float(wrap180(position_fn(jd, pid, offset)[0] - natal_lon - target))
+
+            jd_exact = brent_root(f, jd_a, jd_b, float(dev_a[b_idx, n_idx, t_idx]), float(dev_b[b_idx, n_idx, t_idx]))
+            lon_exact, speed_exact = position_fn(jd_exact, pid, offset)
+            hits.append({
+                "transit_name": transit_names[b_idx], "natal_name": natal_names[n_idx],
+                "aspect_name": targets[t_idx][0], "jd_ut": jd_exact,
+                "utc_time": jd_to_utc_datetime(jd_exact).isoformat(timespec="seconds"),
+                "transit_lon": lon_exact, "transit_speed": speed_exact,
+                "is_retrograde": speed_exact < 0,
+            })
+        return hits
+
+    substeps = max(1, math.ceil(step_days / scan_step_days(transit_bodies, step_days) - 1e-9))
+    jd_prev = jd_start
+    pos_prev = positions_at(jd_prev)
+    dev_prev = deviations([lon for lon, _ in pos_prev])
+    if include_samples:
+        yield sample(jd_prev, pos_prev)
+
+    while jd_prev < jd_end:
+        jd_step_start, jd_step_end = jd_prev, min(jd_prev + step_days, jd_end)
+        hits = []
+        for i in range(1, substeps + 1):
+            jd_next = jd_step_end if i == substeps else jd_step_start + (jd_step_end - jd_step_start) * i / substeps
+            pos_next = positions_at(jd_next)
+            dev_next = deviations([lon for lon, _ in pos_next])
+            hits.extend(interval_hits(jd_prev, jd_next, dev_prev, dev_next))
+            jd_prev, pos_prev, dev_prev = jd_next, pos_next, dev_next
+        for hit in sorted(hits, key=lambda item: item["jd_ut"]):
+            yield "hit", hit
+        if include_samples:
+            yield sample(jd_prev, pos_prev)
+
+
+def _signed_target(separation: float, angle: float):
+    """在 +角度 與 -角度 中挑出離目前角距較近的一個作為精確點。"""
+    if angle % 180 == 0:
+        return float(angle)
+    if abs(wrap180(separation - angle)) <= abs(wrap180(separation + angle)):
+        return float(angle)
+    return -float(angle)
+
+
+def _probe_gap_days(body_a, body_b, max_days: float) -> float:
+    gaps = [max_days]
+    for body in (body_a, body_b):
+        if body is not None and body[0] not in NON_RETROGRADE_BODIES:
+            retrograde_days = MIN_RETROGRADE_DAYS.get(body[0])
+            gaps.append(0.75 * retrograde_days if retrograde_days else _DEFAULT_PROBE_GAP_DAYS)
+    return min(gaps)
+
+
+def _crosses(g_a: float, g_b: float):
+    return (g_a > 0) != (g_b > 0) and abs(g_a) < _CROSSING_LIMIT and abs(g_b) < _CROSSING_LIMIT
+
+
+def _newton_perfection(g, jd_ut: float, g0: float, rel_speed: float, max_days: float, xtol=DEFAULT_XTOL_DAYS):
+    """
+    由 jd_ut 已知的偏差 g0 與相對速度出發，以 Newton 法求 g 的根；g(jd) 回傳 (偏差, 相對速度)，
+    每次迭代只需一次星曆查詢。通常 2～3 次查詢即收斂。
+    途中相對速度變號（跨過停滯點）、偏差跳到 ±180° 接縫附近、離 jd_ut 超過 max_days 或未收斂時回傳 None。
+    """
+    jd, value, rate = jd_ut, g0, rel_speed
+    for _ in range(_NEWTON_MAX_ITER):
+        if abs(rate) < 1e-9:
+            return None
+        step = -value / rate
+        if abs(step) < xtol:
+            return jd + step
+        jd += step
+        if abs(jd - jd_ut) > max_days:
+            return None
+        value, new_rate = g(jd)
+        if value == 0:
+            return jd
+        if (new_rate > 0) != (rate > 0) or abs(value) >= _CROSSING_LIMIT:
+            return None
+        rate = new_rate
+    return None
+
+
+def find_perfection_time(body_a, body_b, jd_ut: float, lon_a: float, lon_b: float,
+                         speed_a: float, speed_b: float, angle: float,
+                         position_fn=body_position, max_days=MAX_PERFECTION_SEARCH_DAYS):
+    """
+    求兩點形成 angle 度相位的精確時刻（儒略日 UT），找不到時回傳 None。
+
+    body_a / body_b 為 (天體 ID, 位移角度)，或 None 表示固定點（四軸、福點等，黃經不隨時間改變）。
+    先以 jd_ut 已知的黃經與速度做 Newton 迭代（見 _newton_perfection），一般 2～3 次星曆查詢即可。
+    成相時刻較遠或途中遇到停滯點時，改以目前的相對速度線性外插出估計時刻，依天體的逆行週期取試探點夾住根，
+    再以 bracketed_newton 收斂；若兩個試探點之間相對速度變號，以 hermite_turn 估計轉折時刻，確認在轉折前
+    是否已成相，以免偏差「碰到零又折返」時被跳過。成相時刻可能在過去（出相）或未來（入相）。
+    """
+    if body_a is None and body_b is None:
+        return None
+    target = _signed_target(float(wrap180(lon_a - lon_b)), angle)
+
+    def g(jd):
+        la, sa = position_fn(jd, *body_a) if body_a is not None else (lon_a, 0.0)
+        lb, sb = position_fn(jd, *body_b) if body_b is not None else (lon_b, 0.0)
+        return float(wrap180(la - lb - target)), sa - sb
+
+    g0 = float(wrap180(lon_a - lon_b - target))
+    if g0 == 0:
+        return jd_ut
+    rel_speed = (speed_a if body_a is not None else 0.0) - (speed_b if body_b is not None else 0.0)
+    jd_exact = _newton_perfection(g, jd_ut, g0, rel_speed, min(max_days, _NEWTON_MAX_DAYS))
+    if jd_exact is not None:
+        return jd_exact
+    estimate = -g0 / rel_speed if abs(rel_speed) > 1e-9 else max_days
+    directions = [1.0, -1.0] if estimate > 0 else [-1.0, 1.0]
+    max_gap = _probe_gap_days(body_a, body_b, max_days)
+    first_step = min(max(abs(estimate) * _PROBE_OVERSHOOT, 1e-3), max_gap)
+
+    for direction in directions:
+        prev_offset, g_prev, rate_prev = 0.0, g0, rel_speed
+        offset = first_step
+        while True:
+            jd_prev, jd_probe = jd_ut + direction * prev_offset, jd_ut + direction * offset
+            g_probe, rate_probe = g(jd_probe)
+            if g_probe == 0:
+                return jd_probe
+            if _crosses(g_prev, g_probe):
+                return bracketed_newton(g, jd_prev, jd_probe, (g_prev, rate_prev), (g_probe, rate_probe))
+            if rate_prev != 0 and rate_probe != 0 and (rate_prev > 0) != (rate_probe > 0):
+                jd_turn = hermite_turn(jd_prev, jd_probe, g_prev, rate_prev, g_probe, rate_probe)
+                g_turn, rate_turn = g(jd_turn)
+                if g_turn == 0:
+                    return jd_turn
+                if _crosses(g_prev, g_turn):
+                    return bracketed_newton(g, jd_prev, jd_turn, (g_prev, rate_prev), (g_turn, rate_turn))
+            if offset >= max_days:
+                break
+            prev_offset, g_prev, rate_prev = offset, g_probe, rate_probe
+            offset = min(offset * 2, offset + max_gap, max_days)
+    return None
+
+
+def perfection_times(items, position_fn=body_position, max_days=MAX_PERFECTION_SEARCH_DAYS):
+    """
+    批次求成相時刻。items 為 dict 列表，每個 dict 需有
+    body_a, body_b, jd_ut, lon_a, lon_b, speed_a, speed_b, angle（意義同 find_perfection_time）。
+    同一批次內相同 (時刻, 天體) 的星曆查詢只做一次；各相位在 jd_ut 的黃經與速度直接作為查詢結果，
+    不再重新計算。
+    回傳與 items 對應的列表，每項為 {"perfection_jd_ut", "perfection_utc_time", "perfection_in_future"}，
+    找不到成相時刻或星曆查詢失敗時為 None。
+    """
+    memo = {}
+
+    def cached_position(jd, pid, offset=0.0):
+        key = (jd, pid, offset)
+        if key not in memo:
+            memo[key] = position_fn(jd, pid, offset)
+        return memo[key]
+
+    for item in items:
+        for body, lon, speed in ((item["body_a"], item["lon_a"], item["speed_a"]), (item["body_b"], item["lon_b"], item["speed_b"])):
+            if body is not None:
+                memo.setdefault((item["jd_ut"], *body), (lon, speed))
+
+    results = []
+    for item in items:
+        try:
+            jd_exact = find_perfection_time(
+                item["body_a"], item["body_b"], item["jd_ut"], item["lon_a"], item["lon_b"],
+                item["speed_a"], item["speed_b"], item["angle"], position_fn=cached_position, max_days=max_days)
+        except swe.Error:
+            # 例如小行星星曆檔不存在；只影響這一個相位
+            jd_exact = None
+        if jd_exact is None:
+            results.append(None)
+            continue
+        results.append({
+            "perfection_jd_ut": jd_exact,
+            "perfection_utc_time": jd_to_utc_datetime(jd_exact).isoformat(timespec="seconds"),
+            "perfection_in_future": jd_exact > item["jd_ut"],
+        })
+    return results
@@ -0,0 +1,688 @@
+# astro_engine.py
+# 命盤計算引擎：星體位置、宮位、相位、單盤與批次命盤，以及跨盤、合盤與出生時間校正用的共用函式。
+# 不依賴 Flask、requests 或 .env，批次腳本與工作行程直接匯入這個模組即可，不必載入整個 Flask 應用程式：
+#
+#   import astro_engine
+#   chart = astro_engine.calculate_astrology_chart(1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei", ["太陽", "月亮"])
+#
+# 匯入時不做任何 I/O。第一次計算時才呼叫 init()：下載缺少的核心星曆檔（ASTRO_SKIP_EPHE_DOWNLOAD 可略過，
+# 缺檔時 Swisseph 改用 Moshier 星曆）、設定星曆路徑與計算後端，並載入快速星曆表。
+# Flask 應用程式 (app.py) 在啟動時先呼叫 init()，並以這裡的函式實作各個端點。
+#
+# 記錄寫入 logging.getLogger("astro_engine")；本模組不設定 logging，由呼叫端決定輸出方式。
+import datetime
+import logging
+import math
+import os
+import threading
+
+import pytz
+import swisseph as swe
+
+from aspect_engine import AspectEngine
+import chart_cache
+import aspect_timing
+import compute_backend
+import chart_metrics
+import timezones
+import chart_fields
+import rectification
+import house_systems
+import fast_ephemeris
+import swiss_ephe_downloader
+from house_systems import HouseSystem
+from display_format import zodiac_format_many, house_label
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# --- 星曆設定（延遲初始化）---
+# ==============================================================================
+EPHE_PATH_CONFIG = os.path.abspath(swiss_ephe_downloader.EPHE_DIR) # 確保是絕對路徑
+# 快速星曆表（選用，見 fast_ephemeris）：init() 載入後，precision=fast 的計算改用內插位置。
+# 以記憶體映射載入，gunicorn 的各個 worker 共用同一份分頁快取。
+FAST_EPHEMERIS = None
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init():
+    """
+    準備計算環境，只執行一次（之後的呼叫立即返回）；計算函式第一次執行時會自動呼叫。
+    星曆檔下載或驗證失敗時只記錄錯誤：星曆路徑照常設定，驗證未通過的檔案已被移開（見 swiss_ephe_downloader），
+    缺檔的行星由 Swisseph 改用 Moshier 星曆，小行星則在命盤中列為無法計算。
+    """
+    global FAST_EPHEMERIS, _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        try:
+            # 伺服器上缺少核心檔案時會下載（小行星檔案在第一次用到時才下載）；
+            # 多個 worker 以檔案鎖協調，ASTRO_SKIP_EPHE_DOWNLOAD=1 可略過，例如離線基準測試。
+            swiss_ephe_downloader.ensure_ephe_files_exist()
+        except Exception as e:
+            logger.critical(f"Could not download or verify ephemeris files; missing bodies fall back to Moshier "
+                            f"or are reported as unavailable. Error: {e}", exc_info=True)
+        swe.set_ephe_path(EPHE_PATH_CONFIG)
+        logger.info(f"Successfully set Swisseph ephemeris path to: {EPHE_PATH_CONFIG}")
+        # 平行計算的工作行程也需要知道星曆路徑（由 ASTRO_COMPUTE_BACKEND 決定是否啟用行程池）
+        compute_backend.configure(EPHE_PATH_CONFIG)
+        try:
+            FAST_EPHEMERIS = fast_ephemeris.load()
+        except Exception as e:
+            logger.error(f"無法載入快速星曆表，precision=fast 將改用 Swiss Ephemeris: {e}", exc_info=True)
+            FAST_EPHEMERIS = None
+        _initialized = True
+
+# ==============================================================================
+# --- 天體、相位與容許度 ---
+# ==============================================================================
+PLANET_IDS = {
+    "太陽": swe.SUN, "月亮": swe.MOON, "水星": swe.MERCURY, "金星": swe.VENUS,
+    "火星": swe.MARS, "木星": swe.JUPITER, "土星": swe.SATURN, "天王": swe.URANUS,
+    "海王": swe.NEPTUNE, "冥王": swe.PLUTO, "凱龍": swe.CHIRON, "穀神": swe.CERES,
+    "智神": swe.PALLAS, "婚神": swe.JUNO, "灶神": swe.VESTA,
+    "愛神": swe.AST_OFFSET + 433, "莉莉絲": swe.MEAN_APOG, "靈神": swe.AST_OFFSET + 16,
+    "人龍": swe.PHOLUS, "北交": swe.MEAN_NODE,
+}
+
+ASPECTS = {
+    "合相": 0, "十二分相": 30, "半刑": 45, "六合": 60, "五分相": 72,
+    "刑": 90, "拱": 120, "補八分相": 135, "倍五分相": 144, "梅花形相": 150, "沖": 180,
+}
+
+DEFAULT_ORB = {
+    "合相": 8, "沖": 8, "拱": 6, "刑": 6, "六合": 5, "梅花形相": 4,
+    "半刑": 3, "補八分相": 3, "十二分相": 3, "五分相": 2.5, "倍五分相": 2.5,
+}
+
+FOUR_ANGLES_AND_NODES = ['上升', '下降', '天頂', '天底', '宿命', '福點', '北交', '南交']
+HOUSE_DEFINING_POINTS = ['上升', '下降', '天頂', '天底']
+
+PLANETS_THAT_CAN_RETROGRADE = [
+    "水星", "金星", "火星", "木星", "土星", "天王", "海王", "冥王",
+    "凱龍", "穀神", "智神", "婚神", "灶神", "愛神", "莉莉絲", "靈神", "人龍"
+]
+
+BASE_PLANETS = [
+    "太陽", "月亮", "水星", "金星", "火星", "木星", "土星",
+    "天王", "海王", "冥王", "北交"
+]
+
+# 相位與容許度合併成一張表，在模組載入時建好一次，避免每一對星體都重新查 DEFAULT_ORB
+ASPECT_ORB_TABLE = [(asp_name, target_angle, DEFAULT_ORB.get(asp_name, 3)) for asp_name, target_angle in ASPECTS.items()]
+
+# 成員檢查用的集合版本（避免在相位迴圈中對列表做線性搜尋）
+MOVING_POINTS = frozenset(PLANETS_THAT_CAN_RETROGRADE) | {"太陽", "月亮"}
+FIXED_POINTS = frozenset(FOUR_ANGLES_AND_NODES)
+
+# 定義上必然對沖的配對，不列入相位
+DEFINITIONAL_OPPOSITIONS = [{"上升", "下降"}, {"天頂", "天底"}, {"北交", "南交"}]
+
+ASPECT_ENGINE = AspectEngine(ASPECT_ORB_TABLE, MOVING_POINTS, FIXED_POINTS, DEFINITIONAL_OPPOSITIONS)
+
+# 合盤相容度摘要的相位權重：正值為和諧、負值為緊張，實際加權再乘上緊密度 (1 - 容許度/最大容許度)
+SYNASTRY_ASPECT_WEIGHTS = {
+    "合相": 0.5, "拱": 1.0, "六合": 0.75, "五分相": 0.25, "倍五分相": 0.25, "十二分相": 0.0,
+    "刑": -1.0, "沖": -0.75, "半刑": -0.25, "補八分相": -0.25, "梅花形相": -0.25,
+}
+
+# 星曆精度：full 為 Swiss Ephemeris；fast 為快速星曆表內插（表格範圍外或表格中沒有的天體仍用 Swiss Ephemeris）
+PRECISIONS = ("full", "fast")
+
+# ==============================================================================
+# Helper Functions (輔助函數)
+# ==============================================================================
+def get_midpoint(deg1: float, deg2: float) -> float:
+    rad1 = math.radians(deg1)
+    rad2 = math.radians(deg2)
+    x = math.cos(rad1) + math.cos(rad2)
+    y = math.sin(rad1) + math.sin(rad2)
+    mid_rad = math.atan2(y, x)
+    return (math.degrees(mid_rad) + 360) % 360
+
+def julian_days(utc_dt):
+    """由 UTC 時間計算 (儒略日 UT, delta-T 秒數, 儒略日 TT)，結果會快取。"""
+    init()
+    time_key = (utc_dt.year, utc_dt.month, utc_dt.day, utc_dt.hour, utc_dt.minute, utc_dt.second)
+    cached = chart_cache.TIME_CACHE.get(time_key)
+    if cached is None:
+        jd_ut = swe.julday(utc_dt.year, utc_dt.month, utc_dt.day, utc_dt.hour + utc_dt.minute / 60 + utc_dt.second / 3600)
+        cached = (jd_ut, swe.deltat(jd_ut))
+        chart_cache.TIME_CACHE.set(time_key, cached)
+    jd_ut, delta_t_seconds = cached
+    return jd_ut, delta_t_seconds, jd_ut + delta_t_seconds / (24 * 3600)
+
+def fast_table_for(jd_ut: float, precision: str):
+    """precision 為 fast 且快速星曆表涵蓋 jd_ut 時回傳表格，否則回傳 None。"""
+    init()
+    if precision == "fast" and FAST_EPHEMERIS is not None and FAST_EPHEMERIS.covers(jd_ut):
+        return FAST_EPHEMERIS
+    return None
+
+def fast_body_position(jd_ut: float, pid: int, offset: float = 0.0):
+    """快速星曆模式的 (黃經, 速度)，介面同 aspect_timing.body_position；表格沒有的天體或時間改用 Swiss Ephemeris。"""
+    table = fast_table_for(jd_ut, "fast")
+    if table is not None and table.has_body(pid):
+        lon, speed = table.position(jd_ut, pid)
+        return (lon + offset) % 360, speed
+    return aspect_timing.body_position(jd_ut, pid, offset)
+
+def position_fn_for(precision: str):
+    return fast_body_position if precision == "fast" else aspect_timing.body_position
+
+def compute_positions(jd_ut: float, planet_names_to_calculate: list, precision: str = "full", errors: dict = None):
+    # 星曆路徑由 init() 全域設定一次，不需要在每個函數內都呼叫 set_ephe_path。
+    # 每個天體的結果以 (儒略日, 天體 ID) 為鍵快取，換選星組合時已算過的天體可直接重用。
+    # precision 為 fast 時，快速星曆表中有的天體改以內插計算（不經過快取，結果也不寫入快取）。
+    # 無法計算的天體（例如小行星星曆檔下載失敗）不放入結果；有提供 errors 時記錄 {名稱: 錯誤訊息}。
+    init()
+    pos = {}
+    speeds = {}
+    fast_table = fast_table_for(jd_ut, precision)
+    for name in planet_names_to_calculate:
+        pid = PLANET_IDS.get(name)
+        if pid is None:
+            logger.warning(f"WARNING: Planet name '{name}' not found in PLANET_IDS, skipping.")
+            continue
+        if fast_table is not None and fast_table.has_body(pid):
+            pos[name], speeds[name] = fast_table.position(jd_ut, pid)
+            continue
+        cached = chart_cache.POSITION_CACHE.get((jd_ut, pid))
+        if cached is not None:
+            pos[name], speeds[name] = cached
+            continue
+        # 小行星的星曆檔在第一次用到時才下載
+        swiss_ephe_downloader.ensure_body_files(pid)
+        try:
+            xx, ret_code = swe.calc_ut(jd_ut, pid, swe.FLG_SWIEPH | swe.FLG_SPEED)
+            if ret_code < 0:
+                error_string = swe.get_errstr(ret_code) if hasattr(swe, 'get_errstr') else "未知錯誤"
+                raise Exception(f"Swisseph 計算 {name} 時發生錯誤: {error_string}。")
+            pos[name] = xx[0]
+            speeds[name] = xx[3]
+            chart_cache.POSITION_CACHE.set((jd_ut, pid), (xx[0], xx[3]))
+        except Exception as e:
+            logger.error(f"計算天體 {name} (PID: {pid}) 時發生錯誤: {e}", exc_info=True)
+            if errors is not None:
+                errors[name] = str(e)
+    if "北交" in pos and "北交" in speeds:
+        pos["南交"] = (pos["北交"] + 180) % 360
+        speeds["南交"] = -speeds.get("北交", 0.0)
+    return pos, speeds
+
+def compute_four_angles(jd_tt: float, lat: float, lon: float, hsys: bytes = b"P"):
+    init()
+    house_key = (jd_tt, lat, lon, hsys)
+    cached = chart_cache.HOUSE_CACHE.get(house_key)
+    if cached is not None:
+        # 回傳副本，避免呼叫端修改到快取中的宮頭字典
+        return {**cached, "cusps": dict(cached["cusps"])}
+    try:
+        cusps_output_raw, ascmc_raw = swe.houses(jd_tt, lat, lon, hsys)
+        cusps_dict_formatted = {i + 1: cusps_output_raw[i] for i in range(12)}
+        angles_data = {
+            "上升": ascmc_raw[0], "下降": (ascmc_raw[0] + 180) % 360,
+            "天頂": ascmc_raw[1], "天底": (ascmc_raw[1] + 180) % 360,
+            "宿命": ascmc_raw[3], "cusps": cusps_dict_formatted,
+        }
+        chart_cache.HOUSE_CACHE.set(house_key, {**angles_data, "cusps": dict(cusps_dict_formatted)})
+        return angles_data
+    except Exception as e:
+        logger.error(f"計算四軸時發生錯誤: {e}", exc_info=True)
+        raise Exception(f"計算四軸時發生錯誤，請檢查經緯度及時間設定，或星曆檔案: {e}")
+
+class ChartBatchContext:
+    """
+    批次計算時共用的資源：星曆路徑只在建立時設定一次，之後整批命盤共用。
+    （時區物件與換算結果由 timezones 模組全域快取。）
+    """
+    def __init__(self):
+        init()
+        swe.set_ephe_path(EPHE_PATH_CONFIG)
+
+# ==============================================================================
+# --- 命盤計算 ---
+# ==============================================================================
+
+def required_points(user_requested_planets: set) -> set:
+    """由使用者選的點推出實際需要計算的點（福點需要太陽、月亮、上升；宮位相關的點需要上升）。"""
+    planets_to_calculate = set(user_requested_planets)
+    # 如果菜單上有「福點」，備料單就必須加入「太陽、月亮、上升」
+    if "福點" in user_requested_planets:
+        planets_to_calculate.update({"太陽", "月亮", "上升"})
+    # 如果菜單上有任何宮位相關的點，備料單就必須加入「上升」
+    if any(p in user_requested_planets for p in ["上升", "下降", "天頂", "天底", "宿命"]):
+        planets_to_calculate.add("上升")
+    return planets_to_calculate
+
+def calculate_astrology_chart(year, month, day, hour, minute, latitude, longitude, timezone_str, optional_planets=None, generate_image=False, batch_context=None, with_perfection_times=False, house_system=None, display_fields=True, fields=None, precision=None, positions=None, second=0):
+    """
+    核心計算函式。此版本已加入「智慧依賴處理」邏輯，
+    例如當使用者勾選福點時，會自動在內部計算其依賴的太陽、月亮和上升。
+    批次計算時可傳入 batch_context，共用已設定好的星曆路徑。
+    with_perfection_times 為 True 時，每個相位會附上精確成相時刻 (perfection_*)。
+    house_system 為分宮制名稱或代碼（見 house_systems.HOUSE_SYSTEMS），預設 Placidus。
+    precision 為 "full"（預設）或 "fast"（快速星曆表內插，見 fast_ephemeris）。
+    positions 為預先算好的 (黃經 dict, 速度 dict)，提供時略過 swe.calc_ut（增量重算用，見 chart_session）。
+    second 為出生時間的秒數（時空中點盤的時刻精確到秒）。
+    fields 為 chart_fields.FieldSelection：只計算並回傳選取的欄位（未提供時為全部）；
+    星體的 lon / speed / is_retrograde 一律保留，供後續的跨盤計算使用，回應前再以 fields.apply 過濾。
+    """
+    fields = fields or chart_fields.ALL_FIELDS
+    try:
+        if batch_context is None:
+            init()
+            swe.set_ephe_path(EPHE_PATH_CONFIG)
+
+        try:
+            house_system_name, hsys = house_systems.resolve_house_system(house_system)
+        except ValueError as e:
+            return {"error": str(e), "error_type": "invalid_house_system"}
+        precision = precision or "full"
+        if precision not in PRECISIONS:
+            return {"error": f"無效的 precision '{precision}'。可用的值: {', '.join(PRECISIONS)}", "error_type": "invalid_precision"}
+        
+        # --- 1. 時間與儒略日計算 (此部分邏輯不變) ---
+        with chart_metrics.stage("time_conversion"):
+            try:
+                local_dt, utc_dt = timezones.resolve(datetime.datetime(year, month, day, hour, minute, second), timezone_str)
+            except pytz.UnknownTimeZoneError:
+                logger.warning(f"無效的時區名稱: '{timezone_str}'")
+                return {
+                    "error": f"您手動輸入的時區 '{timezone_str}' 無效。請檢查拼寫，或從下拉選單中選擇。",
+                    "error_type": "invalid_timezone"
+                }
+            jd_ut, delta_t_seconds, jd_tt = julian_days(utc_dt)
+
+        # --- 2. 【核心修改】智慧依賴處理 ---
+        # user_requested_planets 是使用者真正想看到的「菜單」
+        user_requested_planets = set(optional_planets if optional_planets is not None else [])
+        
+        # planets_to_calculate 是廚師為了做菜需要準備的「備料單」
+        planets_to_calculate = required_points(user_requested_planets)
+        
+        logger.info(f"使用者請求: {user_requested_planets}")
+        logger.info(f"內部實際計算: {planets_to_calculate}")
+        
+        # --- 3. 使用「備料單」進行計算 ---
+        unavailable_points = {}
+        if positions is not None:
+            positions_raw, speeds_raw = positions
+        else:
+            planets_for_swisseph = [p for p in planets_to_calculate if p in PLANET_IDS]
+            with chart_metrics.stage("calc_ut"):
+                positions_raw, speeds_raw = compute_positions(jd_ut, planets_for_swisseph, precision, unavailable_points)
+        
+        # 無論如何都計算四軸和宮位，因為它們是基礎結構
+        with chart_metrics.stage("houses"):
+            angles_data = compute_four_angles(jd_tt, latitude, longitude, hsys)
+        
+        # 4. 將所有計算出的點統一格式，存入一個內部字典，以防 'float' object is not subscriptable 錯誤
+        internal_points = {}
+        for name, lon in positions_raw.items():
+            internal_points[name] = {'lon': lon, 'speed': speeds_raw.get(name, 0.0)}
+        for name in ["上升", "下降", "天頂", "天底", "宿命"]:
+            if angles_data.get(name) is not None:
+                internal_points[name] = {'lon': angles_data[name], 'speed': 0.0}
+        
+        # 只有當所有備料都齊全時，才製作「福點」這道菜
+        if "福點" in planets_to_calculate and all(k in internal_points for k in ["太陽", "月亮", "上升"]):
+            sun_lon = internal_points["太陽"]["lon"]
+            moon_lon = internal_points["月亮"]["lon"]
+            asc_lon = internal_points["上升"]["lon"]
+            is_day_chart = (sun_lon - asc_lon + 360) % 360 >= 180
+            pof_lon = compute_part_of_fortune(sun_lon, moon_lon, asc_lon, is_day_chart)
+            internal_points["福點"] = {'lon': pof_lon, 'speed': 0.0}
+        else:
+            is_day_chart = False # 預設值
+
+        # 5. 【核心修改】過濾最終輸出結果
+        # 準備上菜，只上客戶點的菜
+        final_planet_positions = {}
+        # 這裡我們遍歷的是客戶的「原始菜單」，而不是廚師的「備料單」
+        with chart_metrics.stage("placement"):
+            placed_names = [name for name in user_requested_planets if name in internal_points]
+            placed_lons = [internal_points[name]['lon'] for name in placed_names]
+            if fields.needs_placement:
+                house_nums, hdegs = HouseSystem(angles_data['cusps']).locate_many(placed_lons)
+                for name, house_num, hdeg in zip(placed_names, house_nums, hdegs):
+                    info = internal_points[name]
+                    final_planet_positions[name] = {
+                        'lon': info['lon'], 'speed': info.get('speed', 0.0), 'house': house_num, 'hdeg': hdeg,
+                        'is_retrograde': bool(name in PLANETS_THAT_CAN_RETROGRADE and info.get('speed', 0.0) < 0),
+                    }
+            else:
+                # 沒有要求宮位欄位時略過宮位查詢
+                for name in placed_names:
+                    info = internal_points[name]
+                    final_planet_positions[name] = {
+                        'lon': info['lon'], 'speed': info.get('speed', 0.0),
+                        'is_retrograde': bool(name in PLANETS_THAT_CAN_RETROGRADE and info.get('speed', 0.0) < 0),
+                    }
+        # 顯示用欄位（逆行標籤、星座度數字串）；display_fields 為 False 或 fields 未選取時只回傳數值
+        with_label = display_fields and fields.wants_planet('retrograde_label')
+        with_formatted = display_fields and fields.wants_planet('zodiac_position_formatted')
+        if with_label or with_formatted:
+            with chart_metrics.stage("display_fields"):
+                formatted_column = zodiac_format_many(placed_lons) if with_formatted else [None] * len(placed_names)
+                for name, formatted in zip(placed_names, formatted_column):
+                    planet = final_planet_positions[name]
+                    if with_label:
+                        planet['retrograde_label'] = "逆行" if planet['is_retrograde'] else ""
+                    if with_formatted:
+                        planet['zodiac_position_formatted'] = formatted
+        
+        # 同樣，相位也只顯示客戶點的星體之間的相位
+        final_aspects = None
+        if fields.wants("aspects"):
+            with chart_metrics.stage("aspects"):
+                all_aspects = list_aspects(internal_points)
+                final_aspects = [asp for asp in all_aspects if asp['p1_name'] in user_requested_planets and asp['p2_name'] in user_requested_planets]
+            if with_perfection_times:
+                with chart_metrics.stage("aspect_timing"):
+                    add_perfection_times(final_aspects, jd_ut, position_fn_for(precision))
+
+        debug_info = {"is_day_chart": is_day_chart}
+        # 無法計算的天體不出現在 planet_positions，在此說明原因
+        unavailable_points = {name: message for name, message in unavailable_points.items() if name in user_requested_planets}
+        if unavailable_points:
+            debug_info["unavailable_points"] = unavailable_points
+        if precision == "fast":
+            # 實際使用的星曆：超出快速星曆表範圍時為 full
+            debug_info["ephemeris_precision"] = "fast" if fast_table_for(jd_ut, precision) is not None else "full"
+
+        # 6. 回傳結果 (使用與您原始碼完全相同的完整結構)，只保留 fields 選取的欄位
+        return fields.select({
+            "local_time": local_dt.strftime("%Y-%m-%d %H:%M:%S %Z%z") if fields.wants("local_time") else None,
+            "utc_time": utc_dt.strftime("%Y-%m-%d %H:%M:%S %Z%z") if fields.wants("utc_time") else None,
+            "julian_day_ut": jd_ut, 
+            "delta_t_seconds": delta_t_seconds, 
+            "julian_day_tt": jd_tt,
+            "latitude": latitude, 
+            "longitude": longitude,
+            "ephemeris_path_status": {"status": "OK", "message": f"星曆檔案路徑已從 {EPHE_PATH_CONFIG} 載入。"} if fields.wants("ephemeris_path_status") else None,
+            "debug_info": debug_info,
+            "house_system": house_system_name,
+            "house_cusps": angles_data['cusps'],
+            "planet_positions": final_planet_positions,  # 使用已過濾的、只包含使用者所選星體的結果
+            "aspects": final_aspects,  # 使用已過濾的、只包含使用者所選星體之間相位的結果
+            "chart_image_b64": "placeholder_for_base64_image_string" if generate_image else None,
+        })
+    except Exception as e:
+        logger.error(f"計算命盤時發生錯誤: {e}", exc_info=True)
+        return {"error": str(e)}
+
+def chart_args_from_payload(data: dict, prefix: str, optional_planets):
+    """從請求 JSON 取出 calculate_astrology_chart 的位置參數。prefix 為 'chart1_'、'natal_' 等欄位前綴。"""
+    return (
+        int(data[f'{prefix}year']), int(data[f'{prefix}month']), int(data[f'{prefix}day']),
+        int(data[f'{prefix}hour']), int(data[f'{prefix}minute']),
+        float(data[f'{prefix}latitude']), float(data[f'{prefix}longitude']),
+        data[f'{prefix}timezone'], optional_planets)
+
+def chart_kwargs_from_payload(data: dict):
+    """從請求 JSON 取出 calculate_astrology_chart 的關鍵字參數：分宮制 house_system、是否輸出顯示用字串 display_fields，以及星曆精度 precision。"""
+    return {"house_system": data.get('house_system'), "display_fields": bool(data.get('display_fields', True)),
+            "precision": data.get('precision')}
+
+def fields_from_payload(data: dict, sections=()):
+    """解析請求中的 fields（稀疏欄位選擇，見 chart_fields）；sections 為該端點額外可選的區段，無效時拋出 ValueError。"""
+    return chart_fields.parse_fields(data.get('fields'), sections)
+
+def pair_compute_fields(fields):
+    """雙盤計算用的欄位選擇：跨盤相位與宮位落點需要星體位置、宮頭與逆行標籤。"""
+    return fields.widened(chart=("planet_positions", "house_cusps"), planet=("retrograde_label",))
+
+def calculate_astrology_chart_batch(entries: list):
+    """
+    一次計算多張命盤。每一筆的錯誤只記錄在該筆結果中，不會讓整批失敗。
+    回傳的列表與輸入順序一一對應。啟用行程池時，整批會切段分給各個工作行程。
+    """
+    init()  # 行程池建立前先設定好工作行程要用的星曆路徑
+    if compute_backend.is_parallel() and len(entries) > 1:
+        parts = compute_backend.run_all([
+            (_calculate_batch_chunk, (chunk, start)) for start, chunk in compute_backend.chunked(entries)
+        ])
+        return [item for part in parts for item in part]
+    return _calculate_batch_chunk(entries, 0)
+
+def _calculate_batch_chunk(entries: list, start_index: int):
+    batch_context = ChartBatchContext()
+    results = []
+    for index, entry in enumerate(entries, start=start_index):
+        try:
+            if not isinstance(entry, dict):
+                raise TypeError("每一筆資料都必須是 JSON 物件")
+            fields = fields_from_payload(entry)
+            raw_chart_data = fields.apply(calculate_astrology_chart(
+                *chart_args_from_payload(entry, '', entry.get('optional_planets', [])),
+                batch_context=batch_context, with_perfection_times=bool(entry.get('aspect_timing', False)),
+                fields=fields, **chart_kwargs_from_payload(entry)))
+        except KeyError as e:
+            raw_chart_data = {"error": f"缺少必要欄位: {e}", "error_type": "missing_field"}
+        except (TypeError, ValueError) as e:
+            raw_chart_data = {"error": f"欄位格式錯誤: {e}", "error_type": "invalid_field"}
+
+        if "error" in raw_chart_data:
+            results.append({"index": index, "ok": False, **raw_chart_data})
+        else:
+            results.append({"index": index, "ok": True, "chart": raw_chart_data})
+    return results
+        
+def ephemeris_body(name: str):
+    """回傳可用星曆查詢的 (天體 ID, 位移角度)；四軸、福點等固定點回傳 None。"""
+    if name in PLANET_IDS:
+        return PLANET_IDS[name], 0.0
+    if name == "南交":
+        return PLANET_IDS["北交"], 180.0
+    return None
+
+def add_perfection_times(aspects: list, jd_ut: float, position_fn=aspect_timing.body_position):
+    """為相位列表中的每個相位加上精確成相時刻，找不到時欄位為 None。position_fn 見 position_fn_for。"""
+    items = [{
+        "body_a": ephemeris_body(asp['p1_name']), "body_b": ephemeris_body(asp['p2_name']), "jd_ut": jd_ut,
+        "lon_a": asp['p1_details']['lon'], "lon_b": asp['p2_details']['lon'],
+        "speed_a": asp['p1_details'].get('speed', 0.0), "speed_b": asp['p2_details'].get('speed', 0.0),
+        "angle": ASPECTS[asp['aspect_name']],
+    } for asp in aspects]
+    for asp, timing in zip(aspects, aspect_timing.perfection_times(items, position_fn)):
+        asp.update(timing or {"perfection_jd_ut": None, "perfection_utc_time": None, "perfection_in_future": None})
+    return aspects
+
+def compute_part_of_fortune(sun_lon: float, moon_lon: float, asc_lon: float, is_day: bool) -> float:
+    return (asc_lon + moon_lon - sun_lon) % 360 if is_day else (asc_lon + sun_lon - moon_lon) % 360
+
+def find_house(deg: float, cusps_dict: dict):
+    # 查詢多個點時，請改用 HouseSystem(cusps_dict).locate_many(...) 一次完成
+    if not isinstance(cusps_dict, dict) or len(cusps_dict) < 12:
+        return 1, 0.0
+    return HouseSystem(cusps_dict).locate(deg)
+
+def aspect_motion(p1_name: str, p2_name: str, lon_a: float, lon_b: float, speed_a: float, speed_b: float,
+                  target_angle: float, current_deviation: float) -> str:
+    """以一小時後的位置判斷入相或出相；兩點都不會移動或都是固定點時回傳空字串。"""
+    is_p1_moving = p1_name in MOVING_POINTS
+    is_p2_moving = p2_name in MOVING_POINTS
+    is_two_fixed_points = (p1_name in FIXED_POINTS and p2_name in FIXED_POINTS)
+    if not (is_p1_moving or is_p2_moving) or is_two_fixed_points:
+        return ""
+    dt_factor = 1 / 24
+    lon_a_next = (lon_a + speed_a * dt_factor) % 360
+    lon_b_next = (lon_b + speed_b * dt_factor) % 360
+    diff_next = abs(lon_a_next - lon_b_next)
+    diff_next = min(diff_next, 360 - diff_next)
+    next_deviation = abs(diff_next - target_angle)
+    if next_deviation < current_deviation - 1e-9:
+        return "入相"
+    elif next_deviation > current_deviation + 1e-9:
+        return "出相"
+    return "入相"
+
+def aspect_between(p1_name: str, p2_name: str, lon_a: float, lon_b: float, speed_a: float, speed_b: float):
+    diff_current = abs(lon_a - lon_b)
+    diff_current = min(diff_current, 360 - diff_current)
+
+    result_aspect = None
+    for asp_name, target_angle, orb in ASPECT_ORB_TABLE:
+        current_deviation = abs(diff_current - target_angle)
+
+        if current_deviation <= orb:
+            aspect_type = aspect_motion(p1_name, p2_name, lon_a, lon_b, speed_a, speed_b, target_angle, current_deviation)
+            result_aspect = asp_name, current_deviation, aspect_type
+            break
+    return result_aspect
+
+@chart_metrics.timed("format_display")
+def format_chart_data_for_display(raw_chart_data, fields=None):
+    # fields（chart_fields.FieldSelection）有選取時，只輸出選取欄位對應的區塊
+    if "error" in raw_chart_data: return raw_chart_data
+    fields = fields or chart_fields.ALL_FIELDS
+    output = {}
+    if fields.wants_any("local_time", "utc_time", "julian_day_ut", "delta_t_seconds", "julian_day_tt"):
+        timestamps = {
+            "local_time": raw_chart_data.get("local_time"), "utc_time": raw_chart_data.get("utc_time"),
+            "julian_day_ut": f"{raw_chart_data.get('julian_day_ut', 0):.6f}",
+            "delta_t_seconds": raw_chart_data.get('delta_t_seconds', 0),
+            "julian_day_tt": f"{raw_chart_data.get('julian_day_tt', 0):.6f}"
+        }
+        output["timestamps"] = timestamps if fields.is_all else {key: value for key, value in timestamps.items() if fields.wants(key)}
+    if fields.wants_any("latitude", "longitude"):
+        output["birth_info"] = {key: f"{raw_chart_data[key]:.2f}" for key in ("latitude", "longitude") if fields.wants(key)}
+    if fields.wants("ephemeris_path_status"):
+        output["ephemeris_path_status"] = raw_chart_data.get("ephemeris_path_status", {"status": "Unknown", "message": "N/A"})
+    if fields.wants("debug_info"):
+        output["debug_info"] = raw_chart_data.get("debug_info", {})
+    if fields.wants("house_system"):
+        output["house_system"] = raw_chart_data.get("house_system")
+    if fields.wants("house_cusps"):
+        output["house_cusps"] = [{"house_number": i, "zodiac_position_formatted": formatted}
+                                 for i, formatted in enumerate(zodiac_format_many([raw_chart_data["house_cusps"][i] for i in range(1, 13)]), start=1)]
+    if fields.wants("planet_positions"):
+        with_house, with_hdeg = fields.wants_planet('house'), fields.wants_planet('hdeg')
+        if with_house and with_hdeg:
+            output["planet_positions"] = {
+                name: {**info,
+                       'house_display': house_label(info.get('house')),
+                       'hdeg_display': f"{info['hdeg']:.2f}°" if info.get('hdeg') is not None else ""}
+                for name, info in raw_chart_data["planet_positions"].items()
+            }
+        else:
+            output["planet_positions"] = {}
+            for name, info in raw_chart_data["planet_positions"].items():
+                formatted_info = dict(info)
+                if with_house:
+                    formatted_info['house_display'] = house_label(info.get('house'))
+                if with_hdeg:
+                    formatted_info['hdeg_display'] = f"{info['hdeg']:.2f}°" if info.get('hdeg') is not None else ""
+                output["planet_positions"][name] = formatted_info
+    if fields.wants("aspects"):
+        output["aspects"] = raw_chart_data["aspects"]
+    return output
+
+def list_aspects(detailed_points_info: dict):
+    # 向量化版本，結果與逐對呼叫 aspect_between 相同
+    return ASPECT_ENGINE.list_aspects(detailed_points_info)
+
+@chart_metrics.timed("interchart_aspects")
+def list_interchart_aspects(chart1_points: dict, chart2_points: dict):
+    return ASPECT_ENGINE.list_interchart_aspects(chart1_points, chart2_points)
+
+@chart_metrics.timed("interchart_aspects")
+def list_interchart_aspects_many(chart1_points: dict, charts2_points: list):
+    # 一張盤對多張盤，一次陣列運算完成；結果與逐一呼叫 list_interchart_aspects 相同
+    return ASPECT_ENGINE.list_interchart_aspects_many(chart1_points, charts2_points)
+
+@chart_metrics.timed("overlays")
+def get_planet_overlays_in_houses(source_chart_points: dict, target_chart_cusps):
+    # target_chart_cusps 可以是宮頭字典，或重複使用時預先建立的 HouseSystem
+    overlays = []
+    names = [name for name, info in source_chart_points.items() if info and 'lon' in info]
+    target_houses = target_chart_cusps if isinstance(target_chart_cusps, HouseSystem) else HouseSystem(target_chart_cusps)
+    lons = [source_chart_points[name]['lon'] for name in names]
+    houses, degrees = target_houses.locate_many(lons)
+    for planet_name, formatted, house_in_target, deg_in_target_house in zip(names, zodiac_format_many(lons), houses, degrees):
+        planet_info = source_chart_points[planet_name]
+        overlays.append({
+            "planet_name": planet_name,
+            "zodiac_position_formatted": formatted,
+            "retrograde_label": planet_info.get('retrograde_label', ''),
+            "house_in_target_chart": house_in_target,
+            "degree_in_target_house": deg_in_target_house
+        })
+    return overlays
+
+def synastry_summary(inter_aspects: list):
+    """合盤相容度摘要：各相位數量、和諧／緊張加權分數，以及最緊密的三個相位。"""
+    harmony = tension = 0.0
+    aspect_counts = {}
+    for asp in inter_aspects:
+        name = asp['aspect_name']
+        aspect_counts[name] = aspect_counts.get(name, 0) + 1
+        max_orb = DEFAULT_ORB.get(name, 3)
+        weight = SYNASTRY_ASPECT_WEIGHTS.get(name, 0.0) * max(0.0, 1 - asp['orb'] / max_orb)
+        if weight > 0:
+            harmony += weight
+        else:
+            tension -= weight
+    tightest = sorted(inter_aspects, key=lambda asp: asp['orb'])[:3]
+    return {
+        "aspect_count": len(inter_aspects), "aspect_counts": aspect_counts,
+        "harmony": round(harmony, 3), "tension": round(tension, 3), "score": round(harmony - tension, 3),
+        "tightest": [[asp['p1_name'], asp['p2_name'], asp['aspect_name'], round(asp['orb'], 2)] for asp in tightest],
+    }
+
+def iter_synastry_pairs(subjects: list, candidates: list, summary_only=False, include_overlays=True, fields=None):
+    """
+    subjects / candidates 為 [(識別資料 dict, 原始命盤), ...]，逐一產生每個 (subject, candidate) 配對的結果。
+    每個 subject 對所有 candidates 的跨盤相位在同一次陣列運算中完成，宮位查詢器也只建立一次。
+    fields（chart_fields.FieldSelection）決定配對包含哪些區段 (summary / inter_aspects / overlays)。
+    """
+    fields = fields or chart_fields.ALL_FIELDS
+    with_summary = fields.wants("summary")
+    with_aspects = not summary_only and fields.wants("inter_aspects")
+    include_overlays = include_overlays and not summary_only and fields.wants("overlays")
+    candidate_points = [chart['planet_positions'] for _, chart in candidates]
+    candidate_houses = [HouseSystem(chart['house_cusps']) for _, chart in candidates] if include_overlays else None
+    for subject_ref, subject_chart in subjects:
+        aspects_per_candidate = list_interchart_aspects_many(subject_chart['planet_positions'], candidate_points)
+        subject_houses = HouseSystem(subject_chart['house_cusps']) if candidate_houses is not None else None
+        for n, ((candidate_ref, candidate_chart), inter_aspects) in enumerate(zip(candidates, aspects_per_candidate)):
+            row = {"type": "pair", "subject": subject_ref, "candidate": candidate_ref}
+            if with_summary:
+                row["summary"] = synastry_summary(inter_aspects)
+            if with_aspects:
+                row["inter_aspects"] = fields.filter_aspects(inter_aspects)
+            if candidate_houses is not None:
+                row["subject_planets_in_candidate_houses"] = get_planet_overlays_in_houses(subject_chart['planet_positions'], candidate_houses[n])
+                row["candidate_planets_in_subject_houses"] = get_planet_overlays_in_houses(candidate_chart['planet_positions'], subject_houses)
+            yield row
+
+# ==============================================================================
+# --- 出生時間校正（見 rectification）---
+# ==============================================================================
+def positions_with_nodes(jd_ut: float, names):
+    """回傳 {名稱: (黃經, 速度)}；南交由北交推出。"""
+    names = set(names)
+    to_compute = [name for name in names if name in PLANET_IDS]
+    if "南交" in names and "北交" not in names:
+        to_compute.append("北交")
+    pos, speeds = compute_positions(jd_ut, to_compute)
+    return {name: (pos[name], speeds[name]) for name in names if name in pos}
+
+def rectify_chunk(job: dict, candidates: list):
+    """
+    為一段候選出生時間評分（可在行程池中執行）。candidates 為 [(儒略日 TT, {名稱: (黃經, 速度)}), ...]；
+    回傳 [(分數, 符合的條件, 上升, 天頂), ...]。
+    """
+    charts = []
+    for jd_tt, planets in candidates:
+        angles = compute_four_angles(jd_tt, job["latitude"], job["longitude"], job["hsys"])
+        points = dict(planets)
+        points.update({name: (angles[name], 0.0) for name in rectification.ANGLE_NAMES})
+        charts.append((points, angles["cusps"]))
+    scored = rectification.score_candidates(charts, job["events"], aspect_motion, find_house)
+    return [(score, matches, points["上升"][0], points["天頂"][0]) for (score, matches), (points, _) in zip(scored, charts)]
@@ -0,0 +1,195 @@
+# benchmark.py
+# 離線效能基準測試：不經過網路，直接呼叫核心函式 (astro_engine) 與 Flask test client。
+#
+# 用法：
+#   python benchmark.py                                  # 執行全部案例，結果寫入 bench_output.json
+#   python benchmark.py --filter endpoint --iterations 50
+#   python benchmark.py --save-baseline bench_baseline.json
+#   python benchmark.py --baseline bench_baseline.json   # 與基準比較，有退步時以代碼 1 結束
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+# 基準測試不下載星曆檔（缺檔時 Swisseph 會改用 Moshier 星曆），並使用固定的 API 金鑰呼叫受保護端點
+os.environ.setdefault("ASTRO_SKIP_EPHE_DOWNLOAD", "1")
+os.environ.setdefault("ASTRO_API_KEY", "benchmark-key")
+
+import app as astro_app  # noqa: E402  (必須在設定環境變數之後載入)
+import astro_engine  # noqa: E402
+import chart_cache  # noqa: E402
+
+API_HEADERS = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+
+SMALL_PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "上升", "天頂"]
+FULL_PLANETS = list(astro_engine.PLANET_IDS) + ["南交", "上升", "下降", "天頂", "天底", "宿命", "福點"]
+BODY_SETS = {"small": SMALL_PLANETS, "full": FULL_PLANETS}
+
+PERSON_A = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30,
+            "latitude": 25.09, "longitude": 121.52, "timezone": "Asia/Taipei"}
+PERSON_B = {"year": 1988, "month": 7, "day": 20, "hour": 23, "minute": 50,
+            "latitude": -33.87, "longitude": 151.21, "timezone": "Australia/Sydney"}
+TRANSIT_MOMENT = {"year": 2024, "month": 3, "day": 1, "hour": 8, "minute": 0,
+                  "latitude": 40.71, "longitude": -74.01, "timezone": "America/New_York"}
+
+
+def prefixed(prefix, person):
+    return {f"{prefix}{key}": value for key, value in person.items()}
+
+
+def chart_args(person, planets):
+    return (person["year"], person["month"], person["day"], person["hour"], person["minute"],
+            person["latitude"], person["longitude"], person["timezone"], planets)
+
+
+def build_cases():
+    """回傳 {案例名稱: 無參數的可呼叫物件}。"""
+    client = astro_app.app.test_client()
+    cases = {}
+
+    for set_name, planets in BODY_SETS.items():
+        raw_a = astro_engine.calculate_astrology_chart(*chart_args(PERSON_A, planets))
+        raw_b = astro_engine.calculate_astrology_chart(*chart_args(PERSON_B, planets))
+        internal_points = {name: {"lon": info["lon"], "speed": info["speed"]} for name, info in raw_a["planet_positions"].items()}
+        cusps = raw_a["house_cusps"]
+        longitudes = [info["lon"] for info in raw_a["planet_positions"].values()]
+
+        def find_all_houses(longitudes=longitudes, cusps=cusps):
+            for lon in longitudes:
+                astro_engine.find_house(lon, cusps)
+
+        cases[f"func.calculate_astrology_chart.{set_name}"] = lambda planets=planets: astro_engine.calculate_astrology_chart(*chart_args(PERSON_A, planets))
+        cases[f"func.list_aspects.{set_name}"] = lambda points=internal_points: astro_engine.list_aspects(points)
+        cases[f"func.list_interchart_aspects.{set_name}"] = lambda a=raw_a, b=raw_b: astro_engine.list_interchart_aspects(a["planet_positions"], b["planet_positions"])
+        cases[f"func.find_house.{set_name}"] = find_all_houses
+        cases[f"func.format_chart_data_for_display.{set_name}"] = lambda raw=raw_a: astro_engine.format_chart_data_for_display(raw)
+
+        single = {**PERSON_A, "optional_planets": planets}
+        two_people = {**prefixed("chart1_", PERSON_A), **prefixed("chart2_", PERSON_B), "optional_planets": planets}
+        transit = {**prefixed("natal_", PERSON_A), **prefixed("transit_", TRANSIT_MOMENT), "optional_planets": planets}
+        batch = {"charts": [{**single, "day": day} for day in range(1, 21)]}
+
+        cases[f"endpoint.single.{set_name}"] = lambda body=single: client.post("/calculate_single_chart", json=body)
+        cases[f"endpoint.comparison.{set_name}"] = lambda body=two_people: client.post("/calculate_comparison_chart", json=body)
+        cases[f"endpoint.transit.{set_name}"] = lambda body=transit: client.post("/calculate_transit_chart", json=body)
+        cases[f"endpoint.composite.{set_name}"] = lambda body=two_people: client.post("/calculate_composite_chart", json=body)
+        cases[f"endpoint.ai_single.{set_name}"] = lambda body=single: client.post("/api/v1/chart/single", json=body, headers=API_HEADERS)
+        cases[f"endpoint.ai_batch20.{set_name}"] = lambda body=batch: client.post("/api/v1/chart/batch", json=body, headers=API_HEADERS)
+    return cases
+
+
+def percentile(sorted_values, pct):
+    """最近秩法 (nearest-rank) 百分位數。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_case(fn, iterations, warmup, warm_cache):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        if not warm_cache:
+            chart_cache.clear_all()
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+        status = getattr(result, "status_code", 200)
+        if status >= 400:
+            raise RuntimeError(f"案例回傳 HTTP {status}: {result.get_data(as_text=True)[:200]}")
+    samples.sort()
+    total = sum(samples)
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "min_ms": samples[0] * 1000,
+        "max_ms": samples[-1] * 1000,
+        "throughput_per_s": iterations / total if total > 0 else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """比較 p50，超過基準 (1 + tolerance) 倍視為退步。回傳退步案例列表。"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        current["baseline_p50_ms"] = previous["p50_ms"]
+        current["ratio_vs_baseline"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append((name, previous["p50_ms"], current["p50_ms"], ratio))
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="離線執行星盤計算與 API 端點的效能基準測試。",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30, help="每個案例量測的次數")
+    parser.add_argument("--warmup", type=int, default=3, help="每個案例量測前的暖身次數")
+    parser.add_argument("--filter", action="append", default=[], help="只執行名稱包含此字串的案例（可重複指定）")
+    parser.add_argument("--warm-cache", action="store_true", help="量測時保留計算快取（預設每次量測前清空）")
+    parser.add_argument("--output", default="bench_output.json", help="結果 JSON 的輸出路徑")
+    parser.add_argument("--baseline", help="要比較的基準結果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p50 允許的退步比例")
+    parser.add_argument("--save-baseline", help="將本次結果另存為基準檔")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    # 逐筆計算的 INFO 日誌，以及離線時小行星星曆檔缺檔的 ERROR 日誌會淹沒輸出，基準測試時關閉
+    # （端點回傳 4xx/5xx 時 run_case 仍會直接中止）
+    logging.disable(logging.ERROR)
+
+    cases = build_cases()
+    if args.filter:
+        cases = {name: fn for name, fn in cases.items() if any(f in name for f in args.filter)}
+
+    results = {}
+    for name, fn in cases.items():
+        results[name] = run_case(fn, args.iterations, args.warmup, args.warm_cache)
+        r = results[name]
+        print(f"{name:<48} p50 {r['p50_ms']:9.3f} ms   p99 {r['p99_ms']:9.3f} ms   {r['throughput_per_s']:10.1f} /s")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0], "platform": platform.platform(),
+            "iterations": args.iterations, "warmup": args.warmup, "warm_cache": args.warm_cache,
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"❌ 退步: {name}  {before:.3f} ms -> {after:.3f} ms (x{ratio:.2f})")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"✅ 與基準 {args.baseline} 相比沒有超過 {args.tolerance:.0%} 的退步")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
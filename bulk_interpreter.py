@@ -0,0 +1,329 @@
+# bulk_interpreter.py
+# 大量解讀：從 CSV / JSONL 讀入出生資料，取得命盤後交給語言模型解讀，結果依輸入順序寫成 JSONL。
+#
+# - 命盤來源 (--source)：
+#     api    以共用連線池的 requests.Session 呼叫 /api/v1/chart/single（ASTRO_API_URL），
+#            429 / 5xx 與連線失敗由 urllib3 Retry 以指數退避重試
+#     local  在本行程內呼叫 astro_engine.calculate_astrology_chart（經由 calculate_astrology_chart_batch，與批次 API 相同），
+#            不需要啟動伺服器，也不需要 ASTRO_API_KEY
+# - 解讀以執行緒池同時進行 (--workers)，並以 --rpm 限制每分鐘送出的模型請求數（重試也計入）；
+#   暫時性錯誤 (InterpretationError.retryable) 以指數退避加隨機抖動重試 --retries 次，其他錯誤只記錄在該筆結果。
+# - 解讀結果存在 --cache-dir，每個「模型 + 提示」一個檔案；提示由命盤文字 (chart_prompt.chart_to_text) 與問題組成，
+#   因此重跑時命盤與問題相同的資料直接讀取已完成的解讀，命盤、問題或提示範本改變時則重新解讀。
+#   同一次執行中重複的組合只解讀一次。
+#
+# 輸入欄位（CSV 標題列或 JSONL 物件的鍵）：
+#   id（選填，預設為資料列編號）、year、month、day、hour、minute、latitude、longitude、timezone、
+#   optional_planets（選填，CSV 中以空白或分號分隔）、question（選填，未提供時使用 --question），
+#   其他欄位（例如 house_system）原樣傳給命盤計算。
+#
+# 輸出每行一筆：{"id", "ok", "chart_hash", "question", "cached", "interpretation"}，失敗時為 {"id", "ok": false, "error", ...}。
+#
+# 用法：
+#   python bulk_interpreter.py people.csv -o results.jsonl --workers 8 --rpm 60
+#   python bulk_interpreter.py people.jsonl --source local --model stub
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from rich.console import Console
+from urllib3.util.retry import Retry
+
+import chart_prompt
+import gemini_interpreter
+from gemini_interpreter import InterpretationError, MODEL_CLIENTS, RETRYABLE_STATUS_CODES
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "interpretations")
+DEFAULT_PLANETS = ("凱龍", "莉莉絲", "福點")
+# 只用來標示資料列、不傳給命盤計算的欄位
+RECORD_ONLY_KEYS = ("id", "question")
+
+
+# ==============================================================================
+# --- 輸入資料 ---
+# ==============================================================================
+
+def _csv_record(row: dict) -> dict:
+    """CSV 的一列：去掉空白欄位；數值欄位保留字串，由命盤計算（與 API 相同）轉型。"""
+    record = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+    if "optional_planets" in record:
+        record["optional_planets"] = record["optional_planets"].replace(";", " ").split()
+    return record
+
+
+def read_records(path: str) -> list:
+    """讀入出生資料（.csv，其他副檔名視為 JSONL），回傳 dict 列表；未提供 id 時以資料列編號（從 1 起）為 id。"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            records = [_csv_record(row) for row in csv.DictReader(f)]
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    for number, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            raise ValueError(f"第 {number} 筆資料必須是 JSON 物件")
+        record.setdefault("id", number)
+    return records
+
+
+def chart_payload(record: dict, fields=chart_prompt.PROMPT_FIELDS, optional_planets=DEFAULT_PLANETS) -> dict:
+    """資料列轉為 /api/v1/chart/single 的請求內容；預設只取回提示會用到的欄位。"""
+    payload = {key: value for key, value in record.items() if key not in RECORD_ONLY_KEYS}
+    payload.setdefault("optional_planets", list(optional_planets))
+    if fields:
+        payload.setdefault("fields", ",".join(fields))
+    return payload
+
+
+# ==============================================================================
+# --- 命盤來源 ---
+# ==============================================================================
+
+class ApiChartSource:
+    """
+    以共用的 requests.Session 呼叫星盤 API：連線池大小與同時請求數相同，連線可重複使用。
+    命盤計算沒有副作用，POST 也可以安全重試。
+    """
+
+    def __init__(self, workers=4, retries=3, backoff=1.0, timeout=60):
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=sorted(RETRYABLE_STATUS_CODES),
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _fetch_one(self, payload):
+        try:
+            return gemini_interpreter.get_chart_data_from_api(payload, session=self.session, timeout=self.timeout), None
+        except requests.exceptions.HTTPError as e:
+            try:
+                detail = e.response.json()["error"]
+            except (ValueError, KeyError, TypeError):
+                detail = e.response.text[:200]
+            return None, f"星盤 API 回應錯誤 {e.response.status_code}: {detail}"
+        except requests.exceptions.RequestException as e:
+            return None, f"無法連接星盤 API: {e}"
+
+    def fetch(self, payloads: list) -> list:
+        """回傳與 payloads 對應的 (命盤, 錯誤訊息) 列表。"""
+        if not gemini_interpreter.ASTRO_API_KEY:
+            raise ValueError("錯誤：請在 .env 檔案中設定 ASTRO_API_KEY，或改用 --source local。")
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            return list(pool.map(self._fetch_one, payloads))
+
+    def close(self):
+        self.session.close()
+
+
+class LocalChartSource:
+    """在本行程內計算命盤（astro_engine.calculate_astrology_chart_batch），每筆的錯誤只記錄在該筆。"""
+
+    def fetch(self, payloads: list) -> list:
+        import astro_engine  # 只有使用本地來源時才載入星曆與 numpy
+
+        results = astro_engine.calculate_astrology_chart_batch(payloads)
+        return [(result["chart"], None) if result["ok"] else (None, result["error"]) for result in results]
+
+    def close(self):
+        pass
+
+
+# ==============================================================================
+# --- 限流、重試與快取 ---
+# ==============================================================================
+
+class RateLimiter:
+    """每分鐘最多 rpm 個請求：依序分配送出時刻（間隔 60 / rpm 秒），多個執行緒共用。rpm 為 0 時不限制。"""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def interpret_with_retry(client, prompt: str, limiter: RateLimiter, retries=3, backoff=1.0) -> str:
+    """取得完整解讀；暫時性錯誤以 backoff * 2^n 秒（加上最多一倍的隨機抖動）退避後重試。"""
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return client.generate(prompt)
+        except InterpretationError as e:
+            if not e.retryable or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+
+def chart_hash(chart: dict) -> str:
+    """命盤的雜湊：取自提示中的命盤文字，API 與本地計算的同一張命盤得到相同的值。"""
+    return hashlib.sha256(chart_prompt.chart_to_text(chart).encode("utf-8")).hexdigest()
+
+
+def cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(json.dumps([model_name, prompt], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class InterpretationCache:
+    """解讀結果的磁碟快取：每個鍵一個 JSON 檔，先寫入暫存檔再 os.replace，中斷時不會留下不完整的檔案。"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """回傳快取的解讀文字；沒有或檔案損壞時回傳 None。"""
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)["interpretation"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key: str, entry: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+# ==============================================================================
+# --- 大量解讀 ---
+# ==============================================================================
+
+def run_bulk(records: list, chart_source, client, cache: InterpretationCache, default_question=None,
+             workers=4, rpm=60, retries=3, backoff=1.0, fields=chart_prompt.PROMPT_FIELDS,
+             optional_planets=DEFAULT_PLANETS) -> list:
+    """
+    取得所有命盤後同時進行解讀，回傳與 records 順序對應的結果列表。
+    已有快取的解讀不會呼叫模型；同一次執行中「模型 + 提示」相同的資料列共用一次解讀。
+    """
+    charts = chart_source.fetch([chart_payload(record, fields, optional_planets) for record in records])
+
+    results = []
+    jobs = {}  # 快取鍵 -> (提示, 命盤雜湊, 問題, [結果索引])
+    for index, (record, (chart, error)) in enumerate(zip(records, charts)):
+        if error is not None:
+            results.append({"id": record["id"], "ok": False, "error": error})
+            continue
+        question = record.get("question") or default_question
+        prompt = gemini_interpreter.build_prompt(chart, question)
+        digest = chart_hash(chart)
+        result = {"id": record["id"], "chart_hash": digest, "question": question}
+        results.append(result)
+        key = cache_key(client.name, prompt)
+        interpretation = cache.get(key)
+        if interpretation is not None:
+            result.update(ok=True, cached=True, interpretation=interpretation)
+        else:
+            jobs.setdefault(key, (prompt, digest, question, []))[3].append(index)
+
+    if jobs:
+        limiter = RateLimiter(rpm)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(interpret_with_retry, client, prompt, limiter, retries, backoff): key
+                       for key, (prompt, _, _, _) in jobs.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                _, digest, question, indexes = jobs[key]
+                try:
+                    interpretation = future.result()
+                except Exception as e:
+                    update = {"ok": False, "error": str(e)}
+                else:
+                    cache.put(key, {"model": client.name, "chart_hash": digest, "question": question,
+                                    "interpretation": interpretation})
+                    update = {"ok": True, "cached": False, "interpretation": interpretation}
+                for index in indexes:
+                    results[index].update(update)
+    return results
+
+
+def write_results(results: list, output):
+    for result in results:
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="大量取得星盤並由語言模型解讀，結果寫成 JSONL。",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input", help="出生資料檔（.csv 或 .jsonl）")
+    parser.add_argument("-o", "--output", default="-", help="結果 JSONL 檔案；- 為標準輸出")
+    parser.add_argument("--source", choices=("api", "local"), default="api",
+                        help="命盤來源：api 呼叫星盤 API，local 在本行程內計算")
+    parser.add_argument("--model", choices=sorted(MODEL_CLIENTS), default="gemini", help="解讀使用的模型；stub 為不連網的本地替身")
+    parser.add_argument("-q", "--question", type=str, help="資料列沒有 question 欄位時使用的問題")
+    parser.add_argument("--planets", nargs="*", default=list(DEFAULT_PLANETS), help="資料列沒有 optional_planets 欄位時計算的額外星體")
+    parser.add_argument("--workers", type=int, default=4, help="同時進行的命盤請求與解讀數")
+    parser.add_argument("--rpm", type=float, default=60, help="每分鐘最多送出的模型請求數；0 為不限制")
+    parser.add_argument("--retries", type=int, default=3, help="暫時性錯誤的重試次數")
+    parser.add_argument("--backoff", type=float, default=1.0, help="第一次重試前等待的秒數，之後每次加倍")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="解讀快取目錄")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    console = Console(stderr=True)
+    args = parse_arguments()
+    chart_source = None
+    try:
+        records = read_records(args.input)
+        client = MODEL_CLIENTS[args.model]()
+        if args.source == "api":
+            chart_source = ApiChartSource(args.workers, args.retries, args.backoff)
+        else:
+            chart_source = LocalChartSource()
+
+        started = time.perf_counter()
+        with console.status(f"[bold yellow]正在解讀 {len(records)} 筆資料...", spinner="dots"):
+            results = run_bulk(records, chart_source, client, InterpretationCache(args.cache_dir),
+                               default_question=args.question, workers=args.workers, rpm=args.rpm,
+                               retries=args.retries, backoff=args.backoff, optional_planets=args.planets)
+        if args.output == "-":
+            write_results(results, sys.stdout)
+        else:
+            with open(args.output, "w", encoding="utf-8") as f:
+                write_results(results, f)
+
+        succeeded = sum(1 for result in results if result["ok"])
+        cached = sum(1 for result in results if result.get("cached"))
+        console.print(f"[bold green]完成 {len(results)} 筆[/bold green]：成功 {succeeded}（快取 {cached}）、"
+                      f"失敗 {len(results) - succeeded}，耗時 {time.perf_counter() - started:.1f} 秒")
+        for result in results:
+            if not result["ok"]:
+                console.print(f"[red]  {result['id']}: {result['error']}[/red]")
+    except (OSError, ValueError) as e:
+        # 讀不到輸入檔、輸入格式錯誤，或缺少 API 金鑰等設定
+        console.print(f"\n[bold red]❌ {e}[/bold red]")
+        raise SystemExit(1)
+    finally:
+        if chart_source is not None:
+            chart_source.close()
@@ -0,0 +1,89 @@
+# chart_cache.py
+# 行程內的星盤計算快取：有容量上限 (LRU) 與存活時間 (TTL)，並記錄命中／未命中次數。
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = int(os.getenv("ASTRO_CACHE_SIZE", "4096"))
+DEFAULT_TTL_SECONDS = float(os.getenv("ASTRO_CACHE_TTL", "3600"))
+
+
+class LRUCache:
+    """
+    執行緒安全的 LRU 快取。max_size 為 0 時停用快取；ttl_seconds 為 0 或負數時不過期。
+    值不可為 None，get() 以 None 表示未命中。
+    """
+
+    def __init__(self, name, max_size=DEFAULT_MAX_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data), "max_size": self.max_size, "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+
+# 當地時間換算為 UTC 的結果，鍵為 (時區名稱, 不含時區的當地時間)
+TIMEZONE_CACHE = LRUCache("timezones")
+# 依 UTC 時刻計算的儒略日與 delta-T，鍵為 (年, 月, 日, 時, 分, 秒)
+TIME_CACHE = LRUCache("time")
+# 單一天體的位置與速度，鍵為 (儒略日 UT, 天體 ID)，與經緯度無關，不同的選星組合可以共用
+POSITION_CACHE = LRUCache("positions", max_size=DEFAULT_MAX_SIZE * 8)
+# 宮位與四軸，鍵為 (儒略日 TT, 緯度, 經度, 分宮制)
+HOUSE_CACHE = LRUCache("houses")
+
+ALL_CACHES = (TIMEZONE_CACHE, TIME_CACHE, POSITION_CACHE, HOUSE_CACHE)
+
+
+def cache_stats():
+    """回傳所有快取的統計資料，供監控端點使用。"""
+    return {cache.name: cache.stats() for cache in ALL_CACHES}
+
+
+def clear_all():
+    for cache in ALL_CACHES:
+        cache.clear()
@@ -0,0 +1,117 @@
+# chart_fields.py
+# 稀疏欄位選擇 (sparse fieldset)：請求以 fields 指定要回傳哪些欄位，
+# 計算時略過沒被要求的工作（相位、宮位落點、顯示字串、時間字串等），回應也只包含這些欄位。
+#
+# fields 可以是逗號分隔的字串或字串列表，欄位名稱有三種：
+#   命盤欄位      local_time、house_cusps、planet_positions、aspects ...（CHART_FIELDS）
+#   星體子欄位    planet_positions.lon、planet_positions.house ...（PLANET_FIELDS）；
+#                只寫 planet_positions 表示全部子欄位
+#   端點區段      inter_aspects、overlays、summary 等，依端點而定
+# 相位的 p1_details / p2_details 只保留選取的星體子欄位；完全沒有選取星體欄位時不輸出。
+# 未提供 fields 時回傳全部欄位，輸出與原本相同。
+
+CHART_FIELDS = (
+    "local_time", "utc_time", "julian_day_ut", "delta_t_seconds", "julian_day_tt",
+    "latitude", "longitude", "ephemeris_path_status", "debug_info", "house_system",
+    "house_cusps", "planet_positions", "aspects", "chart_image_b64",
+)
+PLANET_FIELDS = ("lon", "speed", "house", "hdeg", "is_retrograde", "retrograde_label", "zodiac_position_formatted")
+PLACEMENT_FIELDS = ("house", "hdeg")
+
+
+class FieldSelection:
+    """選取的命盤欄位、星體子欄位與端點區段。"""
+    __slots__ = ("chart", "planet", "sections", "is_all")
+
+    def __init__(self, chart=CHART_FIELDS, planet=PLANET_FIELDS, sections=(), is_all=False):
+        self.chart = frozenset(chart)
+        self.planet = frozenset(planet)
+        self.sections = frozenset(sections)
+        self.is_all = is_all
+
+    def wants(self, name) -> bool:
+        return self.is_all or name in self.chart or name in self.sections
+
+    def wants_any(self, *names) -> bool:
+        return any(self.wants(name) for name in names)
+
+    def wants_planet(self, name) -> bool:
+        return self.is_all or ("planet_positions" in self.chart and name in self.planet)
+
+    @property
+    def needs_placement(self) -> bool:
+        return any(self.wants_planet(name) for name in PLACEMENT_FIELDS)
+
+    def widened(self, chart=(), planet=()):
+        """
+        計算用的選擇：在使用者的選擇之外，加上後續計算（跨盤相位、宮位落點、組合盤）需要的欄位。
+        回應仍以原本的選擇 apply 過濾。
+        """
+        if self.is_all:
+            return self
+        return FieldSelection(self.chart | set(chart), self.planet | set(planet), self.sections)
+
+    def select(self, chart: dict) -> dict:
+        """只保留選取的最上層欄位。"""
+        if self.is_all:
+            return chart
+        return {key: value for key, value in chart.items() if key in self.chart}
+
+    def filter_planet(self, info: dict) -> dict:
+        if self.is_all:
+            return info
+        return {key: value for key, value in info.items() if key in self.planet}
+
+    def filter_aspects(self, aspects: list) -> list:
+        if self.is_all:
+            return aspects
+        if "planet_positions" not in self.chart or not self.planet:
+            return [{key: value for key, value in asp.items() if key not in ("p1_details", "p2_details")} for asp in aspects]
+        return [{**asp, "p1_details": self.filter_planet(asp["p1_details"]), "p2_details": self.filter_planet(asp["p2_details"])}
+                for asp in aspects]
+
+    def apply(self, chart: dict) -> dict:
+        """將計算結果過濾為選取的欄位（不修改傳入的 dict）。"""
+        if self.is_all or "error" in chart:
+            return chart
+        selected = self.select(chart)
+        if "planet_positions" in selected:
+            selected["planet_positions"] = {name: self.filter_planet(info) for name, info in selected["planet_positions"].items()}
+        if "aspects" in selected:
+            selected["aspects"] = self.filter_aspects(selected["aspects"])
+        return selected
+
+
+ALL_FIELDS = FieldSelection(is_all=True)
+
+
+def parse_fields(value, sections=()):
+    """
+    解析請求中的 fields。未提供時回傳 ALL_FIELDS。
+    sections 為該端點額外可選的區段名稱；無法辨識的欄位名稱拋出 ValueError。
+    """
+    if value is None or value == "" or value == []:
+        return ALL_FIELDS
+    if isinstance(value, str):
+        names = [name.strip() for name in value.split(",") if name.strip()]
+    elif isinstance(value, (list, tuple)) and all(isinstance(name, str) for name in value):
+        names = [name.strip() for name in value]
+    else:
+        raise ValueError("fields 必須是逗號分隔的字串或字串列表")
+
+    chart, planet, chosen_sections = set(), set(), set()
+    for name in names:
+        if name == "planet_positions":
+            chart.add(name)
+            planet.update(PLANET_FIELDS)
+        elif name in CHART_FIELDS:
+            chart.add(name)
+        elif name.startswith("planet_positions.") and name.split(".", 1)[1] in PLANET_FIELDS:
+            chart.add("planet_positions")
+            planet.add(name.split(".", 1)[1])
+        elif name in sections:
+            chosen_sections.add(name)
+        else:
+            available = list(CHART_FIELDS) + [f"planet_positions.{field}" for field in PLANET_FIELDS] + list(sections)
+            raise ValueError(f"無效的欄位 '{name}'。可用的欄位: {', '.join(available)}")
+    return FieldSelection(chart, planet, chosen_sections)
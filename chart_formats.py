@@ -0,0 +1,182 @@
+# chart_formats.py
+# AI API 的精簡輸出格式。
+#
+# 預設的 JSON 中，每個相位都重複帶著 p1_details / p2_details，同一顆星的資料會重複很多次。
+# 這裡提供：
+#   normalized  星體列表 + 以索引引用星體的相位列表（JSON 或 MessagePack）
+#   columnar    批次結果的欄式表格：charts / house_cusps / planets / aspects 各為 {欄位: [值, ...]}，
+#               相位的 p1 / p2 是 planets 表格的列索引（JSON 或 MessagePack）
+#
+# 格式由 Accept 標頭或 ?format= 查詢參數決定；MessagePack 需要安裝 msgpack 套件。
+try:
+    import msgpack
+except ImportError:  # msgpack 為選用套件，未安裝時不提供 MessagePack 格式
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+NORMALIZED_MIMETYPE = "application/vnd.astro.normalized+json"
+COLUMNAR_MIMETYPE = "application/vnd.astro.columnar+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# ?format= 參數可用的名稱 -> MIME 類型
+FORMAT_ALIASES = {
+    "json": JSON_MIMETYPE,
+    "normalized": NORMALIZED_MIMETYPE,
+    "columnar": COLUMNAR_MIMETYPE,
+    "msgpack": MSGPACK_MIMETYPE,
+}
+_MIMETYPE_ALIASES = {"application/x-msgpack": MSGPACK_MIMETYPE, "application/vnd.msgpack": MSGPACK_MIMETYPE}
+
+_ASPECT_REFERENCE_KEYS = ("p1_name", "p2_name", "p1_details", "p2_details")
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def available_mimetypes(columnar=False):
+    mimetypes = [JSON_MIMETYPE, NORMALIZED_MIMETYPE]
+    if columnar:
+        mimetypes.append(COLUMNAR_MIMETYPE)
+    if msgpack is not None:
+        mimetypes.append(MSGPACK_MIMETYPE)
+    return mimetypes
+
+
+def negotiate(request, columnar=False):
+    """
+    依 ?format= 或 Accept 標頭選出回應格式（MIME 類型）。沒有指定時為一般 JSON。
+    明確指定了不支援的格式時拋出 UnsupportedFormat。
+    """
+    allowed = available_mimetypes(columnar)
+    requested = request.args.get("format")
+    if requested:
+        mimetype = FORMAT_ALIASES.get(requested.lower())
+        if mimetype not in allowed:
+            raise UnsupportedFormat(f"不支援的格式 '{requested}'，可用: {', '.join(_format_names(allowed))}")
+        return mimetype
+    accept = request.accept_mimetypes
+    # 其他常見的 MessagePack MIME 名稱（只認明確列出的，*/* 不算）
+    for value, quality in accept:
+        if quality > 0 and _MIMETYPE_ALIASES.get(value) in allowed:
+            return _MIMETYPE_ALIASES[value]
+    if not accept.provided:
+        return JSON_MIMETYPE
+    best = accept.best_match(allowed)
+    if best is None:
+        raise UnsupportedFormat(f"無法提供 Accept 要求的格式，可用: {', '.join(allowed)}")
+    return best
+
+
+def _format_names(mimetypes):
+    return [name for name, mimetype in FORMAT_ALIASES.items() if mimetype in mimetypes]
+
+
+def normalize_chart(raw_chart: dict) -> dict:
+    """
+    將原始命盤轉為正規化結構：planet_positions 變成含 name 的列表，
+    aspects 以 p1 / p2 索引引用該列表，不再重複星體資料。其他欄位原樣保留。
+    """
+    planets, index_of = [], {}
+    for name, info in raw_chart.get("planet_positions", {}).items():
+        index_of[name] = len(planets)
+        planets.append({"name": name, **info})
+
+    aspects = []
+    for asp in raw_chart.get("aspects", []):
+        refs = []
+        for name_key, details_key in (("p1_name", "p1_details"), ("p2_name", "p2_details")):
+            name = asp[name_key]
+            if name not in index_of:
+                # 相位引用了不在輸出星體列表中的點時，補進列表以維持索引完整
+                index_of[name] = len(planets)
+                planets.append({"name": name, **(asp.get(details_key) or {})})
+            refs.append(index_of[name])
+        aspects.append({"p1": refs[0], "p2": refs[1],
+                        **{key: value for key, value in asp.items() if key not in _ASPECT_REFERENCE_KEYS}})
+
+    normalized = {key: value for key, value in raw_chart.items() if key not in ("planet_positions", "aspects")}
+    if "house_cusps" in normalized:
+        normalized["house_cusps"] = [normalized["house_cusps"][i] for i in range(1, 13)]
+    normalized["planets"] = planets
+    normalized["aspects"] = aspects
+    return normalized
+
+
+def normalize_batch(batch: dict) -> dict:
+    results = []
+    for item in batch["results"]:
+        if item.get("ok"):
+            item = {**item, "chart": normalize_chart(item["chart"])}
+        results.append(item)
+    return {**batch, "results": results}
+
+
+_CHART_COLUMNS = ("local_time", "utc_time", "julian_day_ut", "julian_day_tt", "delta_t_seconds",
+                  "latitude", "longitude", "house_system")
+_PLANET_COLUMNS = ("lon", "speed", "house", "hdeg", "is_retrograde")
+
+
+def columnar_batch(batch: dict) -> dict:
+    """
+    批次結果轉為欄式表格。失敗的命盤只出現在 charts 表格（ok 為 False、error 有值）。
+    planets.chart / aspects.chart 為所屬命盤在 charts 表格中的列索引；
+    aspects.p1 / aspects.p2 為 planets 表格的列索引。格式化字串（星座度數、逆行標籤）可由數值推得，不重複輸出。
+    """
+    charts = {"index": [], "ok": [], "error": [], **{column: [] for column in _CHART_COLUMNS}}
+    house_cusps = []
+    planets = {"chart": [], "name": [], **{column: [] for column in _PLANET_COLUMNS}}
+    aspects = {"chart": [], "p1": [], "p2": [], "aspect_name": [], "aspect_type": [], "orb": [], "perfection_jd_ut": []}
+
+    for row, item in enumerate(batch["results"]):
+        chart = item.get("chart") if item.get("ok") else None
+        charts["index"].append(item.get("index", row))
+        charts["ok"].append(chart is not None)
+        charts["error"].append(None if chart is not None else item.get("error"))
+        for column in _CHART_COLUMNS:
+            charts[column].append(chart.get(column) if chart is not None else None)
+        if chart is None:
+            house_cusps.append(None)
+            continue
+        cusps = chart.get("house_cusps") or {}
+        house_cusps.append([cusps[i] for i in range(1, 13)] if cusps else None)
+
+        index_of = {}
+        for name, info in chart.get("planet_positions", {}).items():
+            index_of[name] = len(planets["name"])
+            planets["chart"].append(row)
+            planets["name"].append(name)
+            for column in _PLANET_COLUMNS:
+                planets[column].append(info.get(column))
+        for asp in chart.get("aspects", []):
+            for name_key, details_key in (("p1_name", "p1_details"), ("p2_name", "p2_details")):
+                name = asp[name_key]
+                if name not in index_of:
+                    details = asp.get(details_key) or {}
+                    index_of[name] = len(planets["name"])
+                    planets["chart"].append(row)
+                    planets["name"].append(name)
+                    for column in _PLANET_COLUMNS:
+                        planets[column].append(details.get(column))
+            aspects["chart"].append(row)
+            aspects["p1"].append(index_of[asp["p1_name"]])
+            aspects["p2"].append(index_of[asp["p2_name"]])
+            aspects["aspect_name"].append(asp["aspect_name"])
+            aspects["aspect_type"].append(asp["aspect_type"])
+            aspects["orb"].append(asp["orb"])
+            aspects["perfection_jd_ut"].append(asp.get("perfection_jd_ut"))
+
+    # 沒有要求精確成相時刻 (aspect_timing) 時省略該欄
+    if not any(value is not None for value in aspects["perfection_jd_ut"]):
+        del aspects["perfection_jd_ut"]
+
+    return {
+        "format": "columnar", "count": batch.get("count"), "failed": batch.get("failed"),
+        "charts": charts, "house_cusps": house_cusps, "planets": planets, "aspects": aspects,
+    }
+
+
+def pack(payload) -> bytes:
+    if msgpack is None:
+        raise UnsupportedFormat("伺服器未安裝 msgpack，無法提供 MessagePack 格式")
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,160 @@
+# chart_metrics.py
+# 星盤計算各階段的耗時統計（時間轉換、swe.calc_ut、swe.houses、相位、格式化、jsonify…），
+# 以 Prometheus 文字格式輸出，並可在單一請求中收集耗時明細放進 debug_info。
+#
+# ASTRO_METRICS=1 時啟用全域統計。未啟用且該請求沒有要求明細時，stage() 回傳共用的空物件，
+# 只多一次 ContextVar 讀取，幾乎沒有額外成本。
+# 注意：使用行程池計算後端時，工作行程內的階段耗時不會回傳到主行程的統計。
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.getenv("ASTRO_METRICS", "0").lower() not in ("0", "", "false", "no")
+
+# 直方圖的上界（秒）
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_current_trace = contextvars.ContextVar("astro_chart_trace", default=None)
+_lock = threading.Lock()
+
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "total", "count")
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                self.bucket_counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+_stage_histograms = {}
+_request_histograms = {}
+
+
+def _observe(histograms, label, seconds):
+    with _lock:
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = _Histogram()
+        histogram.observe(seconds)
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if ENABLED:
+            _observe(_stage_histograms, self.name, elapsed)
+        timings = _current_trace.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed * 1000
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """用法：with chart_metrics.stage("calc_ut"): ...（未啟用時不做任何事）"""
+    if ENABLED or _current_trace.get() is not None:
+        return _StageTimer(name)
+    return _NULL_STAGE
+
+
+def timed(name):
+    """函式裝飾器版本的 stage()。"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace():
+    """在 with 區塊內收集每個階段的耗時（毫秒），產生 {階段: 毫秒} 字典。"""
+    timings = {}
+    token = _current_trace.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_trace.reset(token)
+
+
+def observe_request(endpoint, seconds):
+    if ENABLED:
+        _observe(_request_histograms, endpoint or "unknown", seconds)
+
+
+def _format_histogram(lines, metric, label_name, histograms):
+    for label, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for upper, count in zip(BUCKETS, histogram.bucket_counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{label_name}="{label}",le="{upper}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{label_name}="{label}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{metric}_sum{{{label_name}="{label}"}} {histogram.total}')
+        lines.append(f'{metric}_count{{{label_name}="{label}"}} {histogram.count}')
+
+
+def render_prometheus(cache_stats=None):
+    """輸出 Prometheus text exposition format (0.0.4)。cache_stats 為 chart_cache.cache_stats() 的結果。"""
+    lines = [
+        "# HELP astro_stage_seconds Time spent in each chart computation stage.",
+        "# TYPE astro_stage_seconds histogram",
+    ]
+    with _lock:
+        _format_histogram(lines, "astro_stage_seconds", "stage", _stage_histograms)
+        lines += [
+            "# HELP astro_request_seconds Total request handling time per endpoint.",
+            "# TYPE astro_request_seconds histogram",
+        ]
+        _format_histogram(lines, "astro_request_seconds", "endpoint", _request_histograms)
+
+    if cache_stats:
+        for key, kind, help_text in (
+                ("hits", "counter", "Chart cache hits."), ("misses", "counter", "Chart cache misses."),
+                ("evictions", "counter", "Chart cache evictions."), ("size", "gauge", "Chart cache entries.")):
+            metric = f"astro_cache_{key}_total" if kind == "counter" else f"astro_cache_{key}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for cache_name, stats in sorted(cache_stats.items()):
+                lines.append(f'{metric}{{cache="{cache_name}"}} {stats[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _stage_histograms.clear()
+        _request_histograms.clear()
@@ -0,0 +1,119 @@
+# chart_prompt.py
+# 把 /api/v1/chart/single 回傳的命盤 JSON 轉成精簡的純文字，放進給語言模型的提示。
+#
+# json.dumps(indent=2) 的提示裡大部分是縮排空白、重複的鍵名，以及每個相位附帶的 p1_details / p2_details
+# （與星體列表完全重複的位置資料）。這裡改為每個星體、每個相位一行，欄位順序固定、只在標題列說明一次：
+#   星體   名稱 星座度數(到角分) 宮位 速度(度/日)，逆行加上 R
+#   相位   星體A 相位 星體B 容許度 入相/出相 [精確成相時刻]
+#   宮頭   12 個宮頭的星座度數
+# 捨棄的只有與解讀無關的欄位（星曆路徑狀態、圖片佔位字串）與可由其他欄位推出的值
+# （宮內度數 hdeg、逆行標籤、由 UTC 時間決定的儒略日與 delta-T、重複的相位星體資料）；
+# 無法辨識的欄位以精簡 JSON 原樣保留。
+import json
+
+from display_format import zodiac_format
+
+# 星體的輸出順序；其他點依名稱排在後面
+PLANET_ORDER = (
+    "太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "天王", "海王", "冥王",
+    "上升", "下降", "天頂", "天底", "宿命", "福點", "北交", "南交",
+)
+# 命盤 API 可以只取回這些欄位（fields），其餘欄位不會出現在提示中；
+# 只取需要的星體子欄位，也讓相位的 p1_details / p2_details 跟著變小
+PROMPT_FIELDS = ("local_time", "utc_time", "latitude", "longitude", "house_system", "debug_info", "house_cusps",
+                 "planet_positions.zodiac_position_formatted", "planet_positions.house", "planet_positions.speed",
+                 "planet_positions.is_retrograde", "aspects")
+# 不放進提示的欄位：與解讀無關，或已由其他欄位表達
+OMITTED_KEYS = frozenset({"ephemeris_path_status", "chart_image_b64", "julian_day_ut", "julian_day_tt", "delta_t_seconds"})
+
+
+def _compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _position(info: dict) -> str:
+    formatted = info.get("zodiac_position_formatted")
+    if formatted:
+        return formatted
+    return zodiac_format(info["lon"]) if isinstance(info.get("lon"), (int, float)) else "?"
+
+
+def _planet_sort_key(name: str):
+    return (PLANET_ORDER.index(name), "") if name in PLANET_ORDER else (len(PLANET_ORDER), name)
+
+
+def _planet_line(name: str, info: dict) -> str:
+    parts = [name, _position(info)]
+    if info.get("house") is not None:
+        parts.append(f"{info['house']}宮")
+    speed = info.get("speed")
+    if isinstance(speed, (int, float)) and speed != 0:
+        parts.append(f"{speed:+.2f}")
+    if info.get("is_retrograde"):
+        parts.append("R")
+    return " ".join(parts)
+
+
+def _aspect_pair(asp: dict):
+    """相位的兩個星體依 PLANET_ORDER 排列；相位引擎的星體順序取決於集合的迭代順序，每次執行可能不同。"""
+    return tuple(sorted((asp["p1_name"], asp["p2_name"]), key=_planet_sort_key))
+
+
+def _aspect_line(asp: dict) -> str:
+    first, second = _aspect_pair(asp)
+    parts = [first, asp["aspect_name"], second]
+    if isinstance(asp.get("orb"), (int, float)):
+        parts.append(f"{asp['orb']:.2f}°")
+    if asp.get("aspect_type"):
+        parts.append(asp["aspect_type"])
+    if asp.get("perfection_utc_time"):
+        parts.append(f"成相{asp['perfection_utc_time']}")
+    return " ".join(parts)
+
+
+def chart_to_text(chart: dict) -> str:
+    """命盤 JSON（/api/v1/chart/single 的回應）轉為精簡的多行文字；同一張命盤每次都得到相同的文字。"""
+    lines = []
+    handled = set(OMITTED_KEYS)
+    if chart.get("local_time") or chart.get("utc_time"):
+        lines.append(f"時間: {chart.get('local_time') or ''}（UTC {chart.get('utc_time') or '?'}）")
+        handled.update(("local_time", "utc_time"))
+    if "latitude" in chart and "longitude" in chart:
+        lines.append(f"地點: 緯度 {chart['latitude']:.2f} 經度 {chart['longitude']:.2f}")
+        handled.update(("latitude", "longitude"))
+    settings = []
+    if chart.get("house_system"):
+        settings.append(f"分宮制 {chart['house_system']}")
+    debug_info = chart.get("debug_info") or {}
+    if "is_day_chart" in debug_info:
+        settings.append("日間盤" if debug_info["is_day_chart"] else "夜間盤")
+    extra_debug = {key: value for key, value in debug_info.items() if key != "is_day_chart"}
+    if extra_debug:
+        settings.append(_compact_json(extra_debug))
+    if settings:
+        lines.append("設定: " + "，".join(settings))
+    handled.update(("house_system", "debug_info"))
+
+    cusps = chart.get("house_cusps")
+    if isinstance(cusps, dict) and cusps:
+        ordered = sorted(cusps.items(), key=lambda item: int(item[0]))
+        lines.append("宮頭: " + " ".join(f"{house}宮{zodiac_format(lon)}" for house, lon in ordered))
+        handled.add("house_cusps")
+
+    planets = chart.get("planet_positions")
+    if isinstance(planets, dict):
+        lines.append("星體（名稱 位置 宮位 速度°/日，R=逆行）:")
+        lines.extend(_planet_line(name, planets[name]) for name in sorted(planets, key=_planet_sort_key))
+        handled.add("planet_positions")
+
+    aspects = chart.get("aspects")
+    if isinstance(aspects, list):
+        lines.append("相位（星體 相位 星體 容許度 入相/出相）:")
+        ordered = sorted(aspects, key=lambda asp: [_planet_sort_key(name) for name in _aspect_pair(asp)])
+        lines.extend(_aspect_line(asp) for asp in ordered)
+        handled.add("aspects")
+
+    for key, value in chart.items():
+        if key not in handled and value is not None:
+            lines.append(f"{key}: {_compact_json(value)}")
+    return "\n".join(lines)
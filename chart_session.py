@@ -0,0 +1,160 @@
+# chart_session.py
+# 增量重算的命盤工作階段：網頁介面拖動出生時間、切換鄰近城市時，保留上一次的輸入與星體位置，
+# 下一次只重算受影響的部分，並回傳與上一次結果的差異（星體、宮頭、相位）。
+#
+#   只改地點（經緯度）          星體位置與時間無關於地點，直接沿用；只重算宮位、四軸，以及相依的福點、落宮、相位
+#   時間變動在 MAX_EXTRAPOLATION_DAYS 內
+#                               星體位置由錨點（最近一次精確計算）的黃經與速度線性外推；宮位與四軸照常重算。
+#                               接近停滯（速度很小、可能轉為逆行）的天體仍精確計算
+#   其他變動（選星、時區以外的設定、分宮制、精度、欄位…）或時間變動過大
+#                               全部重算，並以結果作為新的錨點
+#
+# 外推永遠從錨點出發，不會累積誤差。月亮加速度最大約 0.3°/日²，一小時內的外推誤差小於 1″，
+# 顯示到角分的星座度數與精確計算相同。
+#
+# 工作階段存在行程記憶體中（有容量上限與存活時間）；多 worker 部署時請求若落到其他 worker，
+# 會回傳 404 session_not_found，客戶端重新建立即可。
+import os
+import threading
+import uuid
+
+import chart_cache
+
+MAX_SESSIONS = int(os.getenv("ASTRO_MAX_CHART_SESSIONS", "1024"))
+SESSION_TTL_SECONDS = float(os.getenv("ASTRO_CHART_SESSION_TTL", "1800"))
+# 允許由錨點外推的最大時間差（日）
+MAX_EXTRAPOLATION_DAYS = 1 / 24
+# 速度（度/日）小於此值的天體視為接近停滯，時間變動時仍精確計算。
+# 一小時內行星速度的變化最多約 0.01°/日（停滯附近的水星），速度更小的天體可能在外推期間轉為逆行。
+STATIONARY_SPEED = 0.01
+
+# 出生時間與地點的輸入；除此之外的輸入任何一個改變都要全部重算
+TIME_KEYS = ("year", "month", "day", "hour", "minute", "timezone")
+LOCATION_KEYS = ("latitude", "longitude")
+# 只影響回應、不屬於命盤輸入的欄位
+TRANSIENT_KEYS = ("include_chart", "debug_timing")
+
+SESSIONS = chart_cache.LRUCache("chart_sessions", max_size=MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS)
+
+
+class ChartSession:
+    """一個工作階段：目前的輸入、儒略日、使用中的星體位置、錨點與上一次的顯示用命盤。"""
+
+    def __init__(self, inputs, jd_ut, positions, chart):
+        self.lock = threading.Lock()
+        self.inputs = inputs
+        self.jd_ut = jd_ut
+        self.positions = positions
+        self.anchor_jd = jd_ut
+        self.anchor_positions = positions
+        self.chart = chart
+
+    def classify(self, inputs, jd_ut):
+        """
+        判斷新的輸入需要重算哪些部分：
+        "none"（沒有變動）、"location"（只重算宮位）、"time"（外推星體位置）或 "full"（全部重算）。
+        """
+        other_keys = (set(self.inputs) | set(inputs)) - set(TIME_KEYS) - set(LOCATION_KEYS)
+        if any(self.inputs.get(key) != inputs.get(key) for key in other_keys):
+            return "full"
+        location_changed = any(float(self.inputs[key]) != float(inputs[key]) for key in LOCATION_KEYS)
+        if jd_ut == self.jd_ut:
+            return "location" if location_changed else "none"
+        if abs(jd_ut - self.anchor_jd) <= MAX_EXTRAPOLATION_DAYS:
+            return "time"
+        return "full"
+
+    def extrapolate(self, jd_ut):
+        """
+        由錨點外推 jd_ut 的星體位置，回傳 ((黃經 dict, 速度 dict), 接近停滯而需要精確計算的天體名稱)。
+        速度沿用錨點的值。
+        """
+        anchor_lons, anchor_speeds = self.anchor_positions
+        dt = jd_ut - self.anchor_jd
+        lons, speeds, stationary = {}, {}, []
+        for name, lon in anchor_lons.items():
+            speed = anchor_speeds.get(name, 0.0)
+            if abs(speed) < STATIONARY_SPEED:
+                stationary.append(name)
+            lons[name] = (lon + speed * dt) % 360
+            speeds[name] = speed
+        if "北交" in lons and "南交" in lons:
+            # 南交的速度欄位是北交速度取負號（與 compute_positions 相同），不代表實際移動方向，改由北交推出
+            lons["南交"] = (lons["北交"] + 180) % 360
+        return (lons, speeds), stationary
+
+    def update(self, inputs, jd_ut, positions, chart, anchor=False):
+        self.inputs = inputs
+        self.jd_ut = jd_ut
+        self.positions = positions
+        self.chart = chart
+        if anchor:
+            self.anchor_jd = jd_ut
+            self.anchor_positions = positions
+
+
+def create(session: ChartSession) -> str:
+    session_id = uuid.uuid4().hex
+    SESSIONS.set(session_id, session)
+    return session_id
+
+
+def get(session_id: str):
+    return SESSIONS.get(session_id)
+
+
+def delete(session_id: str) -> bool:
+    return SESSIONS.delete(session_id)
+
+
+def session_inputs(data: dict) -> dict:
+    """去掉只影響單次回應的欄位，剩下的才是工作階段保存的命盤輸入。"""
+    return {key: value for key, value in data.items() if key not in TRANSIENT_KEYS}
+
+
+# ==============================================================================
+# 差異
+# ==============================================================================
+def _minutes(deg):
+    return round(deg * 60) if isinstance(deg, (int, float)) else None
+
+
+def _planet_signature(info: dict):
+    # 以顯示精度（角分、宮位、逆行）比較，避免每次拖動時間都把所有星體列為變動
+    return (info.get("zodiac_position_formatted") or _minutes(info.get("lon")), info.get("house"), info.get("is_retrograde"))
+
+
+def _aspect_pair(asp: dict):
+    return tuple(sorted((asp["p1_name"], asp["p2_name"])))
+
+
+def _aspect_signature(asp: dict):
+    return asp.get("aspect_name"), asp.get("aspect_type"), _minutes(asp.get("orb"))
+
+
+def chart_diff(before: dict, after: dict) -> dict:
+    """
+    比較兩張顯示用命盤（format_chart_data_for_display 的輸出），回傳：
+      planets  {名稱: 新的星體資料}；移除的星體為 None
+      houses   {宮位: 新的宮頭字串}
+      aspects  {"added": [...], "removed": [[p1, p2], ...], "changed": [...]}，相位以星體配對比對
+    以顯示精度（角分）比較。
+    """
+    old_planets, new_planets = before.get("planet_positions") or {}, after.get("planet_positions") or {}
+    planets = {name: info for name, info in new_planets.items()
+               if name not in old_planets or _planet_signature(old_planets[name]) != _planet_signature(info)}
+    planets.update({name: None for name in old_planets if name not in new_planets})
+
+    old_cusps = {cusp["house_number"]: cusp["zodiac_position_formatted"] for cusp in before.get("house_cusps") or []}
+    houses = {cusp["house_number"]: cusp["zodiac_position_formatted"] for cusp in after.get("house_cusps") or []
+              if old_cusps.get(cusp["house_number"]) != cusp["zodiac_position_formatted"]}
+
+    old_aspects = {_aspect_pair(asp): asp for asp in before.get("aspects") or []}
+    new_aspects = {_aspect_pair(asp): asp for asp in after.get("aspects") or []}
+    aspects = {
+        "added": [asp for pair, asp in new_aspects.items() if pair not in old_aspects],
+        "removed": [list(pair) for pair in old_aspects if pair not in new_aspects],
+        "changed": [asp for pair, asp in new_aspects.items()
+                    if pair in old_aspects and _aspect_signature(old_aspects[pair]) != _aspect_signature(asp)],
+    }
+    return {"planets": planets, "houses": houses, "aspects": aspects}
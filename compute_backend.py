@@ -0,0 +1,96 @@
+# compute_backend.py
+# 可設定的計算後端：讓同一個請求內彼此獨立的命盤計算（比較盤、行運盤、組合盤的兩張基礎盤、
+# 批次端點的大量命盤）分散到多個 CPU 核心上平行執行。
+#
+# 環境變數：
+#   ASTRO_COMPUTE_BACKEND  serial（預設，於請求執行緒依序計算）或 process（行程池）
+#   ASTRO_COMPUTE_WORKERS  行程池大小，預設為 CPU 核心數
+#
+# pyswisseph 以全域狀態保存星曆路徑 (set_ephe_path)，因此每個工作行程啟動時都會自行設定一次。
+# 行程池在第一次使用時才建立，並記錄建立者的 PID：gunicorn fork 出新的 worker 後，
+# 每個 worker 會建立自己的行程池，不會共用父行程的。
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import swisseph as swe
+
+BACKEND = os.getenv("ASTRO_COMPUTE_BACKEND", "serial").lower()
+WORKERS = int(os.getenv("ASTRO_COMPUTE_WORKERS", "0")) or os.cpu_count() or 1
+
+_ephe_path = None
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def configure(ephe_path, backend=None, workers=None):
+    """設定工作行程要使用的星曆路徑；backend / workers 可覆寫環境變數的設定。"""
+    global _ephe_path, BACKEND, WORKERS
+    _ephe_path = ephe_path
+    if backend is not None:
+        BACKEND = backend.lower()
+    if workers is not None:
+        WORKERS = workers
+
+
+def _init_worker(ephe_path):
+    if ephe_path:
+        swe.set_ephe_path(ephe_path)
+
+
+def is_parallel():
+    return BACKEND == "process" and WORKERS > 1
+
+
+def get_executor():
+    """取得目前行程的行程池（必要時才建立）。serial 模式回傳 None。"""
+    global _executor, _executor_pid
+    if not is_parallel():
+        return None
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKERS, mp_context=context,
+                initializer=_init_worker, initargs=(_ephe_path,))
+            _executor_pid = os.getpid()
+            logging.info(f"計算後端：已建立 {WORKERS} 個工作行程的行程池")
+        return _executor
+
+
+def run_all(calls):
+    """
+    執行一組彼此獨立的呼叫，依輸入順序回傳結果。
+    calls 為 [(函式, 位置參數 tuple) 或 (函式, 位置參數 tuple, 關鍵字參數 dict), ...]；
+    函式必須是模組層級、可被 pickle 的函式。
+    """
+    calls = [call if len(call) == 3 else (call[0], call[1], {}) for call in calls]
+    executor = get_executor() if len(calls) > 1 else None
+    if executor is None:
+        return [fn(*args, **kwargs) for fn, args, kwargs in calls]
+    futures = [executor.submit(fn, *args, **kwargs) for fn, args, kwargs in calls]
+    return [future.result() for future in futures]
+
+
+def chunked(items, chunks=None):
+    """將列表切成最多 chunks 段（預設為工作行程數），用於把批次工作分給各個行程。"""
+    chunks = max(1, min(chunks or (WORKERS if is_parallel() else 1), len(items)))
+    size, remainder = divmod(len(items), chunks)
+    start = 0
+    for i in range(chunks):
+        end = start + size + (1 if i < remainder else 0)
+        yield start, items[start:end]
+        start = end
+
+
+def shutdown():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True)
+        _executor = None
+        _executor_pid = None
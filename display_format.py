@@ -0,0 +1,86 @@
+# display_format.py
+# 度數與星座位置的顯示字串（例如 "摩羯(18°05')"）。
+#
+# 星座名稱、度數、分鐘的字串都預先建好表格，格式化時只做查表與字串相加；
+# zodiac_format_many 以 numpy 一次算出整欄的星座／度／分，再查表組字串。
+# 輸出與原本以 zfill 與 f-string 組字串的版本逐字相同（分鐘同樣以 round 四捨五入並處理進位）。
+import numpy as np
+
+ZODIAC_SIGNS = [
+    "牡羊", "金牛", "雙子", "巨蟹", "獅子", "處女",
+    "天秤", "天蠍", "射手", "摩羯", "水瓶", "雙魚",
+]
+
+# dms_format 的度數字串（0 ~ 360，至少兩位數）與分鐘字串（含結尾的 '）
+_DEGREE_STRINGS = [str(d).zfill(2) + "°" for d in range(361)]
+_MINUTE_STRINGS = [str(m).zfill(2) + "'" for m in range(60)]
+# zodiac_format 的 "星座(度°" 前綴，度數含進位後的 30
+_SIGN_DEGREE_PREFIXES = [[f"{sign}({d:02d}°" for d in range(31)] for sign in ZODIAC_SIGNS]
+_MINUTE_SUFFIXES = [f"{m:02d}')" for m in range(60)]
+_HOUSE_LABELS = {house: f"{house}宮" for house in range(1, 13)}
+
+
+def _dms_slow(deg: float) -> str:
+    # 表格範圍外（負數或超過 360 度）時使用的原始算法
+    d = int(deg)
+    m = round((deg - d) * 60)
+    if m >= 60:
+        d += 1
+        m = 0
+    return f"{str(d).zfill(2)}°{str(m).zfill(2)}'"
+
+
+def dms_format(deg: float) -> str:
+    """將十進制度數轉換為度、分的 60 進制格式 (含四捨五入與進位處理)，例如 5.5 -> "05°30'"。"""
+    d = int(deg)
+    m = round((deg - d) * 60)
+    if m >= 60:
+        d += 1
+        m = 0
+    if 0 <= d <= 360 and m >= 0:
+        return _DEGREE_STRINGS[d] + _MINUTE_STRINGS[m]
+    return _dms_slow(deg)
+
+
+def degree_format(deg: float) -> str:
+    return dms_format(deg)
+
+
+def zodiac_format(deg: float) -> str:
+    """黃經轉為 "星座(度°分')"。"""
+    sign_idx = int(deg // 30)
+    deg_in_sign = deg % 30
+    d = int(deg_in_sign)
+    m = round((deg_in_sign - d) * 60)
+    if m >= 60:
+        d += 1
+        m = 0
+    if 0 <= sign_idx < 12:
+        return _SIGN_DEGREE_PREFIXES[sign_idx][d] + _MINUTE_SUFFIXES[m]
+    return f"{ZODIAC_SIGNS[sign_idx]}({dms_format(deg_in_sign)})"
+
+
+def zodiac_format_many(longitudes) -> list:
+    """一次格式化一整欄黃經，結果與逐一呼叫 zodiac_format 相同。"""
+    if len(longitudes) == 0:
+        return []
+    lons = np.asarray(longitudes, dtype=float)
+    sign_idx = np.floor_divide(lons, 30).astype(int)
+    deg_in_sign = np.mod(lons, 30)
+    degrees = deg_in_sign.astype(int)
+    minutes = np.round((deg_in_sign - degrees) * 60).astype(int)
+    carry = minutes >= 60
+    degrees[carry] += 1
+    minutes[carry] = 0
+    if sign_idx.min() < 0 or sign_idx.max() > 11:
+        return [zodiac_format(deg) for deg in longitudes]
+    prefixes = _SIGN_DEGREE_PREFIXES
+    suffixes = _MINUTE_SUFFIXES
+    return [prefixes[s][d] + suffixes[m] for s, d, m in zip(sign_idx.tolist(), degrees.tolist(), minutes.tolist())]
+
+
+def house_label(house) -> str:
+    """宮位的顯示字串，例如 7 -> "7宮"；沒有宮位時為空字串。"""
+    if house is None:
+        return ""
+    return _HOUSE_LABELS.get(house) or f"{int(house)}宮"
@@ -0,0 +1,260 @@
+# fast_ephemeris.py
+# 快速（低精度）星曆模式：預先以 Swiss Ephemeris 算好固定步長的黃經與速度表，
+# 查詢時以三次 Hermite 內插（端點的黃經與速度）取代 swe.calc_ut。
+# 適合每日運勢、行運列表等不需要角秒精度的用途；請求以 "precision": "fast" 啟用。
+#
+# 表格格式：
+#   <name>.npy   float64 陣列，形狀 (步數, 天體數, 2)，最後一維為 (黃經, 速度)
+#   <name>.json  中繼資料：起始儒略日、步長、天體 ID，以及建表時量測到的各天體最大誤差
+# 以 np.load(mmap_mode="r") 載入：資料不複製到行程記憶體，gunicorn 的各個 worker
+# 與計算行程池都共用作業系統的同一份分頁快取。
+#
+# 建表與驗證：
+#   python fast_ephemeris.py build --start-year 1900 --end-year 2100 --step-days 1
+#   python fast_ephemeris.py verify --samples 20000
+# verify 在隨機時刻與 Swiss Ephemeris 比較，誤差超過各天體的上限 (MAX_ERROR) 或 --max-arcsec 時以非零狀態結束。
+#
+# 步長 1 日、1900–2100 年，以 Swiss Ephemeris 星曆檔 (FLG_SWIEPH：sepl_18 / semo_18 / seas_18) 為基準，
+# verify 20000 個隨機時刻的最大誤差（黃經角秒 / 速度 °/日）：
+#   太陽 0.0013″ / 0.000001   月亮 0.62″ / 0.0006      水星 1.8″ / 0.006       金星 0.052″ / 0.000015
+#   火星 3.0″ / 0.0008        木星 1.2″ / 0.0022       土星 2.5″ / 0.0013      天王 8.3″ / 0.0057
+#   海王 12.9″ / 0.0061       冥王 0.93″ / 0.0017      凱龍 1.06″ / 0.0019     穀神 0.20″ / 0.00018
+#   智神 0.006″ / 0.00003     婚神 0.14″ / 0.00018     灶神 0.34″ / 0.0013     人龍 0.006″ / 0.000015
+#   平均北交 0.0002″          莉莉絲（平均遠地點）0.0007″
+# 較大的數字都出現在天體幾乎位於太陽正後方的幾個小時內：Swiss Ephemeris 的重力光線偏折修正在日面附近
+# 急遽變化，以 1 日為步長的內插跟不上；與太陽相距 1° 以上時，除月亮外各天體的誤差都在 0.1″ 以內。
+# 愛神與靈神需要 ast_433 / ast_016 星曆檔，量測時無法取得，沿用 DEFAULT_MAX_ERROR。
+# 整體而言誤差在 15″ 以內，遠小於星座、宮位、相位容許度所需的精度。
+# 建表當下無法計算的天體（例如缺少小行星星曆檔）不會放入表格，查詢時自動改用 Swiss Ephemeris。
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import swisseph as swe
+
+import swiss_ephe_downloader
+
+EPHE_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
+DEFAULT_STEP_DAYS = 1.0
+DEFAULT_START_YEAR = 1900
+DEFAULT_END_YEAR = 2100
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(swiss_ephe_downloader.EPHE_DIR), "fast_ephemeris.npy")
+
+# 步長 1 日時各天體允許的最大誤差（黃經角秒, 速度 °/日），約為上方實測值的 1.5 倍
+MAX_ERROR = {
+    swe.SUN: (0.005, 0.00001), swe.MOON: (1.0, 0.001), swe.MERCURY: (2.5, 0.01), swe.VENUS: (0.1, 0.00005),
+    swe.MARS: (4.5, 0.0015), swe.JUPITER: (2.0, 0.004), swe.SATURN: (4.0, 0.002), swe.URANUS: (12.0, 0.01),
+    swe.NEPTUNE: (18.0, 0.01), swe.PLUTO: (1.5, 0.003), swe.CHIRON: (1.5, 0.003), swe.CERES: (0.3, 0.0003),
+    swe.PALLAS: (0.01, 0.00005), swe.JUNO: (0.2, 0.0003), swe.VESTA: (0.5, 0.002), swe.PHOLUS: (0.01, 0.00003),
+    swe.MEAN_NODE: (0.001, 0.00001), swe.MEAN_APOG: (0.002, 0.00001),
+}
+# 未量測的天體（愛神、靈神）
+DEFAULT_MAX_ERROR = (18.0, 0.01)
+
+logger = logging.getLogger(__name__)
+
+
+def _paths(path):
+    base = path[:-4] if path.endswith(".npy") else path
+    return base + ".npy", base + ".json"
+
+
+def _hermite(l0, v0, l1, v1, t, h):
+    """
+    單位區間 t ∈ [0, 1] 上的三次 Hermite 內插，回傳 (黃經, 速度)。
+    l1 先展開到 l0 附近，避免跨過 0°/360° 時內插出錯。
+    """
+    l1 = l0 + (l1 - l0 + 180) % 360 - 180
+    m0, m1 = v0 * h, v1 * h
+    t2 = t * t
+    t3 = t2 * t
+    lon = (2 * t3 - 3 * t2 + 1) * l0 + (t3 - 2 * t2 + t) * m0 + (-2 * t3 + 3 * t2) * l1 + (t3 - t2) * m1
+    dlon = (6 * t2 - 6 * t) * l0 + (3 * t2 - 4 * t + 1) * m0 + (-6 * t2 + 6 * t) * l1 + (3 * t2 - 2 * t) * m1
+    return lon % 360, dlon / h
+
+
+class FastEphemeris:
+    """記憶體映射的星曆表。位置查詢不呼叫 Swiss Ephemeris，可在多執行緒間共用。"""
+
+    def __init__(self, table, jd_start, step_days, body_ids, max_error=None):
+        self.table = table
+        # 去掉 memmap 子類別的包裝（仍是同一塊映射記憶體，不複製），逐列取值時較快
+        self._rows = np.asarray(table)
+        self.jd_start = float(jd_start)
+        self.step_days = float(step_days)
+        self.body_ids = [int(pid) for pid in body_ids]
+        self.max_error = max_error or {}
+        self._index = {pid: i for i, pid in enumerate(self.body_ids)}
+        self.jd_end = self.jd_start + self.step_days * (table.shape[0] - 1)
+
+    @classmethod
+    def load(cls, path):
+        npy_path, meta_path = _paths(path)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        table = np.load(npy_path, mmap_mode="r")
+        if table.ndim != 3 or table.shape[1] != len(meta["body_ids"]) or table.shape[2] != 2 or table.shape[0] < 2:
+            raise ValueError(f"星曆表 {npy_path} 的形狀 {table.shape} 與中繼資料不符")
+        return cls(table, meta["jd_start"], meta["step_days"], meta["body_ids"], meta.get("max_error"))
+
+    def covers(self, jd_ut: float) -> bool:
+        return self.jd_start <= jd_ut <= self.jd_end
+
+    def has_body(self, pid: int) -> bool:
+        return pid in self._index
+
+    def _locate(self, jd_ut):
+        offset = (jd_ut - self.jd_start) / self.step_days
+        row = min(int(offset), self._rows.shape[0] - 2)
+        return row, offset - row
+
+    def position(self, jd_ut: float, pid: int):
+        """回傳 (黃經, 速度)；jd_ut 必須在表格範圍內，pid 必須在表格中。"""
+        row, t = self._locate(jd_ut)
+        col = self._index[pid]
+        l0, v0 = self._rows[row, col].tolist()
+        l1, v1 = self._rows[row + 1, col].tolist()
+        return _hermite(l0, v0, l1, v1, t, self.step_days)
+
+    def positions(self, jd_ut: float, pids):
+        """一次內插多個天體，回傳 [(黃經, 速度), ...]，順序與 pids 相同。"""
+        row, t = self._locate(jd_ut)
+        before, after = self._rows[row].tolist(), self._rows[row + 1].tolist()
+        h = self.step_days
+        results = []
+        for pid in pids:
+            col = self._index[pid]
+            results.append(_hermite(before[col][0], before[col][1], after[col][0], after[col][1], t, h))
+        return results
+
+
+def load(path=None):
+    """載入星曆表；未指定路徑時使用 ASTRO_FAST_EPHEMERIS 或預設位置。檔案不存在時回傳 None。"""
+    path = path or os.getenv("ASTRO_FAST_EPHEMERIS") or DEFAULT_TABLE_PATH
+    npy_path, meta_path = _paths(path)
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    table = FastEphemeris.load(path)
+    logger.info(f"快速星曆表已載入：{npy_path}（儒略日 {table.jd_start}–{table.jd_end}，{len(table.body_ids)} 個天體）")
+    return table
+
+
+# ==============================================================================
+# 建表與驗證
+# ==============================================================================
+def _swe_position(jd_ut, pid):
+    xx, _ = swe.calc_ut(jd_ut, pid, EPHE_FLAGS)
+    return xx[0], xx[3]
+
+
+def _available_bodies(body_ids, jd_ut):
+    available = []
+    for pid in body_ids:
+        try:
+            _swe_position(jd_ut, pid)
+            available.append(pid)
+        except Exception as e:
+            logger.warning(f"天體 {pid} 無法計算，不放入快速星曆表: {e}")
+    return available
+
+
+def measure_errors(ephemeris, jd_values, body_ids=None):
+    """在指定時刻與 Swiss Ephemeris 比較，回傳 {天體 ID: {"lon_arcsec": ..., "speed_deg_per_day": ...}} 的最大誤差。"""
+    body_ids = body_ids or ephemeris.body_ids
+    errors = {pid: [0.0, 0.0] for pid in body_ids}
+    for jd in jd_values:
+        for pid, (lon, speed) in zip(body_ids, ephemeris.positions(jd, body_ids)):
+            ref_lon, ref_speed = _swe_position(jd, pid)
+            err = errors[pid]
+            err[0] = max(err[0], abs((lon - ref_lon + 180) % 360 - 180) * 3600)
+            err[1] = max(err[1], abs(speed - ref_speed))
+    return {pid: {"lon_arcsec": lon_err, "speed_deg_per_day": speed_err} for pid, (lon_err, speed_err) in errors.items()}
+
+
+def build_table(path, start_year, end_year, step_days=DEFAULT_STEP_DAYS, body_ids=None, error_samples=2000):
+    """
+    以 Swiss Ephemeris 建立 [start_year, end_year] 的星曆表並寫入 path (.npy 與 .json)。
+    建表後在 error_samples 個區間中點量測最大誤差（內插誤差在區間中點附近最大），一併寫入中繼資料。
+    """
+    if body_ids is None:
+        from astro_engine import PLANET_IDS
+        body_ids = list(dict.fromkeys(PLANET_IDS.values()))
+    jd_start = swe.julday(start_year, 1, 1, 0.0)
+    jd_end = swe.julday(end_year + 1, 1, 1, 0.0)
+    steps = int(np.ceil((jd_end - jd_start) / step_days)) + 1
+    body_ids = _available_bodies(body_ids, jd_start)
+    if not body_ids:
+        raise RuntimeError("沒有任何天體可以計算，請確認星曆路徑")
+
+    npy_path, meta_path = _paths(path)
+    os.makedirs(os.path.dirname(os.path.abspath(npy_path)), exist_ok=True)
+    table = np.lib.format.open_memmap(npy_path + ".tmp", mode="w+", dtype=np.float64, shape=(steps, len(body_ids), 2))
+    for row in range(steps):
+        jd = jd_start + row * step_days
+        for col, pid in enumerate(body_ids):
+            table[row, col] = _swe_position(jd, pid)
+    table.flush()
+    del table
+    os.replace(npy_path + ".tmp", npy_path)
+
+    ephemeris = FastEphemeris(np.load(npy_path, mmap_mode="r"), jd_start, step_days, body_ids)
+    rows = np.linspace(0, steps - 2, num=min(error_samples, steps - 1)).astype(int)
+    max_error = measure_errors(ephemeris, jd_start + (rows + 0.5) * step_days)
+    meta = {"jd_start": jd_start, "step_days": step_days, "start_year": start_year, "end_year": end_year,
+            "body_ids": body_ids, "max_error": {str(pid): err for pid, err in max_error.items()}}
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return FastEphemeris(ephemeris.table, jd_start, step_days, body_ids, meta["max_error"])
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description="建立或驗證快速星曆表。",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--path", default=os.getenv("ASTRO_FAST_EPHEMERIS") or DEFAULT_TABLE_PATH, help="星曆表路徑 (.npy)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="以 Swiss Ephemeris 建立星曆表")
+    build.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR)
+    build.add_argument("--end-year", type=int, default=DEFAULT_END_YEAR)
+    build.add_argument("--step-days", type=float, default=DEFAULT_STEP_DAYS)
+    verify = commands.add_parser("verify", help="在隨機時刻與 Swiss Ephemeris 比較")
+    verify.add_argument("--samples", type=int, default=20000)
+    verify.add_argument("--seed", type=int, default=0)
+    verify.add_argument("--max-arcsec", type=float, default=None,
+                        help="允許的最大黃經誤差（角秒），未指定時依各天體的 MAX_ERROR")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_arguments()
+    # 與應用程式使用相同的星曆檔，建表與驗證的基準才會一致
+    swe.set_ephe_path(os.path.abspath(swiss_ephe_downloader.EPHE_DIR))
+    if args.command == "build":
+        ephemeris = build_table(args.path, args.start_year, args.end_year, args.step_days)
+        errors = ephemeris.max_error
+    else:
+        ephemeris = FastEphemeris.load(args.path)
+        rng = np.random.default_rng(args.seed)
+        jd_values = rng.uniform(ephemeris.jd_start, ephemeris.jd_end, args.samples)
+        errors = {str(pid): err for pid, err in measure_errors(ephemeris, jd_values).items()}
+
+    exceeded = []
+    for pid in ephemeris.body_ids:
+        err = errors[str(pid)]
+        lon_bound, speed_bound = MAX_ERROR.get(pid, DEFAULT_MAX_ERROR)
+        if args.command == "verify" and args.max_arcsec is not None:
+            lon_bound, speed_bound = args.max_arcsec, float("inf")
+        if err["lon_arcsec"] > lon_bound or err["speed_deg_per_day"] > speed_bound:
+            exceeded.append(pid)
+        print(f"{swe.get_planet_name(pid):>12} ({pid:>5}): 黃經 {err['lon_arcsec']:.4f}″  速度 {err['speed_deg_per_day']:.6f}°/日"
+              f"（上限 {lon_bound:g}″ / {speed_bound:g}°/日）")
+    if args.command == "verify" and exceeded:
+        print(f"誤差超過允許值的天體: {[swe.get_planet_name(pid) for pid in exceeded]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
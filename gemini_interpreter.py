@@ -1,14 +1,25 @@
 # gemini_interpreter.py
+# 取得星盤數據後交給語言模型解讀，解讀內容一邊產生一邊顯示在終端機上。
+# 星盤以 chart_prompt 轉成精簡文字再放進提示（比縮排 JSON 小很多，延遲與費用都隨提示長度增加）。
+# 模型呼叫透過 ModelClient 介面：GeminiClient 呼叫 Gemini，StubModelClient 是不連網的本地替身（--model stub）。
 import os
 import requests
 import json
-import google.generativeai as genai
 from dotenv import load_dotenv
-import google.api_core.exceptions
 from rich.console import Console
+from rich.live import Live
 from rich.markdown import Markdown
 import argparse
 
+import chart_prompt
+
+try:
+    import google.generativeai as genai
+    import google.api_core.exceptions as google_exceptions
+except ImportError:  # 只使用本地替身 (--model stub) 時不需要安裝 google-generativeai
+    genai = None
+    google_exceptions = None
+
 # 從 .env 檔案載入環境變數
 load_dotenv()
 
@@ -21,85 +32,151 @@ load_dotenv()
 # 您的 Render 網址格式通常是： https://your-app-name.onrender.com
 # 請將 'astro-chart-to-text' 換成您在 Render 上的真實服務名稱
 # 修正：指向正確的 AI API 端點
-ASTRO_API_URL = "https://astro-chart-to-text.onrender.com/api/v1/chart/single"
+# 也可以用環境變數 ASTRO_API_URL 指向本地伺服器 (例如 http://127.0.0.1:5000/api/v1/chart/single)
+ASTRO_API_URL = os.getenv("ASTRO_API_URL", "https://astro-chart-to-text.onrender.com/api/v1/chart/single")
 
-# 從環境變數讀取您的金鑰 (現在會由 .env 檔案提供)
+# 從環境變數讀取您的金鑰 (現在會由 .env 檔案提供)；缺少時在實際用到的地方才拋出 ValueError
 ASTRO_API_KEY = os.getenv("ASTRO_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not ASTRO_API_KEY:
-    raise ValueError("錯誤：請在 .env 檔案中設定 ASTRO_API_KEY。")
-
-if not GEMINI_API_KEY:
-    raise ValueError("錯誤：請在 .env 檔案中設定 GEMINI_API_KEY。")
-
-# 設定 Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash") # 您也可以試試 'gemini-1.5-pro'
 
 # ==============================================================================
 # --- 核心函式 (Core Functions) ---
 # ==============================================================================
 
-def get_chart_data_from_api(payload):
-    """呼叫您的星盤 API 並回傳 JSON 數據"""
+class InterpretationError(Exception):
+    """模型呼叫失敗或沒有回傳內容。retryable 為 True 表示暫時性錯誤（限流、服務忙碌、逾時），稍後重試可能成功。"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# 視為暫時性錯誤的 HTTP 狀態碼（限流、伺服器錯誤、服務忙碌、逾時）
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class ModelClient:
+    """
+    語言模型的介面：stream(prompt) 依序產生回應文字片段。
+    測試或離線時可用 StubModelClient 取代 GeminiClient。name 為模型名稱（大量解讀的快取鍵會用到）。
+    """
+
+    name = "model"
+
+    def stream(self, prompt):
+        raise NotImplementedError
+
+    def generate(self, prompt) -> str:
+        return "".join(self.stream(prompt))
+
+
+class GeminiClient(ModelClient):
+    """以串流模式呼叫 Gemini。"""
+
+    def __init__(self, api_key=None, model_name=GEMINI_MODEL):
+        if genai is None:
+            raise ValueError("錯誤：未安裝 google-generativeai，請安裝後再使用 Gemini，或改用 --model stub。")
+        api_key = api_key or GEMINI_API_KEY
+        if not api_key:
+            raise ValueError("錯誤：請在 .env 檔案中設定 GEMINI_API_KEY。")
+        genai.configure(api_key=api_key)
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def stream(self, prompt):
+        try:
+            response = self.model.generate_content(prompt, stream=True)
+            received = False
+            for chunk in response:
+                # 被安全設定擋下的片段沒有 parts，讀取 chunk.text 會拋出例外
+                if chunk.parts:
+                    received = True
+                    yield chunk.text
+        except google_exceptions.GoogleAPICallError as e:
+            raise InterpretationError(f"Gemini API 呼叫失敗: {e}",
+                                      retryable=getattr(e, "code", None) in RETRYABLE_STATUS_CODES) from e
+        if not received:
+            if response.prompt_feedback:
+                raise InterpretationError(f"Gemini API 回應為空，可能是因為內容安全設定。提示回饋: {response.prompt_feedback}")
+            raise InterpretationError("無法從 Gemini 獲取有效的解讀。")
+
+
+class StubModelClient(ModelClient):
+    """
+    不連網的本地替身：把固定的回應切成小段依序產生，並記錄收到的提示 (prompts)。
+    未指定回應時回傳提示的摘要，方便檢查送出的內容。
+    """
+
+    name = "stub"
+
+    def __init__(self, response=None, chunk_size=16):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.prompts = []
+
+    def stream(self, prompt):
+        self.prompts.append(prompt)
+        text = self.response
+        if text is None:
+            text = f"**本地替身回應**：收到 {len(prompt)} 個字元的提示。\n\n```\n{prompt}\n```\n"
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+
+MODEL_CLIENTS = {"gemini": GeminiClient, "stub": StubModelClient}
+
+
+def get_chart_data_from_api(payload, session=None, timeout=None):
+    """呼叫您的星盤 API 並回傳 JSON 數據；大量請求時傳入 requests.Session 重複使用連線。"""
+    if not ASTRO_API_KEY:
+        raise ValueError("錯誤：請在 .env 檔案中設定 ASTRO_API_KEY。")
     headers = {
         "Content-Type": "application/json",
         "X-API-Key": ASTRO_API_KEY
     }
     # 注意：使用者介面的回饋現在由主執行區塊的 status 指示器處理
-    response = requests.post(ASTRO_API_URL, headers=headers, data=json.dumps(payload))
+    response = (session or requests).post(ASTRO_API_URL, headers=headers, data=json.dumps(payload), timeout=timeout)
     response.raise_for_status() # 確保請求成功
     return response.json()
 
 
-
-def get_interpretation_from_gemini(chart_data, custom_question=None):
-    """將星盤數據發送給 Gemini 並獲取解讀"""
+def build_prompt(chart_data, custom_question=None):
+    """組成給模型的提示；星盤數據以 chart_prompt.chart_to_text 的精簡文字表示。"""
+    chart_text = chart_prompt.chart_to_text(chart_data)
     
     # --- 動態提示工程 (Dynamic Prompt Engineering) ---
     if custom_question:
         # 如果使用者提供了特定問題，使用這個更直接的提示
-        prompt = f"""
-        你是一位專業的占星師。請根據以下提供的 JSON 格式的星盤數據，用清晰、易懂的方式回答使用者的問題。請適度使用 Markdown 語法（例如用 `**粗體**` 來強調關鍵字，或用 `-` 項目符號來條列要點）來美化你的回覆。
-
-        使用者的問題: "{custom_question}"
-
-        ---
-        星盤數據:
-        ```json
-        {json.dumps(chart_data, indent=2, ensure_ascii=False)}
-        ```
-        ---
-        """
-    else:
-        # 如果沒有特定問題，則使用一個更開放、更鼓勵深入分析的提示
-        # 你可以從核心的「三巨頭」（太陽、月亮、上升）出發，但更重要的是，請將它們與其他行星、宮位和關鍵相位（特別是容許度小的相位）聯繫起來，編織成一個連貫、深刻的生命故事。
-        prompt = f"""
-        你是一位智慧、溫暖且富有洞察力的占星大師。著重於潛能的啟發與自我理解。請在你的分析中，善用 Markdown 語法（例如用 `**粗體**` 來強調關鍵概念，或用 `-` 項目符號來條列要點）讓回覆的結構更清晰、更易於閱讀。
-        你的任務是根據以下提供的 JSON 格式的個人星盤數據，為使用者提供一份全面、深入且整合的個性分析。
-
-        請不要只是條列式地解釋單一配置。請將星盤視為一個整體，自由地探索其中最顯著的模式、天賦潛能、以及內在的挑戰與成長課題。
-        請整體分析取得的所有星體宮位星座相位容許度，做最貼切精確生活化且實用的回答。
-        請用充滿人文關懷且啟發人心的語氣，以流暢、自然的散文形式呈現你的分析。
-
-        ---
-        星盤數據:
-        ```json
-        {json.dumps(chart_data, indent=2, ensure_ascii=False)}
-        ```
-        ---
-        """
-    
-    # 注意：使用者介面的回饋現在由主執行區塊的 status 指示器處理
-    model = genai.GenerativeModel('gemini-1.5-flash') # 您也可以試試 'gemini-1.5-pro'
-    response = model.generate_content(prompt)
-    # 新增：檢查 Gemini 是否有回傳內容
-    if not response.parts:
-        if response.prompt_feedback:
-            raise google.api_core.exceptions.GoogleAPICallError(f"Gemini API 回應為空，可能是因為內容安全設定。提示回饋: {response.prompt_feedback}")
-        return "無法從 Gemini 獲取有效的解讀。"
+        return f"""你是一位專業的占星師。請根據以下提供的星盤數據，用清晰、易懂的方式回答使用者的問題。請適度使用 Markdown 語法（例如用 `**粗體**` 來強調關鍵字，或用 `-` 項目符號來條列要點）來美化你的回覆。
 
-    return response.text
+使用者的問題: "{custom_question}"
+
+星盤數據:
+{chart_text}
+"""
+    # 如果沒有特定問題，則使用一個更開放、更鼓勵深入分析的提示
+    # 你可以從核心的「三巨頭」（太陽、月亮、上升）出發，但更重要的是，請將它們與其他行星、宮位和關鍵相位（特別是容許度小的相位）聯繫起來，編織成一個連貫、深刻的生命故事。
+    return f"""你是一位智慧、溫暖且富有洞察力的占星大師。著重於潛能的啟發與自我理解。請在你的分析中，善用 Markdown 語法（例如用 `**粗體**` 來強調關鍵概念，或用 `-` 項目符號來條列要點）讓回覆的結構更清晰、更易於閱讀。
+你的任務是根據以下提供的個人星盤數據，為使用者提供一份全面、深入且整合的個性分析。
+
+請不要只是條列式地解釋單一配置。請將星盤視為一個整體，自由地探索其中最顯著的模式、天賦潛能、以及內在的挑戰與成長課題。
+請整體分析取得的所有星體宮位星座相位容許度，做最貼切精確生活化且實用的回答。
+請用充滿人文關懷且啟發人心的語氣，以流暢、自然的散文形式呈現你的分析。
+
+星盤數據:
+{chart_text}
+"""
+
+
+def stream_interpretation(client: ModelClient, chart_data, custom_question=None):
+    """將星盤數據交給模型，依序產生解讀的文字片段。"""
+    return client.stream(build_prompt(chart_data, custom_question))
+
+
+def get_interpretation_from_gemini(chart_data, custom_question=None, client=None):
+    """將星盤數據發送給模型並獲取完整解讀（不串流）；未指定 client 時使用 Gemini。"""
+    return "".join(stream_interpretation(client or GeminiClient(), chart_data, custom_question))
 
 def parse_arguments():
     """使用 argparse 解析命令列參數"""
@@ -118,6 +195,9 @@ def parse_arguments():
     parser.add_argument("--tz", type=str, default="Asia/Taipei", help="時區 (例如: 'Asia/Taipei')")
     parser.add_argument("--planets", nargs='*', default=["凱龍", "莉莉絲", "福點"], help="要計算的額外星體列表 (例如: --planets 凱龍 穀神)")
     parser.add_argument("-q", "--question", type=str, help="向 Gemini 提出一個關於此星盤的特定問題。")
+    parser.add_argument("--fields", type=str, default=",".join(chart_prompt.PROMPT_FIELDS),
+                        help="只向 API 取回這些欄位，逗號分隔 (例如: planet_positions,aspects)；預設為提示中會用到的欄位。")
+    parser.add_argument("--model", choices=sorted(MODEL_CLIENTS), default="gemini", help="解讀使用的模型；stub 為不連網的本地替身。")
 
     return parser.parse_args()
 
@@ -136,22 +216,26 @@ if __name__ == "__main__":
         "latitude": args.lat, "longitude": args.lon,
         "timezone": args.tz, "optional_planets": args.planets
     }
+    if args.fields:
+        chart_payload["fields"] = args.fields
 
     try:
+        client = MODEL_CLIENTS[args.model]()
+
         with console.status("[bold yellow]正在獲取星盤數據...", spinner="dots") as status:
             # 步驟 1: 從您的 API 獲取星盤數據
             astro_data = get_chart_data_from_api(chart_payload)
         
-        with console.status("[bold yellow]Gemini 正在思考中...", spinner="dots") as status:
-            # 步驟 2: 將數據和您的問題（如果有的話）交給 Gemini 進行解讀
-            interpretation = get_interpretation_from_gemini(astro_data, custom_question=args.question)
-        
-        # 步驟 3: 印出最終結果
+        # 步驟 2: 將數據和您的問題（如果有的話）交給模型，解讀內容一邊產生一邊顯示
         console.rule("[bold magenta]✨ Gemini 占星大師的分析結果 ✨", style="magenta")
         if args.question:
             console.print(f"[bold]您問：[/bold] [italic]{args.question}[/italic]\n")
         
-        console.print(Markdown(interpretation))
+        interpretation = ""
+        with Live(Markdown(interpretation), console=console, refresh_per_second=8, vertical_overflow="visible") as live:
+            for chunk in stream_interpretation(client, astro_data, custom_question=args.question):
+                interpretation += chunk
+                live.update(Markdown(interpretation))
         console.rule(style="magenta")
 
     except requests.exceptions.HTTPError as e:
@@ -160,8 +244,8 @@ if __name__ == "__main__":
     except requests.exceptions.RequestException as e:
         console.print(f"\n[bold red]❌ 錯誤：無法連接到您的星盤 API。請確認您的雲端服務正在運行。[/bold red]")
         console.print(f"   詳細資訊: {e}")
-    except google.api_core.exceptions.GoogleAPICallError as e:
-        console.print(f"\n[bold red]❌ Gemini API 呼叫失敗: {e}[/bold red]")
+    except InterpretationError as e:
+        console.print(f"\n[bold red]❌ {e}[/bold red]")
     except ValueError as e:
         # 捕捉我們自己拋出的 ValueError，例如找不到 API 金鑰
         console.print(f"\n[bold red]❌ 設定錯誤: {e}[/bold red]")
@@ -0,0 +1,124 @@
+# house_systems.py
+# 分宮制與宮位查詢。
+#
+# HouseSystem 將 12 個宮頭換算成「相對第一宮宮頭的度數」(0 ~ 360，遞增)，
+# 查詢某個黃經落在哪一宮時只要二分搜尋；多個天體可用 numpy 一次查完。
+# 宮頭順序不是單調遞增時（不正常的宮頭資料），退回與舊版 find_house 相同的逐宮比對。
+# 舊版逐宮比對在跨越 0° 的宮頭旁會因捨入誤差漏掉點而退回第一宮，這裡改歸入起點在該點之前最近的宮位。
+import logging
+from bisect import bisect_right
+
+import numpy as np
+
+# 分宮制名稱 -> swe.houses 的分宮制代碼
+HOUSE_SYSTEMS = {
+    "placidus": b"P",
+    "koch": b"K",
+    "porphyry": b"O",
+    "regiomontanus": b"R",
+    "campanus": b"C",
+    "equal": b"E",
+    "whole_sign": b"W",
+    "alcabitius": b"B",
+    "morinus": b"M",
+    "topocentric": b"T",
+    "meridian": b"X",
+    "vehlow": b"V",
+}
+DEFAULT_HOUSE_SYSTEM = "placidus"
+
+_ALIASES = {
+    "whole sign": "whole_sign", "wholesign": "whole_sign", "whole-sign": "whole_sign",
+    "equal_house": "equal", "polich_page": "topocentric",
+}
+_CODE_TO_NAME = {code.decode(): name for name, code in HOUSE_SYSTEMS.items()}
+
+
+def resolve_house_system(value):
+    """
+    將請求中的分宮制（名稱如 "koch"、"whole_sign"，或單一字母代碼如 "K"）轉為 (名稱, swe 代碼)。
+    未提供時使用 Placidus；無法辨識時拋出 ValueError。
+    """
+    if value is None or value == "":
+        return DEFAULT_HOUSE_SYSTEM, HOUSE_SYSTEMS[DEFAULT_HOUSE_SYSTEM]
+    if not isinstance(value, str):
+        raise ValueError(f"無效的分宮制: {value!r}")
+    if len(value) == 1 and value.upper() in _CODE_TO_NAME:
+        name = _CODE_TO_NAME[value.upper()]
+        return name, HOUSE_SYSTEMS[name]
+    name = value.strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in HOUSE_SYSTEMS:
+        raise ValueError(f"無效的分宮制: '{value}'。可用的分宮制: {', '.join(HOUSE_SYSTEMS)}")
+    return name, HOUSE_SYSTEMS[name]
+
+
+class HouseSystem:
+    """一組宮頭 ({1: 黃經, ..., 12: 黃經}) 的宮位查詢器。"""
+    __slots__ = ("cusps", "origin", "keys", "monotonic", "_cusps_array", "_keys_array")
+
+    def __init__(self, cusps_dict: dict):
+        self.cusps = [cusps_dict.get(i, 0.0) for i in range(1, 13)]
+        self.origin = self.cusps[0]
+        # 每個宮頭相對第一宮宮頭的度數；與查詢的黃經使用同一個算式，剛好落在宮頭上的點（四軸）結果一定一致
+        self.keys = [(c - self.origin) % 360 for c in self.cusps]
+        # 12 個宮頭全部相同時沒有任何一宮有寬度，交給逐宮比對
+        self.monotonic = self.keys[11] > 0 and all(self.keys[i] <= self.keys[i + 1] for i in range(11))
+        self._cusps_array = None
+        self._keys_array = None
+
+    def locate(self, deg: float):
+        """回傳 (宮位 1~12, 在該宮內的度數)。"""
+        if not self.monotonic:
+            return self._locate_linear(deg)
+        key = (deg - self.origin) % 360
+        index = bisect_right(self.keys, key) - 1
+        if self.keys[index] == key and not self._is_exact_cusp(index, deg):
+            return self._locate_linear(deg)
+        return index + 1, (deg - self.cusps[index] + 360) % 360
+
+    def locate_many(self, longitudes):
+        """一次查詢多個黃經，回傳 (宮位列表, 宮內度數列表)。"""
+        if not self.monotonic:
+            located = [self._locate_linear(deg) for deg in longitudes]
+            return [h for h, _ in located], [d for _, d in located]
+        if self._keys_array is None:
+            self._keys_array = np.array(self.keys)
+            self._cusps_array = np.array(self.cusps)
+        lons = np.asarray(longitudes, dtype=float)
+        keys = (lons - self.origin) % 360
+        indexes = np.searchsorted(self._keys_array, keys, side="right") - 1
+        houses = (indexes + 1).tolist()
+        degrees = ((lons - self._cusps_array[indexes] + 360) % 360).tolist()
+        for i in np.flatnonzero(self._keys_array[indexes] == keys).tolist():
+            if not self._is_exact_cusp(indexes[i], longitudes[i]):
+                houses[i], degrees[i] = self._locate_linear(longitudes[i])
+        return houses, degrees
+
+    def _is_exact_cusp(self, index, deg):
+        # 換算後剛好等於宮頭：只有黃經與宮頭完全相同、且該宮寬度不為零時才能直接判定，
+        # 其餘（與宮頭只差捨入誤差的點）交給逐宮比對，以確保結果與逐宮比對一致
+        return deg == self.cusps[index] and (index == 11 or self.keys[index + 1] != self.keys[index])
+
+    def _locate_linear(self, deg: float):
+        cusps_list = self.cusps
+        for i in range(1, 13):
+            start_cusp = cusps_list[i - 1]
+            end_cusp = cusps_list[i % 12]
+
+            d_start, d_end, d_deg = start_cusp, end_cusp, deg
+            if d_end < d_start:
+                d_end += 360
+                if d_deg < d_start:
+                    d_deg += 360
+
+            if d_start <= d_deg < d_end:
+                relative_degree = (deg - start_cusp + 360) % 360
+                return i, relative_degree
+        # deg + 360 捨入後剛好等於下一個宮頭時上面的比對會漏掉，改取起點在 deg 之前最近、寬度不為零的宮位
+        candidates = [((deg - cusps_list[i - 1]) % 360, i) for i in range(1, 13) if cusps_list[i - 1] != cusps_list[i % 12]]
+        if candidates:
+            i = min(candidates)[1]
+            return i, (deg - cusps_list[i - 1] + 360) % 360
+        logging.warning(f"無法為度數 {deg} 找到宮位。預設返回第一宮。宮頭: {cusps_list}")
+        return 1, 0.0
@@ -0,0 +1,184 @@
+# http_cache.py
+# 命盤回應的壓縮與條件式快取。
+#
+# 同一組輸入、同一份程式與星曆狀態下的命盤回應永遠相同，因此 ETag 直接由「正規化後的請求」
+# （端點路徑、JSON 內容、查詢參數與 Accept）加上程式版本與星曆狀態計算，不需要先算出回應：
+# If-None-Match 相符時在計算之前就回傳 304。
+# ETag 為弱 ETag (W/"...")，同一份內容的 gzip / brotli / 未壓縮版本共用。
+# 這些 POST 端點只做計算、沒有副作用，因此條件相符時與 GET 一樣回傳 304（而不是 412）。
+#
+# 輸出內容會隨程式版本改變，部署時請設定 ASTRO_ETAG_VERSION（例如 release 編號）；
+# 未設定時使用 Render 提供的 RENDER_GIT_COMMIT，兩者都沒有時以本目錄 .py 原始碼的雜湊代替。
+# 輸出也隨伺服器狀態改變：星曆檔是否齊全（缺檔時 Swisseph 改用 Moshier 星曆，小行星檔案用到時才下載）
+# 與快速星曆表是否載入，見 ephemeris_state。
+# 因為狀態可能在執行中改變（例如星曆檔下載完成），Cache-Control 不標示 immutable，max-age 過後由 ETag 重新驗證。
+#
+# Cache-Control：沒有帶 API 金鑰的請求為 public，可由 CDN / 反向代理快取；帶金鑰的請求為 private，
+# 避免共用快取把受保護端點的回應提供給未授權的客戶端。
+# 這些端點都是 POST：共用快取必須設定為快取 POST 並以請求內容作為快取鍵
+# （例如 nginx 的 proxy_cache_methods POST 與含 $request_body 的 proxy_cache_key）。
+#
+# 壓縮：用戶端接受時以 brotli（需安裝 brotli 套件）或 gzip 壓縮 COMPRESS_MIN_SIZE 以上的回應；串流回應不壓縮。
+#
+# 用法（app.py 與 appC.py 共用）：
+#   cacheable_response = http_cache.cacheable(lambda: http_cache.ephemeris_state(EPHE_DIR, FAST_EPHEMERIS))
+#   app.after_request(http_cache.compress_response)
+#
+# 環境變數：
+#   ASTRO_ETAG_VERSION       加入 ETag 計算的版本字串
+#   ASTRO_CACHE_MAX_AGE      Cache-Control 的 max-age 秒數，預設 86400
+#   ASTRO_COMPRESS_MIN_SIZE  壓縮的最小回應大小 (bytes)，預設 1024
+#   ASTRO_GZIP_LEVEL         gzip 壓縮等級，預設 6
+#   ASTRO_BROTLI_QUALITY     brotli 壓縮品質，預設 5
+import glob
+import gzip
+import hashlib
+import json
+import os
+from functools import wraps
+
+from flask import Response, make_response, request
+
+import chart_metrics
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件，未安裝時只提供 gzip
+    brotli = None
+
+
+def _source_digest():
+    """本目錄所有 .py 檔內容的雜湊，未設定版本環境變數時代表程式版本。"""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+ETAG_VERSION = os.getenv("ASTRO_ETAG_VERSION") or os.getenv("RENDER_GIT_COMMIT") or _source_digest()
+CACHE_MAX_AGE = int(os.getenv("ASTRO_CACHE_MAX_AGE", "86400"))
+COMPRESS_MIN_SIZE = int(os.getenv("ASTRO_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("ASTRO_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("ASTRO_BROTLI_QUALITY", "5"))
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# 值得壓縮的內容類型（前綴比對）；MessagePack 已很精簡，但重複的中文鍵名仍可再壓縮
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/vnd.", "application/msgpack", "text/")
+
+
+def _normalize(value):
+    """正規化請求內容：整數值的浮點數視為整數（25 與 25.0 產生相同的 ETag），字典鍵名排序交給 json.dumps。"""
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# 目錄 mtime 不變時沿用上次列出的星曆檔（下載完成的改名、新增或刪除檔案都會更新目錄 mtime）
+_ephe_listing = {}
+
+
+def _ephemeris_files(ephe_dir):
+    """ephe_dir 內星曆檔的 (名稱, 大小)；略過隱藏檔（鎖、驗證紀錄）與下載中的 .part。"""
+    try:
+        mtime = os.stat(ephe_dir).st_mtime_ns
+    except OSError:
+        return []
+    cached = _ephe_listing.get(ephe_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    files = sorted((entry.name, entry.stat().st_size) for entry in os.scandir(ephe_dir)
+                   if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(".part"))
+    _ephe_listing[ephe_dir] = (mtime, files)
+    return files
+
+
+def ephemeris_state(ephe_dir, fast_table=None) -> str:
+    """
+    影響計算結果的伺服器狀態：ephe_dir 內有哪些星曆檔（名稱與大小，與主機無關），以及快速星曆表的範圍與天體。
+    安裝或下載星曆檔、載入不同的快速星曆表後，ETag 隨之改變。
+    """
+    table = None
+    if fast_table is not None:
+        table = [fast_table.jd_start, fast_table.jd_end, fast_table.step_days, fast_table.body_ids]
+    canonical = json.dumps([_ephemeris_files(ephe_dir), table], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def request_etag(path: str, data, query: dict, accept: str, state: str = "") -> str:
+    """由程式版本、伺服器狀態 (state)、端點路徑、JSON 內容、查詢參數與 Accept 計算 ETag 值（不含引號）。"""
+    canonical = json.dumps(
+        [ETAG_VERSION, state, path, _normalize(data), sorted(query.items()), accept or ""],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def cache_control(shared: bool) -> str:
+    return f"{'public' if shared else 'private'}, max-age={CACHE_MAX_AGE}"
+
+
+def choose_encoding(accept_encodings):
+    """依 Accept-Encoding（werkzeug 的 Accept 物件）選擇壓縮方式，都不接受時回傳 None。"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compressible(mimetype: str) -> bool:
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_MIMETYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+# ==============================================================================
+# Flask 整合
+# ==============================================================================
+def cacheable(state, skip=None):
+    """
+    建立 cacheable_response 裝飾器，用於回應只由請求內容決定的端點。
+    state() 回傳目前的伺服器狀態（見 ephemeris_state），與請求一起計算 ETag；skip(data) 為真的請求不快取。
+    If-None-Match 相符時不計算、直接回傳 304；成功的回應加上 ETag 與 Cache-Control。
+    """
+    def cacheable_response(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            data = request.get_json(force=True, silent=True)
+            if data is None or (skip is not None and skip(data)):
+                return f(*args, **kwargs)
+            etag = request_etag(request.path, data, request.args.to_dict(flat=False),
+                                request.headers.get('Accept'), state())
+            shared = not request.headers.get('X-API-Key')
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control(shared)
+            response.vary.add('Accept-Encoding')
+            return response
+        return decorated_function
+    return cacheable_response
+
+
+def compress_response(response):
+    """after_request：用戶端接受時以 brotli / gzip 壓縮回應；串流、已壓縮或太小的回應維持原樣。"""
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not compressible(response.mimetype)):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None or response.content_length is None or response.content_length < COMPRESS_MIN_SIZE:
+        return response
+    with chart_metrics.stage("compress"):
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
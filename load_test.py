@@ -0,0 +1,128 @@
+# load_test.py
+# 連線承載量測試：對執行中的伺服器同時發出大量請求，其中一部分模擬慢速客戶端
+# （慢慢上傳請求內容、慢慢讀取回應），量測一般客戶端在這種負載下的延遲與成功率。
+# 用來比較 gunicorn 同步 worker（Procfile）與 ASGI 模式（asgi.py）。
+#
+# 用法：
+#   gunicorn app:app -w 2 -b 127.0.0.1:8000            # 或 uvicorn asgi:application --port 8000
+#   python load_test.py --url http://127.0.0.1:8000 --fast-clients 200 --slow-clients 50
+#
+# 只使用標準函式庫 (asyncio)，不需另外安裝 HTTP 客戶端。
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from urllib.parse import urlsplit
+
+PERSON = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30,
+          "latitude": 25.09, "longitude": 121.52, "timezone": "Asia/Taipei",
+          "optional_planets": ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "上升", "天頂"]}
+
+ENDPOINTS = {
+    "single": ("POST", "/calculate_single_chart", PERSON),
+    "ai_single": ("POST", "/api/v1/chart/single", PERSON),
+    "timezones": ("GET", "/api/timezones", None),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def build_request(method, path, host, payload, api_key):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", "Connection: close", f"Content-Length: {len(body)}"]
+    if payload is not None:
+        lines.append("Content-Type: application/json")
+    if api_key:
+        lines.append(f"X-API-Key: {api_key}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"), body
+
+
+async def one_request(host, port, head, body, timeout, slow_seconds=0.0):
+    """送出一個請求並讀完回應，回傳 (狀態碼或錯誤名稱, 秒數)。slow_seconds > 0 時慢慢上傳內容並慢慢讀取回應。"""
+    started = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(head)
+        if slow_seconds > 0 and body:
+            pieces = max(1, min(len(body), 20))
+            size = math.ceil(len(body) / pieces)
+            for i in range(0, len(body), size):
+                writer.write(body[i:i + size])
+                await writer.drain()
+                await asyncio.sleep(slow_seconds / pieces)
+        else:
+            writer.write(body)
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1]) if status_line else "closed"
+        while True:
+            chunk = await asyncio.wait_for(reader.read(1024 if slow_seconds > 0 else 65536), timeout)
+            if not chunk:
+                break
+            if slow_seconds > 0:
+                await asyncio.sleep(0.01)
+        return status, time.perf_counter() - started
+    except asyncio.TimeoutError:
+        return "timeout", time.perf_counter() - started
+    except OSError as e:
+        return type(e).__name__, time.perf_counter() - started
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    method, path, payload = ENDPOINTS[args.endpoint]
+    head, body = build_request(method, path, f"{host}:{port}", payload, args.api_key)
+
+    started = time.perf_counter()
+    slow = [one_request(host, port, head, body, args.timeout, args.slow_seconds) for _ in range(args.slow_clients)]
+    slow_tasks = [asyncio.ensure_future(task) for task in slow]
+    await asyncio.sleep(0.2)  # 讓慢速客戶端先佔住連線
+    fast_results = await asyncio.gather(*[one_request(host, port, head, body, args.timeout) for _ in range(args.fast_clients)])
+    fast_elapsed = time.perf_counter() - started
+    slow_results = await asyncio.gather(*slow_tasks)
+
+    report = {"url": args.url, "endpoint": args.endpoint, "fast_clients": args.fast_clients,
+              "slow_clients": args.slow_clients, "slow_seconds": args.slow_seconds}
+    for label, results in (("fast", fast_results), ("slow", slow_results)):
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        latencies = sorted(seconds for status, seconds in results if status == 200)
+        report[label] = {
+            "statuses": statuses,
+            "ok": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
+    report["fast"]["wall_seconds"] = round(fast_elapsed, 2)
+    return report
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="同時連線承載量測試（含慢速客戶端）。",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="伺服器位址")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="single", help="要測試的端點")
+    parser.add_argument("--fast-clients", type=int, default=200, help="一般客戶端數量（同時發出）")
+    parser.add_argument("--slow-clients", type=int, default=50, help="慢速客戶端數量")
+    parser.add_argument("--slow-seconds", type=float, default=2.0, help="慢速客戶端上傳請求內容所花的秒數")
+    parser.add_argument("--timeout", type=float, default=30.0, help="單一請求的逾時秒數")
+    parser.add_argument("--api-key", default=os.getenv("ASTRO_API_KEY"), help="受保護端點的 API 金鑰")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(run(parse_arguments())), ensure_ascii=False, indent=2))
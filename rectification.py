@@ -0,0 +1,237 @@
+# rectification.py
+# 出生時間校正 (rectification)：在一段時間窗內逐步掃描候選出生時間，依人生事件的條件為每個候選評分。
+#
+# 各部分的計算量：
+#   四軸與宮頭      每個候選都重新計算（上升約每 4 分鐘移動 1°，是校正的主要依據）
+#   本命星體位置    每 ANCHOR_INTERVAL_DAYS 精確計算一次（錨點），候選由最近錨點的黃經與速度線性外推，
+#                   與錨點最多相差半小時，誤差 < 0.2″
+#   事件的行運位置與太陽弧
+#                   與候選無關，每個事件只計算一次（太陽弧以時間窗中點的出生時刻計算，
+#                   時間窗內的差異小於 0.01°）
+# 評分時每個條件以 numpy 對整段候選一次算出與指定相位的偏差，落在條件的 orb 內即符合
+# （不受 aspect_between 內建容許度的限制），只有符合的候選才判斷入相或出相；
+# 候選可再分段交給 compute_backend 的行程池平行評分。
+#
+# 事件條件 (criteria) 的格式，未提供時使用 default_criteria()：
+#   {"type": "transit", "transit": "土星", "natal": "上升", "aspects": ["合相", "刑", "沖"], "orb": 2, "weight": 1}
+#       事件當下的行運天體與本命點形成指定相位
+#   {"type": "solar_arc", "directed": "天頂", "natal": "太陽", "aspects": ["合相"], "orb": 1, "weight": 1}
+#       以太陽弧推運的本命點與本命點形成指定相位
+#   {"type": "transit_house", "transit": "木星", "house": 7, "weight": 1}
+#       事件當下的行運天體落在本命的某一宮
+# 本命點可以是星體、四軸（上升、天頂、下降、天底）或宮頭（"1宮" ~ "12宮"）。
+# 相位條件的得分為 weight × (1 - 偏差 / orb)，宮位條件符合時得 weight；事件的 weight 再乘上去。
+import datetime
+
+import numpy as np
+
+ANCHOR_INTERVAL_DAYS = 1 / 24
+TROPICAL_YEAR_DAYS = 365.2422
+
+ANGLE_NAMES = ("上升", "下降", "天頂", "天底")
+CUSP_NAMES = {f"{house}宮": house for house in range(1, 13)}
+
+DEFAULT_ANGLES = ("上升", "天頂")
+DEFAULT_TRANSIT_BODIES = ("火星", "木星", "土星", "天王", "海王", "冥王")
+DEFAULT_ARC_TARGETS = ("太陽", "月亮", "水星", "金星", "火星", "木星", "土星")
+DEFAULT_ASPECTS = ("合相", "刑", "沖")
+DEFAULT_TRANSIT_ORB = 2.0
+DEFAULT_ARC_ORB = 1.0
+
+CRITERION_TYPES = ("transit", "solar_arc", "transit_house")
+
+
+def default_criteria():
+    """
+    預設條件：外行星行運與上升、天頂的合、刑、沖，以及太陽弧推運的上升、天頂與本命個人行星的合、刑、沖。
+    （與上升、天頂的沖即是與下降、天底的合相，不另外列出，避免同一條軸線重複計分。）
+    """
+    criteria = [{"type": "transit", "transit": body, "natal": angle, "aspects": list(DEFAULT_ASPECTS),
+                 "orb": DEFAULT_TRANSIT_ORB, "weight": 1.0}
+                for body in DEFAULT_TRANSIT_BODIES for angle in DEFAULT_ANGLES]
+    criteria += [{"type": "solar_arc", "directed": angle, "natal": target, "aspects": list(DEFAULT_ASPECTS),
+                  "orb": DEFAULT_ARC_ORB, "weight": 1.0}
+                 for angle in DEFAULT_ANGLES for target in DEFAULT_ARC_TARGETS]
+    return criteria
+
+
+def parse_criteria(criteria, bodies, aspects):
+    """
+    檢查並補齊事件條件。bodies 為可查詢星曆的天體名稱，aspects 為 {相位名稱: 角度}。
+    criteria 為 None 時使用 default_criteria()；格式錯誤時拋出 ValueError。
+    """
+    if criteria is None:
+        criteria = default_criteria()
+    if not isinstance(criteria, list) or not criteria:
+        raise ValueError("criteria 必須是非空的列表")
+    natal_points = set(bodies) | set(ANGLE_NAMES) | set(CUSP_NAMES)
+    parsed = []
+    for item in criteria:
+        if not isinstance(item, dict) or item.get("type") not in CRITERION_TYPES:
+            raise ValueError(f"條件的 type 必須是 {', '.join(CRITERION_TYPES)} 之一: {item}")
+        kind = item["type"]
+        criterion = {"type": kind, "weight": float(item.get("weight", 1.0))}
+        if kind in ("transit", "transit_house"):
+            if item.get("transit") not in bodies:
+                raise ValueError(f"無效的行運天體: {item.get('transit')}")
+            criterion["transit"] = item["transit"]
+        if kind == "solar_arc":
+            if item.get("directed") not in natal_points:
+                raise ValueError(f"無效的推運點: {item.get('directed')}")
+            criterion["directed"] = item["directed"]
+        if kind in ("transit", "solar_arc"):
+            if item.get("natal") not in natal_points:
+                raise ValueError(f"無效的本命點: {item.get('natal')}")
+            names = item.get("aspects", list(DEFAULT_ASPECTS))
+            if not isinstance(names, list) or not names or any(name not in aspects for name in names):
+                raise ValueError(f"無效的相位列表: {names}")
+            orb = float(item.get("orb", DEFAULT_TRANSIT_ORB if kind == "transit" else DEFAULT_ARC_ORB))
+            if orb <= 0:
+                raise ValueError("orb 必須大於 0")
+            angles = sorted({aspects[name]: name for name in names}.items())
+            criterion.update(natal=item["natal"], aspects=frozenset(names), orb=orb,
+                             angles=tuple(angle for angle, _ in angles), angle_names=tuple(name for _, name in angles))
+        else:
+            house = int(item.get("house", 0))
+            if not 1 <= house <= 12:
+                raise ValueError(f"house 必須是 1 ~ 12: {item.get('house')}")
+            criterion["house"] = house
+        parsed.append(criterion)
+    return parsed
+
+
+def natal_bodies(events):
+    """所有事件條件中用到的本命星體（不含四軸與宮頭）。"""
+    names = set()
+    for event in events:
+        for criterion in event["criteria"]:
+            for key in ("natal", "directed"):
+                name = criterion.get(key)
+                if name is not None and name not in ANGLE_NAMES and name not in CUSP_NAMES:
+                    names.add(name)
+    return names
+
+
+def transit_bodies(criteria):
+    return {criterion["transit"] for criterion in criteria if "transit" in criterion}
+
+
+def candidate_times(start: datetime.datetime, end: datetime.datetime, step_minutes: float):
+    """時間窗內的候選當地時間（含起點與終點）。"""
+    step = datetime.timedelta(minutes=step_minutes)
+    times, current = [], start
+    while current <= end:
+        times.append(current)
+        current += step
+    return times
+
+
+def progressed_jd(jd_birth: float, jd_event: float) -> float:
+    """二次推運：出生後一日對應人生一年。"""
+    return jd_birth + (jd_event - jd_birth) / TROPICAL_YEAR_DAYS
+
+
+# ==============================================================================
+# 星體位置的錨點
+# ==============================================================================
+def anchor_times(jd_first: float, jd_last: float):
+    count = int((jd_last - jd_first) / ANCHOR_INTERVAL_DAYS) + 1
+    return [jd_first + i * ANCHOR_INTERVAL_DAYS for i in range(count + 1)]
+
+
+def positions_near_anchor(anchors, jd_first: float, jd_ut: float):
+    """
+    由最近的錨點外推 jd_ut 的本命星體位置，回傳 {名稱: (黃經, 速度)}。
+    anchors 為 anchor_times 各時刻的 (黃經 dict, 速度 dict)。
+    """
+    index = min(max(round((jd_ut - jd_first) / ANCHOR_INTERVAL_DAYS), 0), len(anchors) - 1)
+    lons, speeds = anchors[index]
+    dt = jd_ut - (jd_first + index * ANCHOR_INTERVAL_DAYS)
+    points = {name: ((lon + speeds.get(name, 0.0) * dt) % 360, speeds.get(name, 0.0)) for name, lon in lons.items()}
+    if "北交" in points and "南交" in points:
+        # 南交的速度欄位是北交速度取負號，不代表實際移動方向，改由北交推出
+        points["南交"] = ((points["北交"][0] + 180) % 360, points["南交"][1])
+    return points
+
+
+# ==============================================================================
+# 評分
+# ==============================================================================
+class _PointColumns:
+    """各候選本命點黃經的 numpy 欄，用到時才建立。"""
+
+    def __init__(self, charts):
+        self.charts = charts
+        self.columns = {}
+
+    def get(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            house = CUSP_NAMES.get(name)
+            if house is not None:
+                values = [cusps[house] for _, cusps in self.charts]
+            else:
+                values = [points[name][0] if name in points else np.nan for points, _ in self.charts]
+            column = self.columns[name] = np.asarray(values, dtype=float)
+        return column
+
+
+def _near_aspect(lon_a, lon_b, criterion):
+    """
+    以向量運算找出角距落在任一指定相位 orb 內的候選，回傳 [(候選序號, 相位序號, 偏差), ...]；
+    相位序號對應 criterion["angles"]，同時落在兩個相位內時取偏差較小者。
+    """
+    separation = np.abs(lon_a - lon_b) % 360
+    separation = np.minimum(separation, 360 - separation)
+    deviations = np.abs(separation[:, None] - np.asarray(criterion["angles"])[None, :])
+    nearest = np.argmin(deviations, axis=1)
+    deviation = deviations[np.arange(len(separation)), nearest]
+    return [(i, int(nearest[i]), float(deviation[i])) for i in np.flatnonzero(deviation <= criterion["orb"]).tolist()]
+
+
+def _aspect_score(criterion, p1_name, p2_name, lon_a, lon_b, speed_a, angle_index, deviation, motion_fn):
+    angle = criterion["angles"][angle_index]
+    aspect_type = motion_fn(p1_name, p2_name, lon_a, lon_b, speed_a, 0.0, angle, deviation)
+    return criterion["weight"] * (1 - deviation / criterion["orb"]), {
+        "aspect_name": criterion["angle_names"][angle_index], "orb": round(deviation, 4), "aspect_type": aspect_type}
+
+
+def score_candidates(charts: list, events: list, motion_fn, house_fn):
+    """
+    為一組候選出生時間評分。charts 為每個候選的 (points, cusps)：points 為 {名稱: (黃經, 速度)}（本命星體與四軸），
+    cusps 為 {宮位: 黃經}。events 為已準備好的事件（含 transits、solar_arc、criteria、weight）。
+    motion_fn 與 house_fn 為 aspect_motion（入相／出相標籤）與 find_house。回傳與 charts 對應的 [(總分, 符合的條件列表), ...]。
+    """
+    columns = _PointColumns(charts)
+    totals = [0.0] * len(charts)
+    matches = [[] for _ in charts]
+    for event_index, event in enumerate(events):
+        for criterion in event["criteria"]:
+            kind = criterion["type"]
+            hits = []
+            if kind == "transit_house":
+                transit_lon = event["transits"][criterion["transit"]][0]
+                detail = {"transit": criterion["transit"], "house": criterion["house"]}
+                hits = [(i, criterion["weight"], detail) for i, (_, cusps) in enumerate(charts)
+                        if house_fn(transit_lon, cusps)[0] == criterion["house"]]
+            elif kind == "transit":
+                transit_lon, transit_speed = event["transits"][criterion["transit"]]
+                natal = columns.get(criterion["natal"])
+                label = {"transit": criterion["transit"], "natal": criterion["natal"]}
+                for i, angle_index, deviation in _near_aspect(transit_lon, natal, criterion):
+                    score, detail = _aspect_score(criterion, criterion["transit"], criterion["natal"], transit_lon,
+                                                  float(natal[i]), transit_speed, angle_index, deviation, motion_fn)
+                    hits.append((i, score, {**label, **detail}))
+            else:
+                directed = (columns.get(criterion["directed"]) + event["solar_arc"]) % 360
+                natal = columns.get(criterion["natal"])
+                label = {"directed": criterion["directed"], "natal": criterion["natal"]}
+                for i, angle_index, deviation in _near_aspect(directed, natal, criterion):
+                    score, detail = _aspect_score(criterion, criterion["directed"], criterion["natal"], float(directed[i]),
+                                                  float(natal[i]), 0.0, angle_index, deviation, motion_fn)
+                    hits.append((i, score, {**label, **detail}))
+            for i, score, detail in hits:
+                score *= event["weight"]
+                totals[i] += score
+                matches[i].append({"event": event_index, "type": kind, **detail, "score": round(score, 4)})
+    return list(zip(totals, matches))
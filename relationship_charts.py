@@ -0,0 +1,51 @@
+# relationship_charts.py
+# 關係盤：組合盤 (composite) 與時空中點盤 (Davison)。
+#
+#   組合盤      兩張本命盤各點與各宮頭的中點。所有星體、四軸與 12 個宮頭一次以 numpy 取圓周平均，
+#               不再逐點呼叫 get_midpoint（結果相同，只在最後一位浮點數可能有差異）。
+#   時空中點盤  兩人出生的 UTC 時刻與出生地的中點，在該時間地點起一張一般的命盤（只查詢一次星曆）。
+#
+# 本命盤的星體位置與宮頭經由 compute_positions / compute_four_angles 的快取取得，
+# 同一組出生資料重複出現時不會再呼叫 swe.calc_ut / swe.houses。
+import datetime
+
+import numpy as np
+
+HOUSE_NUMBERS = tuple(range(1, 13))
+
+
+def circular_midpoints(lons_a, lons_b) -> np.ndarray:
+    """兩組黃經逐一取圓周中點（較短弧的中點），回傳 0 ~ 360 的 numpy 陣列。"""
+    rad_a = np.radians(np.asarray(lons_a, dtype=float))
+    rad_b = np.radians(np.asarray(lons_b, dtype=float))
+    x = np.cos(rad_a) + np.cos(rad_b)
+    y = np.sin(rad_a) + np.sin(rad_b)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+def composite_positions(points_a: dict, points_b: dict, cusps_a: dict, cusps_b: dict, names):
+    """
+    組合盤的點與宮頭。points_* 為 {名稱: 黃經}，cusps_* 為 {宮位: 黃經}；
+    names 中兩張盤都有的點與 12 個宮頭一次取中點，回傳 ({名稱: 黃經}, {宮位: 黃經})。
+    """
+    names = [name for name in names if name in points_a and name in points_b]
+    midpoints = circular_midpoints(
+        [points_a[name] for name in names] + [cusps_a[house] for house in HOUSE_NUMBERS],
+        [points_b[name] for name in names] + [cusps_b[house] for house in HOUSE_NUMBERS],
+    ).tolist()
+    return dict(zip(names, midpoints[:len(names)])), dict(zip(HOUSE_NUMBERS, midpoints[len(names):]))
+
+
+def midpoint_moment(utc_a: datetime.datetime, utc_b: datetime.datetime) -> datetime.datetime:
+    """兩個 UTC 時刻的中點，四捨五入到秒。"""
+    midpoint = utc_a + (utc_b - utc_a) / 2
+    return (midpoint + datetime.timedelta(microseconds=500000)).replace(microsecond=0)
+
+
+def midpoint_location(lat_a: float, lon_a: float, lat_b: float, lon_b: float):
+    """
+    出生地的中點：緯度取平均，經度取圓周中點（與組合盤的經緯度相同）。
+    經度換算為 -180 ~ 180，回傳 (緯度, 經度)。
+    """
+    lon = float(circular_midpoints([lon_a], [lon_b])[0])
+    return (lat_a + lat_b) / 2, lon - 360 if lon > 180 else lon
@@ -1,61 +1,392 @@
-# swiss_ephe_downloader.py (Final Verified Version)
-import os
-import requests
-from tqdm import tqdm
+# swiss_ephe_downloader.py
+# 星曆檔的準備：核心檔案於啟動時平行下載，小行星檔案在第一次用到對應天體時才下載。
+#
+# - 下載先寫入 <檔名>.part，中斷後再次下載會以 HTTP Range 續傳；寫入的位元組數必須與伺服器回報的長度相符。
+# - 下載後與既有檔案都會比對清單檔 (manifest) 的 SHA-256 與大小；驗證結果依 (大小, mtime)
+#   記錄在 .verified.json，之後啟動的 worker 不必重新計算雜湊。既有檔案驗證失敗時移開：
+#   比清單短的檔案改名為 .part 續傳，其他的刪除後重新下載。
+# - 有清單檔時，清單中沒有的檔案一律不下載、不視為可用（fail closed）；磁碟上已有的這類檔案改名為
+#   <檔名>.unverified，讓 Swisseph 不會讀到（缺檔時行星改用 Moshier 星曆，小行星則回報無法計算）。
+#   尚未提交清單檔時只檢查大小（非空且與伺服器回報的長度相符），並在記錄中提醒。
+#   ASTRO_EPHE_ALLOW_UNVERIFIED 可明確指定是否接受清單中沒有的檔案。
+# - 以 EPHE_DIR/.download.lock 檔案鎖協調多個 gunicorn worker，同一時間只有一個行程在下載，
+#   其他行程等鎖釋放後直接使用已完成的檔案。
+#
+# 環境變數：
+#   ASTRO_EPHE_BASE_URL          星曆檔鏡像站網址（可指向本機 HTTP 伺服器測試）
+#   ASTRO_EPHE_MANIFEST          清單檔路徑，預設為本檔旁的 ephe_manifest.json
+#   ASTRO_EPHE_ALLOW_UNVERIFIED  1 接受清單檔中沒有的檔案（只檢查非空與下載長度），0 一律拒絕；
+#                                未設定時依是否有清單檔決定（沒有清單檔時接受）
+#   ASTRO_EPHE_DOWNLOAD_WORKERS  同時下載的檔案數，預設 4
+#   ASTRO_SKIP_EPHE_DOWNLOAD     設定後完全不下載（Swisseph 缺檔時改用 Moshier 星曆）
+#
+# 清單檔格式：{"files": {"sepl_18.se1": {"sha256": "...", "size": 484055}, ...}}
+# 產生方式：python swiss_ephe_downloader.py --all 下載（尚無清單檔時只檢查大小）後確認檔案來源，
+# 再以 `python swiss_ephe_downloader.py --write-manifest` 由目前的檔案產生。
+import argparse
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import swisseph as swe
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能退回行程內的鎖
+    fcntl = None
 
 # --- Configuration ---
 # This path points to the persistent disk on Render
 EPHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data', 'ephe')
 
 # Use a dedicated and verified GitHub mirror for file downloads
-BASE_URL = "https://raw.githubusercontent.com/gemini-astro-data/swisseph-files-core/main/"
+DEFAULT_BASE_URL = "https://raw.githubusercontent.com/gemini-astro-data/swisseph-files-core/main/"
+BASE_URL = os.getenv("ASTRO_EPHE_BASE_URL", DEFAULT_BASE_URL)
+
+MANIFEST_PATH = os.getenv(
+    "ASTRO_EPHE_MANIFEST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ephe_manifest.json"))
+DOWNLOAD_WORKERS = int(os.getenv("ASTRO_EPHE_DOWNLOAD_WORKERS", "4"))
+DOWNLOADS_ENABLED = not os.getenv("ASTRO_SKIP_EPHE_DOWNLOAD")
+# None：依是否有清單檔決定（見 allow_unverified_default）
+_ALLOW_UNVERIFIED_ENV = os.getenv("ASTRO_EPHE_ALLOW_UNVERIFIED")
+ALLOW_UNVERIFIED = None if not _ALLOW_UNVERIFIED_ENV else _ALLOW_UNVERIFIED_ENV.lower() not in ("0", "false", "no")
 
-# Core file list needed for the application
-FILES_TO_DOWNLOAD = [
+# 啟動時一定要有的檔案（行星、月亮、主要小行星、恆星表）
+CORE_FILES = [
     "sepl_18.se1", "semo_18.se1", "seas_18.se1", "sech_18.se1", "sefo_18.se1",
-    "ast_433.eph", "ast_016.eph", "fixstars.cat", "sefstars.txt", "sweph.cat",
-    "solarsys.cat"
+    "fixstars.cat", "sefstars.txt", "sweph.cat", "solarsys.cat"
 ]
 
-def ensure_ephe_files_exist():
-    """Checks for ephemeris files and downloads them if they are missing."""
-    logging.info(f"Checking for ephemeris files in: {EPHE_DIR}")
-    os.makedirs(EPHE_DIR, exist_ok=True)
-    logging.info(f"Target directory '{EPHE_DIR}' is ready.")
-
-    for filename in FILES_TO_DOWNLOAD:
-        full_path = os.path.join(EPHE_DIR, filename)
-        
-        if os.path.exists(full_path):
-            logging.info(f"File '{filename}' already exists. Skipping download.")
-            continue
-        
-        url = BASE_URL + filename
-        logging.info(f"File '{filename}' not found. Downloading from {url}...")
-        
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-            total_size = int(response.headers.get('content-length', 0))
-            
-            with open(full_path, 'wb') as f, tqdm(
-                desc=filename, total=total_size, unit='iB',
-                unit_scale=True, unit_divisor=1024,
-            ) as bar:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        size = f.write(chunk)
-                        bar.update(size)
-            
-            logging.info(f"Successfully downloaded '{filename}'.")
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error downloading '{filename}': {e}")
-            if os.path.exists(full_path):
-                os.remove(full_path)
-            raise RuntimeError(f"Failed to download required file {filename}. Application cannot start.") from e
\ No newline at end of file
+# 只有特定天體才需要的檔案，第一次計算該天體時才下載
+LAZY_BODY_FILES = {
+    swe.AST_OFFSET + 433: "ast_433.eph",  # 愛神
+    swe.AST_OFFSET + 16: "ast_016.eph",   # 靈神
+}
+
+# Core file list needed for the application（保留舊名稱，供既有程式參照）
+FILES_TO_DOWNLOAD = CORE_FILES + list(LAZY_BODY_FILES.values())
+
+CHUNK_SIZE = 64 * 1024
+REQUEST_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+_LOCK_FILENAME = ".download.lock"
+_QUARANTINE_SUFFIX = ".unverified"
+_VERIFIED_FILENAME = ".verified.json"
+
+# 本行程已確認可用的檔案（完整路徑），之後的檢查只需查集合
+_ready_files = set()
+_failed_files = {}
+_thread_lock = threading.Lock()
+# 下載失敗後，同一個檔案至少間隔這麼久才重試（秒）
+RETRY_INTERVAL_SECONDS = 300
+
+
+class EphemerisDownloadError(RuntimeError):
+    pass
+
+
+def load_manifest(path=None):
+    """讀取清單檔，回傳 {檔名: {"sha256": ..., "size": ...}}；沒有清單時回傳空字典。"""
+    path = path or MANIFEST_PATH
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("files", data)
+
+
+def allow_unverified_default(manifest):
+    """ALLOW_UNVERIFIED 未設定時：還沒有清單（manifest 為空）就只檢查大小，有清單後拒絕清單外的檔案。"""
+    if ALLOW_UNVERIFIED is not None:
+        return ALLOW_UNVERIFIED
+    return not manifest
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def provisioning_lock(ephe_dir):
+    """跨行程的檔案鎖（加上行程內的執行緒鎖）。"""
+    os.makedirs(ephe_dir, exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(ephe_dir, _LOCK_FILENAME), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_verified(ephe_dir):
+    try:
+        with open(os.path.join(ephe_dir, _VERIFIED_FILENAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_verified(ephe_dir, verified):
+    path = os.path.join(ephe_dir, _VERIFIED_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(verified, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def is_valid(filename, ephe_dir, manifest, verified, allow_unverified=False):
+    """
+    檔案存在且符合清單。清單中沒有的檔案視為無效，allow_unverified 時只要求非空檔案。
+    已驗證且未變動的檔案不重算雜湊。
+    """
+    path = os.path.join(ephe_dir, filename)
+    if not os.path.isfile(path):
+        return False
+    signature = _file_signature(path)
+    expected = manifest.get(filename)
+    if not expected:
+        return allow_unverified and signature[0] > 0
+    if verified.get(filename) == signature:
+        return True
+    if expected.get("size") is not None and signature[0] != expected["size"]:
+        return False
+    if expected.get("sha256") and sha256_of(path) != expected["sha256"].lower():
+        return False
+    verified[filename] = signature
+    return True
+
+
+def _discard_invalid(filename, ephe_dir, expected):
+    """移開驗證失敗的既有檔案：比清單短的當作未下載完的 .part 續傳，其他的刪除。"""
+    path = os.path.join(ephe_dir, filename)
+    if not os.path.isfile(path):
+        return
+    size = os.path.getsize(path)
+    if expected and expected.get("size") is not None and 0 < size < expected["size"] \
+            and not os.path.exists(path + ".part"):
+        logging.warning(f"'{filename}' is incomplete ({size} bytes); resuming the download")
+        os.replace(path, path + ".part")
+    else:
+        logging.warning(f"'{filename}' failed verification; downloading it again")
+        os.remove(path)
+
+
+def _quarantine(filename, ephe_dir):
+    """把拒絕使用的檔案改名為 <檔名>.unverified，Swisseph 就不會讀到它。"""
+    path = os.path.join(ephe_dir, filename)
+    if os.path.isfile(path):
+        logging.warning(f"Moving unverified '{filename}' aside to '{filename}{_QUARANTINE_SUFFIX}'")
+        os.replace(path, path + _QUARANTINE_SUFFIX)
+
+
+def _reported_length(response):
+    """由回應標頭取得完整檔案的長度（206 取 Content-Range 的總長度），未提供時回傳 None。"""
+    if response.status_code == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def download_file(filename, ephe_dir, base_url, expected=None, session=None):
+    """
+    下載單一檔案到 ephe_dir。先寫入 .part，已有部分內容時以 Range 續傳；
+    寫入長度與伺服器回報的長度相符、且通過清單比對後，才改名為正式檔名。
+    """
+    import requests  # 只有真的要下載時才載入；只做計算的行程（見 astro_engine）不必付出匯入成本
+
+    path = os.path.join(ephe_dir, filename)
+    part_path = path + ".part"
+    url = base_url.rstrip("/") + "/" + filename
+    http = session or requests
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if expected and expected.get("size") is not None and offset > expected["size"]:
+        os.remove(part_path)
+        offset = 0
+    headers = dict(REQUEST_HEADERS)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        logging.info(f"Resuming '{filename}' from byte {offset} ({url})")
+    else:
+        logging.info(f"Downloading '{filename}' from {url}...")
+
+    reported_length = None
+    try:
+        with http.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416 and offset:
+                # 伺服器認為範圍無效：.part 可能已是完整檔案，交給下面的檢查決定
+                pass
+            else:
+                response.raise_for_status()
+                reported_length = _reported_length(response)
+                # 伺服器不支援 Range 時會回傳完整內容 (200)，此時從頭寫入
+                mode = "ab" if offset and response.status_code == 206 else "wb"
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+    except requests.exceptions.RequestException as e:
+        # 保留 .part，下次從中斷處續傳
+        raise EphemerisDownloadError(f"Error downloading '{filename}': {e}") from e
+
+    if reported_length is not None and os.path.getsize(part_path) != reported_length:
+        # 連線提早結束：保留 .part 續傳；比回報長度還長則內容不可信，刪除
+        size = os.path.getsize(part_path)
+        if size > reported_length:
+            os.remove(part_path)
+        raise EphemerisDownloadError(
+            f"'{filename}' is truncated: server reported {reported_length} bytes, got {size}")
+
+    if expected:
+        size = os.path.getsize(part_path)
+        if expected.get("size") is not None and size != expected["size"]:
+            if size > expected["size"]:
+                os.remove(part_path)
+            raise EphemerisDownloadError(
+                f"'{filename}' size mismatch: expected {expected['size']} bytes, got {size}")
+        if expected.get("sha256") and sha256_of(part_path) != expected["sha256"].lower():
+            os.remove(part_path)
+            raise EphemerisDownloadError(f"'{filename}' failed SHA-256 verification")
+    elif os.path.getsize(part_path) == 0:
+        os.remove(part_path)
+        raise EphemerisDownloadError(f"'{filename}' downloaded as an empty file")
+
+    os.replace(part_path, path)
+    logging.info(f"Successfully downloaded '{filename}'.")
+    return path
+
+
+def ensure_files(filenames, ephe_dir=None, base_url=None, manifest=None, workers=None, allow_unverified=None):
+    """
+    確保 filenames 都已存在且通過驗證，缺少或損壞的檔案平行下載。
+    清單中沒有的檔案不下載、已有的移到一旁，並回報錯誤（allow_unverified 為 True 時例外，預設見 allow_unverified_default）。
+    回傳 {檔名: 錯誤訊息}（全部成功時為空字典）。
+    """
+    ephe_dir = ephe_dir or EPHE_DIR
+    base_url = base_url or BASE_URL
+    pending = [name for name in filenames if os.path.join(ephe_dir, name) not in _ready_files]
+    if not pending:
+        return {}
+    manifest = load_manifest() if manifest is None else manifest
+    if allow_unverified is None:
+        allow_unverified = allow_unverified_default(manifest)
+        if allow_unverified and not manifest:
+            logging.warning("No ephemeris manifest found; ephemeris files are only checked for size. "
+                            "Generate one with `python swiss_ephe_downloader.py --write-manifest`.")
+
+    with provisioning_lock(ephe_dir):
+        # 取得鎖之後重新檢查：其他 worker 可能剛下載完
+        verified = _load_verified(ephe_dir)
+        verified_before = dict(verified)
+        missing, errors = [], {}
+        for name in pending:
+            if is_valid(name, ephe_dir, manifest, verified, allow_unverified):
+                _ready_files.add(os.path.join(ephe_dir, name))
+            elif not manifest.get(name) and not allow_unverified:
+                errors[name] = f"'{name}' is not listed in the ephemeris manifest; refusing to use an unverified file"
+                logging.error(errors[name])
+                _quarantine(name, ephe_dir)
+            else:
+                _discard_invalid(name, ephe_dir, manifest.get(name))
+                missing.append(name)
+
+        if missing:
+            import requests
+
+            logging.info(f"Ephemeris files to download into {ephe_dir}: {missing}")
+            with requests.Session() as session, \
+                    ThreadPoolExecutor(max_workers=max(1, min(workers or DOWNLOAD_WORKERS, len(missing)))) as pool:
+                futures = {
+                    name: pool.submit(download_file, name, ephe_dir, base_url, manifest.get(name), session)
+                    for name in missing
+                }
+                for name, future in futures.items():
+                    try:
+                        path = future.result()
+                    except EphemerisDownloadError as e:
+                        logging.error(str(e))
+                        errors[name] = str(e)
+                        continue
+                    if manifest.get(name):
+                        verified[name] = _file_signature(path)
+                    _ready_files.add(path)
+        if verified != verified_before:
+            _save_verified(ephe_dir, verified)
+    return errors
+
+
+def ensure_ephe_files_exist(ephe_dir=None, base_url=None):
+    """啟動時呼叫：確保核心星曆檔存在（小行星檔案改為用到時才下載）。"""
+    ephe_dir = ephe_dir or EPHE_DIR
+    if not DOWNLOADS_ENABLED:
+        logging.info("ASTRO_SKIP_EPHE_DOWNLOAD is set; skipping ephemeris download.")
+        return
+    logging.info(f"Checking for ephemeris files in: {ephe_dir}")
+    errors = ensure_files(CORE_FILES, ephe_dir=ephe_dir, base_url=base_url)
+    if errors:
+        raise RuntimeError(
+            f"Failed to download required files {sorted(errors)}. Application cannot start.")
+
+
+def ensure_body_files(pid):
+    """
+    計算天體前呼叫：若該天體需要額外的星曆檔且尚未就緒，就在此時下載。
+    下載失敗只記錄錯誤，之後由 Swisseph 回報缺檔；同一檔案在 RETRY_INTERVAL_SECONDS 內不重試。
+    """
+    filename = LAZY_BODY_FILES.get(pid)
+    if filename is None or not DOWNLOADS_ENABLED or os.path.join(EPHE_DIR, filename) in _ready_files:
+        return
+    failed_at = _failed_files.get(filename)
+    if failed_at is not None and time.monotonic() - failed_at < RETRY_INTERVAL_SECONDS:
+        return
+    if ensure_files([filename]):
+        _failed_files[filename] = time.monotonic()
+    else:
+        _failed_files.pop(filename, None)
+
+
+def write_manifest(path=None, ephe_dir=None, filenames=None):
+    """由 ephe_dir 內現有的檔案產生清單檔（請先確認這些檔案來源可信）。"""
+    path = path or MANIFEST_PATH
+    ephe_dir = ephe_dir or EPHE_DIR
+    files = {}
+    for name in filenames or FILES_TO_DOWNLOAD:
+        full_path = os.path.join(ephe_dir, name)
+        if os.path.isfile(full_path):
+            files[name] = {"sha256": sha256_of(full_path), "size": os.path.getsize(full_path)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=2, sort_keys=True)
+    return files
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="下載並驗證 Swiss Ephemeris 星曆檔。")
+    parser.add_argument("--all", action="store_true", help="連同小行星檔案一起下載")
+    parser.add_argument("--write-manifest", action="store_true", help="由目前的檔案產生清單檔，不下載")
+    args = parser.parse_args()
+    if args.write_manifest:
+        written = write_manifest()
+        print(f"已寫入 {MANIFEST_PATH}（{len(written)} 個檔案）")
+    else:
+        failed = ensure_files(FILES_TO_DOWNLOAD if args.all else CORE_FILES)
+        raise SystemExit(1 if failed else 0)
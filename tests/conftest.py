@@ -0,0 +1,33 @@
+# tests/conftest.py
+# 測試共用設定：專案根目錄加入匯入路徑，預設不下載星曆檔（缺檔時 Swisseph 改用 Moshier 星曆），並提供測試用 API 金鑰。
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("ASTRO_SKIP_EPHE_DOWNLOAD", "1")
+os.environ.setdefault("ASTRO_API_KEY", "test-key")
+
+# 固定版本的 Swiss Ephemeris 星曆檔（太陽到冥王、月亮、主要小行星，1800–2399 年），雜湊值記在同目錄的 manifest.json
+PINNED_EPHE_DIR = os.path.join(ROOT, "tests", "data", "ephe")
+
+
+@pytest.fixture(scope="session")
+def swieph_dir():
+    """
+    回傳含 .se1 星曆檔的目錄，供需要 FLG_SWIEPH 基準的測試使用。
+    預設為 tests/data/ephe 的固定檔案（先以清單檔驗證雜湊）；ASTRO_TEST_EPHE_DIR 可改指其他已驗證的目錄。
+    """
+    import swiss_ephe_downloader  # 在上面設定環境變數之後才匯入
+
+    override = os.getenv("ASTRO_TEST_EPHE_DIR")
+    if override:
+        return os.path.abspath(override)
+    for name, expected in swiss_ephe_downloader.load_manifest(os.path.join(PINNED_EPHE_DIR, "manifest.json")).items():
+        path = os.path.join(PINNED_EPHE_DIR, name)
+        assert swiss_ephe_downloader.sha256_of(path) == expected["sha256"], f"{path} 與清單檔的雜湊不符"
+    return PINNED_EPHE_DIR
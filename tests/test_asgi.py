@@ -0,0 +1,189 @@
+# tests/test_asgi.py
+# 直接以 ASGI 介面呼叫 AdmissionControlledApp，不需啟動伺服器。
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import asgi
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCOPE = {"type": "http", "method": "POST", "path": "/echo", "root_path": "", "query_string": b"",
+         "http_version": "1.1", "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+         "headers": [(b"content-type", b"application/json")]}
+
+
+def _echo_app(environ, start_response):
+    body = environ["wsgi.input"].read()
+    start_response("200 OK", [("Content-Type", "application/json")])
+    return [b'{"echo": ', body, b"}"]
+
+
+class _StreamingResult:
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        for index in range(3):
+            yield json.dumps({"line": index}).encode() + b"\n"
+
+    def close(self):
+        self.closed = True
+
+
+async def _request(application, body=b"{}", chunks=None):
+    messages = [{"type": "http.request", "body": part, "more_body": True} for part in chunks or ()]
+    messages.append({"type": "http.request", "body": body, "more_body": False})
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await application(dict(SCOPE), receive, send)
+    status = sent[0]["status"]
+    headers = dict(sent[0]["headers"])
+    return status, headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def test_request_body_is_passed_through():
+    application = asgi.AdmissionControlledApp(_echo_app, threads=1, max_queue=0)
+    status, _, body = asyncio.run(_request(application, b'"b"}', chunks=[b'{"a": 1, ', b'"x": ']))
+    assert status == 200
+    assert json.loads(body) == {"echo": {"a": 1, "x": "b"}}
+
+
+def test_streaming_response_is_closed():
+    result = _StreamingResult()
+
+    def streaming_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "application/x-ndjson")])
+        return result
+
+    status, _, body = asyncio.run(_request(asgi.AdmissionControlledApp(streaming_app, threads=1, max_queue=0)))
+    assert status == 200
+    assert [json.loads(line)["line"] for line in body.splitlines()] == [0, 1, 2]
+    assert result.closed
+
+
+def test_oversized_body_gets_413():
+    application = asgi.AdmissionControlledApp(_echo_app, threads=1, max_queue=0, max_body=10)
+    status, _, body = asyncio.run(_request(application, b"x" * 11))
+    assert status == 413
+    assert json.loads(body)["error_type"] == "payload_too_large"
+
+
+def test_requests_beyond_capacity_get_429():
+    release = threading.Event()
+
+    def blocking_app(environ, start_response):
+        release.wait(5)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"ok"]
+
+    application = asgi.AdmissionControlledApp(blocking_app, threads=1, max_queue=1, retry_after=3)
+
+    async def scenario():
+        running = [asyncio.ensure_future(_request(application)) for _ in range(2)]
+        while application.active < 2:
+            await asyncio.sleep(0.01)
+        rejected = await _request(application)
+        release.set()
+        return rejected, await asyncio.gather(*running)
+
+    (status, headers, body), accepted = asyncio.run(scenario())
+    assert status == 429
+    assert headers[b"retry-after"] == b"3"
+    assert json.loads(body)["error_type"] == "overloaded"
+    assert [response[0] for response in accepted] == [200, 200]
+    assert application.rejected == 1
+
+
+def test_capacity_is_released_after_each_request():
+    def failing_app(environ, start_response):
+        raise RuntimeError("boom")
+
+    application = asgi.AdmissionControlledApp(_echo_app, threads=1, max_queue=0)
+    for _ in range(3):
+        assert asyncio.run(_request(application))[0] == 200
+    assert application.active == 0
+
+    application = asgi.AdmissionControlledApp(failing_app, threads=1, max_queue=0)
+    for _ in range(2):
+        try:
+            asyncio.run(_request(application))
+        except RuntimeError:
+            pass
+        assert application.active == 0
+    assert application.rejected == 0
+
+
+def test_body_at_the_limit_is_accepted():
+    application = asgi.AdmissionControlledApp(_echo_app, threads=1, max_queue=0, max_body=10)
+    status, _, body = asyncio.run(_request(application, b"789", chunks=[b'"12345', b"6"]))
+    assert status == 200
+    assert body == b'{"echo": "123456789}'
+
+
+def test_disconnect_during_upload_sends_nothing():
+    called = []
+
+    def recording_app(environ, start_response):
+        called.append(True)
+        return _echo_app(environ, start_response)
+
+    application = asgi.AdmissionControlledApp(recording_app, threads=1, max_queue=0)
+    messages = [{"type": "http.request", "body": b"{", "more_body": True}, {"type": "http.disconnect"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(dict(SCOPE), receive, send))
+    assert sent == [] and called == [] and application.active == 0
+
+
+def test_lifespan_and_unknown_scopes():
+    application = asgi.AdmissionControlledApp(_echo_app, threads=2, max_queue=3)
+    assert application.capacity == 5
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(application({"type": "lifespan"}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+    with pytest.raises(RuntimeError, match="websocket"):
+        asyncio.run(application({"type": "websocket"}, receive, send))
+
+
+def test_limits_come_from_environment():
+    script = ("import asgi; a = asgi.application; "
+              "print(a.threads, a.max_queue, a.retry_after, a.max_body, a.capacity)")
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, ASTRO_ASGI_THREADS="3", ASTRO_ASGI_RETRY_AFTER="7",
+               ASTRO_ASGI_MAX_BODY="2048")
+    env.pop("ASTRO_ASGI_MAX_QUEUE", None)
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    # 未設定 ASTRO_ASGI_MAX_QUEUE 時為執行緒數的 4 倍
+    assert output.split() == ["3", "12", "7", "2048", "15"]
+
+    env["ASTRO_ASGI_MAX_QUEUE"] = "0"
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split()[1] == "0"
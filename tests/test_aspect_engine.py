@@ -0,0 +1,162 @@
+# tests/test_aspect_engine.py
+# NumPy 相位引擎與向量化之前逐對計算的版本（下面凍結的 _reference_*）逐筆比對：相位、容許度、入相／出相標籤與排序都必須相同。
+import random
+
+import pytest
+
+import astro_engine
+from astro_engine import ASPECTS, DEFAULT_ORB, FOUR_ANGLES_AND_NODES, PLANETS_THAT_CAN_RETROGRADE
+
+ALL_POINTS = list(astro_engine.PLANET_IDS) + ["南交", "上升", "下降", "天頂", "天底", "宿命", "福點"]
+
+
+# --- 向量化之前的實作（凍結，勿修改）---
+def _reference_aspect_between(p1_name, p2_name, lon_a, lon_b, speed_a, speed_b):
+    diff_current = abs(lon_a - lon_b)
+    diff_current = min(diff_current, 360 - diff_current)
+    for asp_name, target_angle in ASPECTS.items():
+        orb = DEFAULT_ORB.get(asp_name, 3)
+        current_deviation = abs(diff_current - target_angle)
+        if current_deviation <= orb:
+            aspect_type = ""
+            is_p1_moving = (p1_name in PLANETS_THAT_CAN_RETROGRADE or p1_name in ["太陽", "月亮"])
+            is_p2_moving = (p2_name in PLANETS_THAT_CAN_RETROGRADE or p2_name in ["太陽", "月亮"])
+            is_two_fixed_points = (p1_name in FOUR_ANGLES_AND_NODES and p2_name in FOUR_ANGLES_AND_NODES)
+            if (is_p1_moving or is_p2_moving) and not is_two_fixed_points:
+                dt_factor = 1 / 24
+                lon_a_next = (lon_a + speed_a * dt_factor) % 360
+                lon_b_next = (lon_b + speed_b * dt_factor) % 360
+                diff_next = abs(lon_a_next - lon_b_next)
+                diff_next = min(diff_next, 360 - diff_next)
+                next_deviation = abs(diff_next - target_angle)
+                if next_deviation < current_deviation - 1e-9:
+                    aspect_type = "入相"
+                elif next_deviation > current_deviation + 1e-9:
+                    aspect_type = "出相"
+                else:
+                    aspect_type = "入相"
+            return asp_name, current_deviation, aspect_type
+    return None
+
+
+def _reference_pairs(pairs):
+    res = []
+    for p1_name, p1_info, p2_name, p2_info in pairs:
+        asp_info = _reference_aspect_between(p1_name, p2_name, p1_info['lon'], p2_info['lon'],
+                                             p1_info.get('speed', 0.0), p2_info.get('speed', 0.0))
+        if asp_info:
+            asp_name, orb_val, aspect_type = asp_info
+            res.append({"p1_name": p1_name, "p2_name": p2_name, "aspect_name": asp_name,
+                        "aspect_type": aspect_type, "orb": orb_val, "p1_details": p1_info, "p2_details": p2_info})
+    return sorted(res, key=lambda item: (ASPECTS.get(item["aspect_name"], 361), item["orb"]))
+
+
+def _reference_list_aspects(points):
+    keys = list(points)
+    oppositions = [{"上升", "下降"}, {"天頂", "天底"}, {"北交", "南交"}]
+    return _reference_pairs(
+        (keys[i], points[keys[i]], keys[j], points[keys[j]])
+        for i in range(len(keys)) for j in range(i + 1, len(keys))
+        if points[keys[i]] and points[keys[j]] and {keys[i], keys[j]} not in oppositions)
+
+
+def _reference_list_interchart_aspects(chart1_points, chart2_points):
+    return _reference_pairs(
+        (p1_name, p1_info, p2_name, p2_info)
+        for p1_name, p1_info in chart1_points.items() for p2_name, p2_info in chart2_points.items()
+        if p1_info and 'lon' in p1_info and p2_info and 'lon' in p2_info)
+
+
+# --- 測試資料 ---
+def _random_points(rng, names=ALL_POINTS):
+    points = {}
+    for name in names:
+        speed = rng.choice([0.0, rng.uniform(-1.5, 1.5), rng.uniform(12, 15)])
+        points[name] = {"lon": rng.uniform(0, 360), "speed": speed}
+    return points
+
+
+def _edge_points(rng):
+    """相位角度正好在容許度邊界、正好成相、同速移動與靜止的點。"""
+    base = rng.uniform(0, 360)
+    points = {"太陽": {"lon": base, "speed": 1.0}}
+    names = [name for name in ALL_POINTS if name != "太陽"]
+    for name, (asp_name, angle) in zip(names, list(ASPECTS.items()) * 2):
+        offset = rng.choice([0.0, DEFAULT_ORB.get(asp_name, 3), -DEFAULT_ORB.get(asp_name, 3), 1e-12])
+        speed = rng.choice([0.0, 1.0, -1.0, 13.0])
+        points[name] = {"lon": (base + rng.choice([angle, -angle]) + offset) % 360, "speed": speed}
+    return points
+
+
+def _chart_points(*args):
+    chart = astro_engine.calculate_astrology_chart(*args, ALL_POINTS)
+    assert "error" not in chart
+    return chart["planet_positions"]
+
+
+REAL_CHARTS = [
+    (1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei"),
+    (1985, 6, 15, 3, 5, 29.5, 106.5, "Asia/Chongqing"),
+    (2024, 3, 1, 8, 0, 40.7, -74.0, "America/New_York"),
+]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_list_aspects_matches_reference(seed):
+    rng = random.Random(seed)
+    points = _edge_points(rng) if seed % 2 else _random_points(rng)
+    assert astro_engine.list_aspects(points) == _reference_list_aspects(points)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_interchart_aspects_match_reference(seed):
+    rng = random.Random(seed)
+    chart1, chart2 = _random_points(rng), _edge_points(rng)
+    chart2["福點"] = None  # 缺少資料的點略過
+    assert astro_engine.list_interchart_aspects(chart1, chart2) == _reference_list_interchart_aspects(chart1, chart2)
+    many = astro_engine.list_interchart_aspects_many(chart1, [chart2, chart1])
+    assert many == [_reference_list_interchart_aspects(chart1, chart2), _reference_list_interchart_aspects(chart1, chart1)]
+
+
+def test_real_charts_match_reference():
+    charts = [_chart_points(*args) for args in REAL_CHARTS]
+    for points in charts:
+        assert astro_engine.list_aspects(points) == _reference_list_aspects(points)
+    assert astro_engine.list_interchart_aspects(charts[0], charts[2]) == \
+        _reference_list_interchart_aspects(charts[0], charts[2])
+
+
+def test_labels_and_sort_order_golden():
+    points = {
+        "太陽": {"lon": 10.0, "speed": 1.0},
+        "月亮": {"lon": 95.0, "speed": 13.0},
+        "火星": {"lon": 12.0, "speed": 0.5},
+        "金星": {"lon": 135.0, "speed": 1.2},
+        "上升": {"lon": 190.5, "speed": 0.0},
+        "下降": {"lon": 10.5, "speed": 0.0},  # 上升／下降為定義上的對沖，不列出
+    }
+    aspects = [(asp["p1_name"], asp["p2_name"], asp["aspect_name"], asp["aspect_type"], round(asp["orb"], 6))
+               for asp in astro_engine.list_aspects(points)]
+    # 先依相位角度、再依容許度排序，容許度相同時維持配對順序；一小時後偏差變小為入相、變大為出相
+    assert aspects == [
+        ("太陽", "下降", "合相", "入相", 0.5),
+        ("火星", "下降", "合相", "出相", 1.5),
+        ("太陽", "火星", "合相", "入相", 2.0),
+        ("金星", "上升", "六合", "出相", 4.5),
+        ("太陽", "月亮", "刑", "入相", 5.0),
+        ("月亮", "上升", "刑", "入相", 5.5),
+        ("月亮", "下降", "刑", "入相", 5.5),
+        ("火星", "金星", "拱", "出相", 3.0),
+        ("金星", "下降", "拱", "出相", 4.5),
+        ("太陽", "金星", "拱", "出相", 5.0),
+        ("太陽", "上升", "沖", "入相", 0.5),
+        ("火星", "上升", "沖", "出相", 1.5),
+    ]
+
+
+def test_fixed_points_are_not_labelled():
+    points = {"上升": {"lon": 0.0, "speed": 0.0}, "天頂": {"lon": 90.0, "speed": 0.0},
+              "太陽": {"lon": 0.0, "speed": 0.0}}
+    labels = {(asp["p1_name"], asp["p2_name"]): asp["aspect_type"] for asp in astro_engine.list_aspects(points)}
+    # 兩個固定點之間不標示；靜止的移動點偏差不變，沿用原本的規則標為入相
+    assert labels == {("上升", "天頂"): "", ("上升", "太陽"): "入相", ("天頂", "太陽"): "入相"}
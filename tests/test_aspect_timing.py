@@ -0,0 +1,83 @@
+# tests/test_aspect_timing.py
+import swisseph as swe
+
+import aspect_timing
+
+NATAL_POINTS = {"太陽": 280.0, "月亮": 95.5, "上升": 200.25}
+ASPECTS = {"合相": 0, "刑": 90, "拱": 120, "沖": 180}
+JD_START = swe.julday(2024, 1, 1, 0.0)
+
+
+def _hits(transit_bodies, step_days, days=60):
+    return [(item["transit_name"], item["natal_name"], item["aspect_name"], item["jd_ut"])
+            for kind, item in aspect_timing.iter_transit_hits(
+                transit_bodies, NATAL_POINTS, ASPECTS, JD_START, JD_START + days, step_days)
+            if kind == "hit"]
+
+
+def test_large_step_does_not_skip_fast_bodies():
+    bodies = {"月亮": (swe.MOON, 0.0), "水星": (swe.MERCURY, 0.0)}
+    hourly = _hits(bodies, 1 / 24)
+    assert len(hourly) > 40
+    for step_days in (1.0, 3.0, 7.0, 30.0):
+        hits = _hits(bodies, step_days)
+        assert [hit[:3] for hit in hits] == [hit[:3] for hit in hourly]
+        assert max(abs(a[3] - b[3]) for a, b in zip(hits, hourly)) < 1e-4
+
+
+def test_scan_step_follows_fastest_body():
+    outer = {"木星": (swe.JUPITER, 0.0), "土星": (swe.SATURN, 0.0)}
+    assert aspect_timing.scan_step_days(outer, 30.0) == 30.0
+    assert aspect_timing.scan_step_days({**outer, "月亮": (swe.MOON, 0.0)}, 30.0) < 2.0
+    # 未列出最大速度的天體當作與月亮一樣快
+    assert aspect_timing.scan_step_days({"愛神": (swe.AST_OFFSET + 433, 0.0)}, 30.0) < 2.0
+
+
+def _counting_position():
+    calls = [0]
+
+    def position(jd, pid, offset=0.0):
+        calls[0] += 1
+        return aspect_timing.body_position(jd, pid, offset)
+    return position, calls
+
+
+def test_perfection_times_are_exact_in_few_calls():
+    import astro_engine
+
+    points = astro_engine.BASE_PLANETS + ["莉莉絲", "上升", "天頂", "南交"]
+    position, calls = _counting_position()
+    aspect_count = 0
+    for year in (1955, 1978, 1990, 2003, 2031):
+        chart = astro_engine.calculate_astrology_chart(year, 6, 15, 12, 0, 25.0, 121.0, "UTC", points)
+        aspects = chart["aspects"]
+        astro_engine.add_perfection_times(aspects, chart["julian_day_ut"], position)
+        aspect_count += len(aspects)
+        for asp in aspects:
+            jd = asp["perfection_jd_ut"]
+            if jd is None:
+                continue
+            lons = []
+            for name, details in ((asp["p1_name"], asp["p1_details"]), (asp["p2_name"], asp["p2_details"])):
+                body = astro_engine.ephemeris_body(name)
+                lons.append(aspect_timing.body_position(jd, *body)[0] if body else details["lon"])
+            separation = abs(aspect_timing.wrap180(lons[0] - lons[1]))
+            assert abs(separation - astro_engine.ASPECTS[asp["aspect_name"]]) < 1e-3
+    assert calls[0] / aspect_count < 10
+
+
+def test_perfection_time_near_station_finds_nearest_root():
+    # 水星於 2024-04-01 22 時 (UT) 左右停滯轉逆行；從停滯前 0.3 日出發，固定點放在 7 日後水星所在位置的 120° 處。
+    # 水星先前經過同一位置，最近的成相在過去約 6 日；速度接近 0 時線性外插會把試探點放到一年後。
+    jd_ut = swe.julday(2024, 4, 1, 22.2) - 0.3
+    lon, speed = aspect_timing.body_position(jd_ut, swe.MERCURY)
+    fixed = (aspect_timing.body_position(jd_ut + 7, swe.MERCURY)[0] - 120) % 360
+    result = aspect_timing.find_perfection_time((swe.MERCURY, 0.0), None, jd_ut, lon, fixed, speed, 0.0, 120)
+
+    def deviation(jd):
+        return aspect_timing.wrap180(aspect_timing.body_position(jd, swe.MERCURY)[0] - fixed - 120)
+
+    samples = [jd_ut + 0.05 * i for i in range(-1200, 1201)]
+    roots = [b for a, b in zip(samples, samples[1:]) if (deviation(a) > 0) != (deviation(b) > 0)]
+    nearest = min(roots, key=lambda jd: abs(jd - jd_ut))
+    assert result is not None and abs(result - nearest) < 0.05
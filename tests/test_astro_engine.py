@@ -0,0 +1,40 @@
+# tests/test_astro_engine.py
+import pytest
+import swisseph as swe
+
+import astro_engine
+import chart_cache
+
+TAIPEI = (1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei")
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    chart_cache.clear_all()
+    yield
+    chart_cache.clear_all()
+
+
+def test_unavailable_body_is_left_out_instead_of_zero(monkeypatch):
+    calc_ut = swe.calc_ut
+
+    def failing_calc_ut(jd_ut, pid, flags):
+        if pid == swe.CHIRON:
+            raise swe.Error("SwissEph file 'seas_18.se1' not found")
+        return calc_ut(jd_ut, pid, flags)
+
+    monkeypatch.setattr(swe, "calc_ut", failing_calc_ut)
+    chart = astro_engine.calculate_astrology_chart(*TAIPEI, ["太陽", "凱龍"])
+
+    assert "error" not in chart
+    assert list(chart["planet_positions"]) == ["太陽"]
+    assert "seas_18.se1" in chart["debug_info"]["unavailable_points"]["凱龍"]
+    assert all("凱龍" not in (aspect["p1_name"], aspect["p2_name"]) for aspect in chart["aspects"])
+
+
+def test_compute_positions_reports_errors(monkeypatch):
+    monkeypatch.setattr(swe, "calc_ut", lambda jd_ut, pid, flags: (_ for _ in ()).throw(swe.Error("missing")))
+    errors = {}
+    pos, speeds = astro_engine.compute_positions(2451545.0, ["凱龍"], errors=errors)
+    assert pos == {} and speeds == {}
+    assert errors == {"凱龍": "missing"}
@@ -0,0 +1,187 @@
+# tests/test_bulk_interpreter.py
+# 以本機 http.server 替代星盤 API（轉給 app 的測試客戶端計算）、StubModelClient 替代語言模型，測試大量解讀。
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app as app_module
+import bulk_interpreter
+import gemini_interpreter
+from gemini_interpreter import InterpretationError, StubModelClient
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30,
+          "latitude": 25.09, "longitude": 121.52, "timezone": "Asia/Taipei"}
+LONDON = {"year": 1985, "month": 6, "day": 15, "hour": 8, "minute": 0,
+          "latitude": 51.5, "longitude": -0.12, "timezone": "Europe/London"}
+RECORDS = [
+    {"id": "a", **TAIPEI, "question": "事業？"},
+    {"id": "b", **LONDON},
+    {"id": "c", **TAIPEI, "question": "事業？"},
+    {"id": "d", **TAIPEI, "question": "感情？"},
+]
+
+
+class _ChartApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.requests.append(body)
+            failures = self.server.failures.get(body, list(self.server.fail_with))
+            status = failures.pop(0) if failures else None
+            self.server.failures[body] = failures
+        if status is not None:
+            out = json.dumps({"error": "busy"}).encode()
+        else:
+            response = app_module.app.test_client().post(
+                "/api/v1/chart/single", data=body, headers={"X-API-Key": self.headers["X-API-Key"]})
+            status, out = response.status_code, response.data
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chart_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChartApiHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.failures = {}
+    server.fail_with = ()  # 每個不同的請求內容依序先收到這些狀態碼
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chart/single"
+    monkeypatch.setattr(gemini_interpreter, "ASTRO_API_URL", server.url)
+    monkeypatch.setattr(gemini_interpreter, "ASTRO_API_KEY", os.environ["ASTRO_API_KEY"])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FlakyModelClient(StubModelClient):
+    """前 failures 次呼叫回傳暫時性錯誤 (429)，並記錄每次呼叫的時刻。"""
+
+    def __init__(self, failures=0, response="解讀內容"):
+        super().__init__(response=response)
+        self.failures = failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def stream(self, prompt):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            if self.failures:
+                self.failures -= 1
+                raise InterpretationError("429 Too Many Requests", retryable=True)
+        return super().stream(prompt)
+
+
+def _run(records, cache_dir, client, **options):
+    source = bulk_interpreter.ApiChartSource(workers=4, retries=3, backoff=0.01)
+    try:
+        return bulk_interpreter.run_bulk(records, source, client, bulk_interpreter.InterpretationCache(str(cache_dir)),
+                                         default_question="整體", backoff=0.01, **options)
+    finally:
+        source.close()
+
+
+def test_chart_api_429_and_5xx_are_retried(chart_api, tmp_path):
+    chart_api.fail_with = (503, 429)
+    client = FlakyModelClient(failures=2)
+
+    results = _run(RECORDS[:2], tmp_path, client, rpm=0)
+
+    assert [result["ok"] for result in results] == [True, True]
+    # 每張命盤：503、429 之後第三次成功
+    assert len(chart_api.requests) == 6
+    # 模型的暫時性錯誤也重試：2 次失敗 + 2 次成功
+    assert len(client.calls) == 4
+    assert len(client.prompts) == 2
+
+
+def test_non_retryable_model_error_is_not_retried(chart_api, tmp_path):
+    class BlockedClient(StubModelClient):
+        def stream(self, prompt):
+            self.prompts.append(prompt)
+            raise InterpretationError("blocked")
+
+    client = BlockedClient()
+    results = _run(RECORDS[:1], tmp_path, client, rpm=0)
+    assert results[0]["ok"] is False
+    assert "blocked" in results[0]["error"]
+    assert len(client.prompts) == 1
+
+
+def test_identical_rows_share_one_interpretation(chart_api, tmp_path):
+    client = FlakyModelClient()
+
+    results = _run(RECORDS, tmp_path, client, rpm=0)
+
+    assert all(result["ok"] for result in results)
+    # a 與 c 的命盤與問題相同，只解讀一次；d 命盤相同但問題不同
+    assert len(client.prompts) == 3
+    assert results[0]["chart_hash"] == results[2]["chart_hash"] == results[3]["chart_hash"]
+    assert results[0]["interpretation"] == results[2]["interpretation"]
+    assert results[1]["question"] == "整體"
+
+
+def test_rpm_limits_model_request_rate(chart_api, tmp_path):
+    rpm = 600  # 每 0.1 秒一個請求
+    client = FlakyModelClient(failures=1)
+    started = time.monotonic()
+
+    results = _run(RECORDS, tmp_path, client, rpm=rpm, workers=4)
+
+    assert all(result["ok"] for result in results)
+    # 重試也計入：1 次失敗 + 3 個不同的提示
+    assert len(client.calls) == 4
+    # 第 k 個送出的請求不會早於第 k 個時段
+    for k, called_at in enumerate(sorted(client.calls)):
+        assert called_at >= started + k * 60 / rpm - 1e-3
+
+
+def test_rerun_is_served_from_disk_cache(chart_api, tmp_path):
+    first = _run(RECORDS, tmp_path, FlakyModelClient(), rpm=0)
+    requests_before = len(chart_api.requests)
+
+    rerun_client = FlakyModelClient(response="不應呼叫")
+    rerun = _run(RECORDS, tmp_path, rerun_client, rpm=0)
+
+    assert rerun_client.calls == []
+    assert all(result["cached"] for result in rerun)
+    assert [result["interpretation"] for result in rerun] == [result["interpretation"] for result in first]
+    # 命盤仍向 API 取得，只有解讀讀自快取
+    assert len(chart_api.requests) == requests_before + len(RECORDS)
+
+
+def test_cli_rerun_uses_cache(chart_api, tmp_path):
+    input_path = tmp_path / "people.jsonl"
+    input_path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in RECORDS),
+                          encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    first = _run(RECORDS, cache_dir, FlakyModelClient(), rpm=0)
+
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, ASTRO_API_URL=chart_api.url)
+    output = subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, "bulk_interpreter.py"), str(input_path), "--model", "stub",
+         "--question", "整體", "--cache-dir", str(cache_dir), "--rpm", "0"],
+        env=env, capture_output=True, text=True, timeout=120, check=True).stdout
+    rerun = [json.loads(line) for line in output.splitlines()]
+
+    # 替身模型沒有指定回應時會回傳提示摘要；讀到的仍是第一次的解讀，表示沒有呼叫模型
+    assert [result["id"] for result in rerun] == [record["id"] for record in RECORDS]
+    assert all(result["cached"] for result in rerun)
+    assert [result["interpretation"] for result in rerun] == [result["interpretation"] for result in first]
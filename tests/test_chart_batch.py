@@ -0,0 +1,75 @@
+# tests/test_chart_batch.py
+import os
+
+import pytest
+
+import app as app_module
+import chart_cache
+import compute_backend
+
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": ["太陽", "月亮", "水星", "上升", "天頂"]}
+
+
+def _entry(day, **extra):
+    return {**TAIPEI, "day": day, **extra}
+
+
+@pytest.fixture
+def post_batch():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda payload: client.post("/api/v1/chart/batch", json=payload, headers=headers)
+
+
+def test_item_errors_do_not_fail_the_batch(post_batch):
+    missing_field = {key: value for key, value in TAIPEI.items() if key != "hour"}
+    charts = [_entry(1), missing_field, _entry(2, timezone="Mars/Base"), "not an object", _entry(3)]
+
+    response = post_batch({"charts": charts})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["count"], body["failed"]) == (5, 3)
+    results = body["results"]
+    assert [item["index"] for item in results] == [0, 1, 2, 3, 4]
+    assert [item["ok"] for item in results] == [True, False, False, False, True]
+    assert [results[i]["error_type"] for i in (1, 2, 3)] == ["missing_field", "invalid_timezone", "invalid_field"]
+    assert "hour" in results[1]["error"]
+
+
+def test_results_follow_request_order(post_batch):
+    days = [9, 3, 27, 1, 14]
+    single = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+
+    results = post_batch({"charts": [_entry(day) for day in days]}).get_json()["results"]
+
+    assert [item["chart"]["local_time"][:10] for item in results] == [f"1990-01-{day:02d}" for day in days]
+    # 每一筆與單盤端點的結果相同
+    for day, item in zip(days, results):
+        assert item["chart"] == single.post("/api/v1/chart/single", json=_entry(day), headers=headers).get_json()
+
+
+def test_batch_limits(post_batch, monkeypatch):
+    assert post_batch({"charts": []}).status_code == 400
+    monkeypatch.setattr(app_module, "MAX_BATCH_SIZE", 2)
+    assert post_batch({"charts": [_entry(1)] * 3}).status_code == 413
+
+
+def test_parallel_chunks_match_serial(post_batch, monkeypatch):
+    charts = [_entry(day, minute=day) for day in range(1, 12)] + [_entry(12, timezone="Mars/Base"), 42]
+    serial = post_batch({"charts": charts}).get_json()
+
+    chart_cache.clear_all()
+    monkeypatch.setattr(compute_backend, "BACKEND", "process")
+    monkeypatch.setattr(compute_backend, "WORKERS", 3)
+    try:
+        assert compute_backend.is_parallel()
+        assert [start for start, _ in compute_backend.chunked(charts)] == [0, 5, 9]
+        parallel = post_batch({"charts": charts}).get_json()
+        assert compute_backend._executor is not None  # 確實經過行程池
+    finally:
+        compute_backend.shutdown()
+
+    assert parallel == serial
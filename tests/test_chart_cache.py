@@ -0,0 +1,77 @@
+# tests/test_chart_cache.py
+import pytest
+import swisseph as swe
+
+import astro_engine
+import chart_cache
+from chart_cache import LRUCache
+
+TAIPEI = (1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(chart_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_hit_and_miss_are_counted():
+    cache = LRUCache("test", max_size=4, ttl_seconds=0)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"size": 1, "max_size": 4, "ttl_seconds": 0, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache("test", max_size=2, ttl_seconds=0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # a 變成最近使用
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache("test", max_size=4, ttl_seconds=10)
+    cache.set("a", 1)
+    clock[0] += 9.9
+    assert cache.get("a") == 1
+    clock[0] += 0.2
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_zero_size_disables_cache():
+    cache = LRUCache("test", max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_repeated_chart_reuses_cached_positions(monkeypatch):
+    chart_cache.clear_all()
+    calls = []
+    calc_ut = swe.calc_ut
+
+    def counting_calc_ut(jd_ut, pid, flags):
+        calls.append(pid)
+        return calc_ut(jd_ut, pid, flags)
+
+    monkeypatch.setattr(swe, "calc_ut", counting_calc_ut)
+    first = astro_engine.calculate_astrology_chart(*TAIPEI, ["太陽", "月亮"])
+    count = len(calls)
+    assert count > 0
+
+    # 同一時刻、不同的選星組合：太陽與月亮沿用快取，只計算新加入的火星
+    second = astro_engine.calculate_astrology_chart(*TAIPEI, ["太陽", "月亮", "火星"])
+    assert calls[count:] == [swe.MARS]
+    assert second["planet_positions"]["太陽"]["lon"] == first["planet_positions"]["太陽"]["lon"]
+    assert chart_cache.POSITION_CACHE.stats()["hits"] >= 2
+
+    chart_cache.clear_all()
+    astro_engine.calculate_astrology_chart(*TAIPEI, ["太陽"])
+    assert calls[-1] == swe.SUN
@@ -0,0 +1,80 @@
+# tests/test_chart_fields.py
+import os
+
+import pytest
+
+import app as app_module
+import chart_fields
+
+PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "上升", "天頂"]
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": PLANETS}
+TWO_CHARTS = {**{f"chart1_{key}": value for key, value in TAIPEI.items() if key != "optional_planets"},
+              **{f"chart2_{key}": value for key, value in TAIPEI.items() if key != "optional_planets"},
+              "chart2_year": 1988, "optional_planets": PLANETS}
+
+
+@pytest.fixture
+def post():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda path, payload: client.post(path, json=payload, headers=headers)
+
+
+@pytest.fixture
+def full_chart(post):
+    return post("/api/v1/chart/single", TAIPEI).get_json()
+
+
+def test_parse_fields():
+    assert chart_fields.parse_fields(None) is chart_fields.ALL_FIELDS
+    assert chart_fields.parse_fields([]) is chart_fields.ALL_FIELDS
+    selection = chart_fields.parse_fields(" planet_positions.lon, aspects ,local_time")
+    assert selection.chart == {"planet_positions", "aspects", "local_time"}
+    assert selection.planet == {"lon"}
+    assert chart_fields.parse_fields(["planet_positions"]).planet == set(chart_fields.PLANET_FIELDS)
+    assert chart_fields.parse_fields(["overlays"], ("overlays",)).sections == {"overlays"}
+    for bad in (["overlays"], ["planet_positions.nope"], "nonsense", [1, 2]):
+        with pytest.raises(ValueError):
+            chart_fields.parse_fields(bad)
+
+
+def test_dotted_planet_fields(post, full_chart):
+    chart = post("/api/v1/chart/single", {**TAIPEI, "fields": ["planet_positions.lon", "planet_positions.house",
+                                                                "aspects"]}).get_json()
+
+    assert set(chart) == {"planet_positions", "aspects"}
+    assert chart["planet_positions"] == {name: {"lon": info["lon"], "house": info["house"]}
+                                         for name, info in full_chart["planet_positions"].items()}
+    # 相位的星體資料只保留選取的子欄位
+    assert chart["aspects"] == [{**asp, "p1_details": {"lon": asp["p1_details"]["lon"]},
+                                 "p2_details": {"lon": asp["p2_details"]["lon"]}} for asp in full_chart["aspects"]]
+
+
+def test_aspects_without_planet_fields_drop_details(post, full_chart):
+    chart = post("/api/v1/chart/single", {**TAIPEI, "fields": "aspects"}).get_json()
+    assert chart == {"aspects": [{key: value for key, value in asp.items() if key not in ("p1_details", "p2_details")}
+                                 for asp in full_chart["aspects"]]}
+
+
+def test_unselected_sections_are_not_returned(post, full_chart):
+    chart = post("/api/v1/chart/single", {**TAIPEI, "fields": ["local_time", "house_cusps", "house_system"]}).get_json()
+    assert chart == {key: full_chart[key] for key in ("local_time", "house_cusps", "house_system")}
+
+
+def test_display_endpoint_formats_only_selected_fields(post):
+    formatted = post("/calculate_single_chart", {**TAIPEI, "fields": ["planet_positions.zodiac_position_formatted",
+                                                                      "planet_positions.house"]}).get_json()
+    assert set(formatted) == {"planet_positions", "chart_type"}
+    info = formatted["planet_positions"]["太陽"]
+    assert set(info) == {"zodiac_position_formatted", "house", "house_display"}
+
+
+def test_endpoint_sections(post):
+    comparison = post("/calculate_comparison_chart", {**TWO_CHARTS, "fields": ["inter_aspects"]}).get_json()
+    assert set(comparison) == {"chart_type", "inter_aspects"}
+    assert comparison["inter_aspects"] and "p1_details" not in comparison["inter_aspects"][0]
+
+    rejected = post("/api/v1/chart/single", {**TAIPEI, "fields": ["inter_aspects"]})
+    assert rejected.status_code == 400
+    assert rejected.get_json()["error_type"] == "invalid_fields"
@@ -0,0 +1,96 @@
+# tests/test_chart_formats.py
+# normalized / columnar / MessagePack 格式與一般 JSON 回應的內容一致。
+import os
+
+import pytest
+
+import app as app_module
+import chart_formats
+
+PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "北交", "南交", "上升", "天頂"]
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": PLANETS}
+LONDON = {**TAIPEI, "year": 1985, "month": 6, "day": 15, "hour": 8, "minute": 0, "latitude": 51.5, "longitude": -0.12,
+          "timezone": "Europe/London"}
+
+
+@pytest.fixture
+def post():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda path, payload, **query: client.post(path, json=payload, headers=headers, query_string=query)
+
+
+def _verbose(normalized: dict) -> dict:
+    """normalized 結構還原成一般 JSON：星體列表轉回 dict，相位的索引換回名稱與星體資料。"""
+    planets = [{key: value for key, value in planet.items() if key != "name"} for planet in normalized["planets"]]
+    names = [planet["name"] for planet in normalized["planets"]]
+    chart = {key: value for key, value in normalized.items() if key not in ("planets", "aspects")}
+    if "house_cusps" in chart:
+        chart["house_cusps"] = {str(i): cusp for i, cusp in enumerate(chart["house_cusps"], start=1)}
+    chart["planet_positions"] = dict(zip(names, planets))
+    chart["aspects"] = [{"p1_name": names[asp["p1"]], "p2_name": names[asp["p2"]],
+                         "p1_details": planets[asp["p1"]], "p2_details": planets[asp["p2"]],
+                         **{key: value for key, value in asp.items() if key not in ("p1", "p2")}}
+                        for asp in normalized["aspects"]]
+    return chart
+
+
+def test_normalized_round_trips_to_verbose_json(post):
+    verbose = post("/api/v1/chart/single", TAIPEI).get_json()
+    response = post("/api/v1/chart/single", TAIPEI, format="normalized")
+
+    assert response.mimetype == chart_formats.NORMALIZED_MIMETYPE
+    normalized = response.get_json()
+    assert len(normalized["planets"]) == len(verbose["planet_positions"])
+    assert normalized["aspects"] and all(isinstance(asp["p1"], int) for asp in normalized["aspects"])
+    restored = _verbose(normalized)
+    # 相位原本的 p1_details / p2_details 只含 lon、speed，還原後是該星體的完整資料，數值一致
+    for original, rebuilt in zip(verbose["aspects"], restored["aspects"]):
+        for key in ("p1_details", "p2_details"):
+            assert original.pop(key).items() <= rebuilt.pop(key).items()
+    assert restored == verbose
+
+
+def test_msgpack_carries_the_normalized_chart(post):
+    msgpack = pytest.importorskip("msgpack")
+    normalized = post("/api/v1/chart/single", TAIPEI, format="normalized").get_json()
+
+    response = post("/api/v1/chart/single", TAIPEI, format="msgpack")
+
+    assert response.mimetype == chart_formats.MSGPACK_MIMETYPE
+    assert msgpack.unpackb(response.data, raw=False, strict_map_key=False) == normalized
+
+
+def test_columnar_batch_matches_verbose_results(post):
+    payload = {"charts": [TAIPEI, {**TAIPEI, "timezone": "Mars/Base"}, LONDON]}
+    verbose = post("/api/v1/chart/batch", payload).get_json()["results"]
+
+    response = post("/api/v1/chart/batch", payload, format="columnar")
+
+    assert response.mimetype == chart_formats.COLUMNAR_MIMETYPE
+    table = response.get_json()
+    assert (table["count"], table["failed"]) == (3, 1)
+    assert table["charts"]["index"] == [0, 1, 2]
+    assert table["charts"]["ok"] == [True, False, True]
+    assert table["charts"]["error"][1] == verbose[1]["error"]
+    assert table["house_cusps"][1] is None
+
+    planets, aspects = table["planets"], table["aspects"]
+    for row in (0, 2):
+        chart = verbose[row]["chart"]
+        assert table["charts"]["julian_day_ut"][row] == chart["julian_day_ut"]
+        assert table["house_cusps"][row] == [chart["house_cusps"][str(i)] for i in range(1, 13)]
+        rows = [i for i, owner in enumerate(planets["chart"]) if owner == row]
+        assert sorted(planets["name"][i] for i in rows) == sorted(chart["planet_positions"])
+        for i in rows:
+            info = chart["planet_positions"][planets["name"][i]]
+            assert [planets[column][i] for column in ("lon", "speed", "house", "hdeg")] == \
+                   [info["lon"], info["speed"], info["house"], info["hdeg"]]
+        # 相位的 p1 / p2 指向同一張命盤的星體列
+        columnar_aspects = [(planets["name"][aspects["p1"][i]], planets["name"][aspects["p2"][i]],
+                             aspects["aspect_name"][i], aspects["aspect_type"][i], aspects["orb"][i])
+                            for i, owner in enumerate(aspects["chart"]) if owner == row]
+        assert all(planets["chart"][aspects["p1"][i]] == row for i, owner in enumerate(aspects["chart"]) if owner == row)
+        assert columnar_aspects == [(asp["p1_name"], asp["p2_name"], asp["aspect_name"], asp["aspect_type"], asp["orb"])
+                                    for asp in chart["aspects"]]
@@ -0,0 +1,114 @@
+# tests/test_chart_metrics.py
+# 各階段耗時統計：未啟用時不計時、單一請求的耗時明細、直方圖累計與 /metrics 的 Prometheus 輸出。
+import re
+
+import pytest
+
+import app as app_module
+import chart_metrics
+
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": ["太陽", "月亮", "上升"]}
+CHART_STAGES = {"time_conversion", "calc_ut", "houses", "placement", "display_fields", "aspects"}
+
+
+@pytest.fixture
+def metrics_enabled(monkeypatch):
+    monkeypatch.setattr(chart_metrics, "ENABLED", True)
+    chart_metrics.reset()
+    yield
+    chart_metrics.reset()
+
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_disabled_stage_is_a_shared_no_op(monkeypatch):
+    monkeypatch.setattr(chart_metrics, "ENABLED", False)
+    chart_metrics.reset()
+    assert chart_metrics.stage("calc_ut") is chart_metrics.stage("houses")
+    with chart_metrics.stage("calc_ut"):
+        pass
+    assert "astro_stage_seconds_count" not in chart_metrics.render_prometheus()
+
+
+def test_trace_collects_stage_totals_in_milliseconds(monkeypatch):
+    monkeypatch.setattr(chart_metrics, "ENABLED", False)
+    ticks = iter([1.0, 1.002, 2.0, 2.003, 3.0, 3.5])
+    monkeypatch.setattr(chart_metrics.time, "perf_counter", lambda: next(ticks))
+
+    @chart_metrics.timed("format_display")
+    def format_display():
+        return "formatted"
+
+    with chart_metrics.trace() as timings:
+        with chart_metrics.stage("calc_ut"):
+            pass
+        with chart_metrics.stage("calc_ut"):
+            pass
+        assert format_display() == "formatted"
+
+    assert timings == pytest.approx({"calc_ut": 5.0, "format_display": 500.0})
+    # 離開 trace 之後不再收集
+    assert chart_metrics.stage("calc_ut") is chart_metrics.stage("houses")
+
+
+def test_histogram_buckets_are_cumulative(metrics_enabled, monkeypatch):
+    for seconds in (0.00005, 0.0003, 0.0003, 0.2, 10.0):
+        monkeypatch.setattr(chart_metrics.time, "perf_counter", iter([0.0, seconds]).__next__)
+        with chart_metrics.stage("houses"):
+            pass
+
+    samples = _samples(chart_metrics.render_prometheus())
+
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="0.0001"}'] == 1
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="0.00025"}'] == 1
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="0.0005"}'] == 3
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="0.25"}'] == 4
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="2.5"}'] == 4
+    assert samples['astro_stage_seconds_bucket{stage="houses",le="+Inf"}'] == 5
+    assert samples['astro_stage_seconds_count{stage="houses"}'] == 5
+    assert samples['astro_stage_seconds_sum{stage="houses"}'] == pytest.approx(10.20065)
+
+
+def test_render_includes_cache_stats():
+    text = chart_metrics.render_prometheus({"charts": {"hits": 3, "misses": 2, "evictions": 1, "size": 4}})
+    samples = _samples(text)
+    assert samples['astro_cache_hits_total{cache="charts"}'] == 3
+    assert samples['astro_cache_evictions_total{cache="charts"}'] == 1
+    assert samples['astro_cache_size{cache="charts"}'] == 4
+    assert "# TYPE astro_cache_size gauge" in text
+
+
+def test_metrics_endpoint_records_requests_and_stages(metrics_enabled):
+    client = app_module.app.test_client()
+    assert client.post("/calculate_single_chart", json=TAIPEI).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    samples = _samples(response.get_data(as_text=True))
+    assert samples['astro_request_seconds_count{endpoint="calculate_single_chart_api"}'] == 1
+    stages = {re.search(r'stage="([^"]+)"', name).group(1) for name in samples if name.startswith("astro_stage_seconds_count")}
+    assert CHART_STAGES | {"format_display", "jsonify"} <= stages
+    assert any(name.startswith("astro_cache_hits_total") for name in samples)
+
+
+def test_debug_timing_is_returned_per_request(monkeypatch):
+    monkeypatch.setattr(chart_metrics, "ENABLED", False)
+    client = app_module.app.test_client()
+
+    timed = client.post("/calculate_single_chart", json={**TAIPEI, "debug_timing": True}).get_json()
+    plain = client.post("/calculate_single_chart", json=TAIPEI).get_json()
+
+    timings = timed["debug_info"]["timings_ms"]
+    assert set(timings) == CHART_STAGES | {"format_display"}
+    assert all(ms >= 0 for ms in timings.values())
+    assert "timings_ms" not in plain.get("debug_info", {})
+    assert {key: value for key, value in timed.items() if key != "debug_info"} == \
+        {key: value for key, value in plain.items() if key != "debug_info"}
@@ -0,0 +1,95 @@
+# tests/test_chart_prompt.py
+import json
+import os
+import random
+
+import pytest
+
+import app as app_module
+import chart_prompt
+from display_format import zodiac_format
+from gemini_interpreter import StubModelClient, build_prompt, stream_interpretation
+
+POINTS = ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "天王", "海王", "冥王",
+          "上升", "下降", "天頂", "天底", "福點", "北交", "南交", "穀神"]
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": POINTS}
+
+
+@pytest.fixture(scope="module")
+def chart():
+    client = app_module.app.test_client()
+    response = client.post("/api/v1/chart/single", json=TAIPEI, headers={"X-API-Key": os.environ["ASTRO_API_KEY"]})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _shuffled(chart, seed):
+    """同一張命盤，但鍵的順序、相位順序與相位兩端的星體順序都打亂。"""
+    rng = random.Random(seed)
+
+    def shuffle_dict(d):
+        items = list(d.items())
+        rng.shuffle(items)
+        return dict(items)
+
+    copy = json.loads(json.dumps(chart))
+    copy["planet_positions"] = shuffle_dict(copy["planet_positions"])
+    copy["house_cusps"] = shuffle_dict(copy["house_cusps"])
+    aspects = []
+    for asp in copy["aspects"]:
+        if rng.random() < 0.5:
+            asp = {**asp, "p1_name": asp["p2_name"], "p2_name": asp["p1_name"],
+                   "p1_details": asp["p2_details"], "p2_details": asp["p1_details"]}
+        aspects.append(shuffle_dict(asp))
+    rng.shuffle(aspects)
+    copy["aspects"] = aspects
+    return shuffle_dict(copy)
+
+
+def test_chart_to_text_is_deterministic(chart):
+    text = chart_prompt.chart_to_text(chart)
+    assert all(chart_prompt.chart_to_text(_shuffled(chart, seed)) == text for seed in range(5))
+
+
+def test_chart_to_text_keeps_every_planet_aspect_and_cusp(chart):
+    lines = chart_prompt.chart_to_text(chart).splitlines()
+
+    planet_header = lines.index("星體（名稱 位置 宮位 速度°/日，R=逆行）:")
+    aspect_header = lines.index("相位（星體 相位 星體 容許度 入相/出相）:")
+    planet_lines = lines[planet_header + 1:aspect_header]
+    aspect_lines = lines[aspect_header + 1:aspect_header + 1 + len(chart["aspects"])]
+
+    assert sorted(line.split()[0] for line in planet_lines) == sorted(chart["planet_positions"])
+    for line in planet_lines:
+        name, position = line.split()[:2]
+        info = chart["planet_positions"][name]
+        assert position == info["zodiac_position_formatted"]
+        assert f"{info['house']}宮" in line.split()
+        assert line.endswith(" R") == info["is_retrograde"]
+
+    assert len(chart["aspects"]) > 20
+    expected = sorted((tuple(sorted((asp["p1_name"], asp["p2_name"]))), asp["aspect_name"], f"{asp['orb']:.2f}°",
+                       asp["aspect_type"]) for asp in chart["aspects"])
+    # 兩個固定點之間的相位沒有入相／出相標籤
+    parsed = sorted((tuple(sorted((first, second))), name, orb, kind[0] if kind else "")
+                    for first, name, second, orb, *kind in (line.split() for line in aspect_lines))
+    assert parsed == expected
+
+    cusp_line = next(line for line in lines if line.startswith("宮頭: "))
+    assert cusp_line.split()[1:] == [f"{house}宮{zodiac_format(chart['house_cusps'][str(house)])}"
+                                     for house in range(1, 13)]
+    # 省略的只有與解讀無關或可由其他欄位推出的欄位
+    assert "ephemeris_path_status" not in "\n".join(lines)
+
+
+def test_stub_stream_yields_chunks_in_order(chart):
+    response = "一二三四五六七八九十甲乙丙丁戊己庚辛壬癸子丑"
+    client = StubModelClient(response=response, chunk_size=5)
+
+    chunks = list(stream_interpretation(client, chart, "事業運勢？"))
+
+    assert chunks == ["一二三四五", "六七八九十", "甲乙丙丁戊", "己庚辛壬癸", "子丑"]
+    assert client.prompts == [build_prompt(chart, "事業運勢？")]
+    assert chart_prompt.chart_to_text(chart) in client.prompts[0]
+    assert "事業運勢？" in client.prompts[0]
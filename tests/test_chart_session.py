@@ -0,0 +1,146 @@
+# tests/test_chart_session.py
+# 增量重算工作階段：只改地點時沿用星體位置、一小時內的時間變動由錨點外推，結果須與直接計算相同（外推誤差小於 1″）。
+import os
+
+import pytest
+
+import app as app_module
+import chart_session
+
+PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "北交", "南交", "上升", "天頂"]
+TAIPEI = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei", "optional_planets": PLANETS}
+
+
+@pytest.fixture
+def client():
+    client = app_module.app.test_client()
+    client.environ_base["HTTP_X_API_KEY"] = os.environ["ASTRO_API_KEY"]
+    return client
+
+
+@pytest.fixture
+def session_id(client):
+    body = client.post("/api/chart_session", json=TAIPEI).get_json()
+    assert body["recomputed"] == "full"
+    return body["session_id"]
+
+
+def _direct_chart(client, payload):
+    return client.post("/calculate_single_chart", json=payload).get_json()
+
+
+def _angle_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+def test_create_matches_single_chart(client):
+    body = client.post("/api/chart_session", json=TAIPEI).get_json()
+    direct = _direct_chart(client, TAIPEI)
+    assert body["chart"]["planet_positions"] == direct["planet_positions"]
+    assert body["chart"]["house_cusps"] == direct["house_cusps"]
+
+
+def test_unchanged_inputs_recompute_nothing(client, session_id):
+    body = client.post(f"/api/chart_session/{session_id}", json={"include_chart": True}).get_json()
+    assert body["recomputed"] == "none"
+    assert body["diff"] == {"planets": {}, "houses": {}, "aspects": {"added": [], "removed": [], "changed": []}}
+
+
+def test_location_change_reuses_positions(client, session_id, monkeypatch):
+    def no_calc(*args, **kwargs):
+        raise AssertionError("只改地點不應重新計算星體位置")
+
+    monkeypatch.setattr(app_module, "_session_positions", no_calc)
+    moved = {"latitude": 22.63, "longitude": 120.30}
+    body = client.post(f"/api/chart_session/{session_id}", json={**moved, "include_chart": True}).get_json()
+    direct = _direct_chart(client, {**TAIPEI, **moved})
+
+    assert body["recomputed"] == "location"
+    assert body["chart"]["planet_positions"] == direct["planet_positions"]
+    assert body["chart"]["house_cusps"] == direct["house_cusps"]
+    assert body["chart"]["aspects"] == direct["aspects"]
+
+
+@pytest.mark.parametrize("minute", [31, 59, 0])
+def test_time_change_within_an_hour_is_extrapolated(client, session_id, minute):
+    change = {"minute": minute} if minute else {"hour": 11, "minute": 45}
+    body = client.post(f"/api/chart_session/{session_id}", json={**change, "include_chart": True}).get_json()
+    direct = _direct_chart(client, {**TAIPEI, **change})
+
+    assert body["recomputed"] == "time"
+    planets, expected = body["chart"]["planet_positions"], direct["planet_positions"]
+    assert set(planets) == set(expected)
+    for name, info in expected.items():
+        assert _angle_diff(planets[name]["lon"], info["lon"]) < 1 / 3600, name
+        assert planets[name]["house"] == info["house"]
+    assert body["chart"]["house_cusps"] == direct["house_cusps"]
+
+
+def test_extrapolation_starts_from_anchor(client, session_id):
+    # 連續拖動時間：每一步都從錨點外推，誤差不累積；超過一小時則全部重算並成為新的錨點
+    for minute in (40, 50, 59):
+        body = client.post(f"/api/chart_session/{session_id}", json={"minute": minute}).get_json()
+        assert body["recomputed"] == "time"
+    assert chart_session.get(session_id).anchor_jd == pytest.approx(app_module._session_julian_day(TAIPEI))
+
+    body = client.post(f"/api/chart_session/{session_id}", json={"hour": 14}).get_json()
+    assert body["recomputed"] == "full"
+    session = chart_session.get(session_id)
+    assert session.anchor_jd == session.jd_ut
+
+
+def test_other_changes_recompute_everything(client, session_id):
+    body = client.post(f"/api/chart_session/{session_id}", json={"optional_planets": ["太陽", "月亮"],
+                                                                  "include_chart": True}).get_json()
+    assert body["recomputed"] == "full"
+    assert set(body["chart"]["planet_positions"]) == {"太陽", "月亮"}
+    assert {name for name, info in body["diff"]["planets"].items() if info is None} == set(PLANETS) - {"太陽", "月亮"}
+
+
+def test_extrapolate_flags_stationary_bodies_and_derives_south_node():
+    lons = {"太陽": 280.0, "水星": 100.0, "北交": 359.99, "南交": 179.99}
+    speeds = {"太陽": 1.0, "水星": 0.001, "北交": 0.5, "南交": -0.5}
+    session = chart_session.ChartSession({}, 2450000.0, (lons, speeds), {})
+
+    (new_lons, new_speeds), stationary = session.extrapolate(2450000.0 + 1 / 24)
+
+    assert stationary == ["水星"]
+    assert new_lons["太陽"] == pytest.approx(280.0 + 1 / 24)
+    assert new_lons["北交"] == pytest.approx((359.99 + 0.5 / 24) % 360)
+    assert new_lons["南交"] == pytest.approx((new_lons["北交"] + 180) % 360)
+    assert new_speeds == speeds
+
+
+def test_chart_diff_compares_at_display_precision():
+    before = {
+        "planet_positions": {"太陽": {"lon": 10.0, "house": 1}, "月亮": {"lon": 20.0, "house": 2}},
+        "house_cusps": [{"house_number": 1, "zodiac_position_formatted": "牡羊(0°00')"}],
+        "aspects": [{"p1_name": "太陽", "p2_name": "月亮", "aspect_name": "合相", "aspect_type": "入相", "orb": 10.0}],
+    }
+    after = {
+        "planet_positions": {"太陽": {"lon": 10.001, "house": 1}, "火星": {"lon": 30.0, "house": 3}},
+        "house_cusps": [{"house_number": 1, "zodiac_position_formatted": "牡羊(0°01')"}],
+        "aspects": [{"p1_name": "月亮", "p2_name": "太陽", "aspect_name": "合相", "aspect_type": "出相", "orb": 10.0}],
+    }
+
+    diff = chart_session.chart_diff(before, after)
+
+    assert diff["planets"] == {"火星": {"lon": 30.0, "house": 3}, "月亮": None}
+    assert diff["houses"] == {1: "牡羊(0°01')"}
+    assert diff["aspects"] == {"added": [], "removed": [], "changed": after["aspects"]}
+
+
+def test_unknown_and_deleted_sessions(client, session_id):
+    assert client.delete(f"/api/chart_session/{session_id}").get_json() == {"session_id": session_id, "deleted": True}
+    for response in (client.post(f"/api/chart_session/{session_id}", json={"minute": 31}),
+                     client.delete(f"/api/chart_session/{session_id}")):
+        assert response.status_code == 404
+        assert response.get_json()["error_type"] == "session_not_found"
+
+
+def test_invalid_update_leaves_session_unchanged(client, session_id):
+    response = client.post(f"/api/chart_session/{session_id}", json={"timezone": "Mars/Olympus"})
+    assert response.status_code == 400
+    assert response.get_json()["error_type"] == "invalid_timezone"
+    assert chart_session.get(session_id).inputs == TAIPEI
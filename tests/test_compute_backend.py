@@ -0,0 +1,64 @@
+# tests/test_compute_backend.py
+import os
+
+import pytest
+
+import app as app_module
+import compute_backend
+
+TWO_CHARTS = {
+    "chart1_year": 1990, "chart1_month": 1, "chart1_day": 1, "chart1_hour": 12, "chart1_minute": 30,
+    "chart1_latitude": 25.09, "chart1_longitude": 121.52, "chart1_timezone": "Asia/Taipei",
+    "chart2_year": 1988, "chart2_month": 7, "chart2_day": 20, "chart2_hour": 23, "chart2_minute": 50,
+    "chart2_latitude": -33.9, "chart2_longitude": 151.2, "chart2_timezone": "Australia/Sydney",
+    "optional_planets": ["太陽", "月亮", "水星", "金星", "火星", "上升", "天頂", "福點"],
+}
+
+
+def _pid_and_args(*args):
+    return os.getpid(), args
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setattr(compute_backend, "BACKEND", "process")
+    monkeypatch.setattr(compute_backend, "WORKERS", 2)
+    yield
+    compute_backend.shutdown()
+
+
+@pytest.mark.parametrize("count, chunks", [(10, 3), (2, 5), (7, 1), (1, 4)])
+def test_chunked_covers_every_item_once(count, chunks):
+    items = list(range(count))
+    parts = list(compute_backend.chunked(items, chunks))
+    assert len(parts) == min(count, chunks)
+    assert [item for _, part in parts for item in part] == items
+    assert all(part == items[start:start + len(part)] for start, part in parts)
+    sizes = [len(part) for _, part in parts]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_serial_runs_in_request_process():
+    assert not compute_backend.is_parallel()
+    results = compute_backend.run_all([(_pid_and_args, (1,)), (_pid_and_args, (2,), {})])
+    assert results == [(os.getpid(), (1,)), (os.getpid(), (2,))]
+
+
+def test_process_pool_keeps_call_order(process_pool):
+    results = compute_backend.run_all([(_pid_and_args, (i,)) for i in range(6)])
+    assert [args for _, args in results] == [(i,) for i in range(6)]
+    assert os.getpid() not in {pid for pid, _ in results}
+
+
+def test_pair_endpoints_match_serial(process_pool, monkeypatch):
+    client = app_module.app.test_client()
+    transit = {key.replace("chart1_", "natal_").replace("chart2_", "transit_"): value for key, value in TWO_CHARTS.items()}
+    requests = [("/calculate_comparison_chart", TWO_CHARTS), ("/calculate_composite_chart", TWO_CHARTS),
+                ("/calculate_transit_chart", transit)]
+
+    parallel = [client.post(path, json=payload).get_json() for path, payload in requests]
+    assert compute_backend._executor is not None
+    monkeypatch.setattr(compute_backend, "BACKEND", "serial")
+    serial = [client.post(path, json=payload).get_json() for path, payload in requests]
+
+    assert parallel == serial
@@ -0,0 +1,101 @@
+# tests/test_display_format.py
+# 查表版本的格式化與原本以 zfill / f-string 組字串的版本（下面凍結的 _reference_*）逐字比對。
+import random
+
+import pytest
+
+import astro_engine
+from display_format import ZODIAC_SIGNS, dms_format, house_label, zodiac_format, zodiac_format_many
+
+TAIPEI = (1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei")
+
+
+# --- 表格化之前的實作（凍結，勿修改）---
+def _reference_dms(deg):
+    d = int(deg)
+    m = round((deg - d) * 60)
+    if m >= 60:
+        d += 1
+        m = 0
+    return f"{str(d).zfill(2)}°{str(m).zfill(2)}'"
+
+
+def _reference_zodiac(deg):
+    sign_idx = int(deg // 30)
+    return f"{ZODIAC_SIGNS[sign_idx]}({_reference_dms(deg % 30)})"
+
+
+def _reference_display(raw):
+    output = {
+        "timestamps": {
+            "local_time": raw["local_time"], "utc_time": raw["utc_time"],
+            "julian_day_ut": f"{raw.get('julian_day_ut', 0):.6f}",
+            "delta_t_seconds": raw.get('delta_t_seconds', 0),
+            "julian_day_tt": f"{raw.get('julian_day_tt', 0):.6f}"
+        },
+        "birth_info": {"latitude": f"{raw['latitude']:.2f}", "longitude": f"{raw['longitude']:.2f}"},
+        "ephemeris_path_status": raw.get("ephemeris_path_status", {"status": "Unknown", "message": "N/A"}),
+        "debug_info": raw.get("debug_info", {}),
+        "house_cusps": [{"house_number": i, "zodiac_position_formatted": _reference_zodiac(raw["house_cusps"][i])}
+                        for i in range(1, 13)],
+        "planet_positions": {},
+        "aspects": raw["aspects"]
+    }
+    for name, info in raw["planet_positions"].items():
+        formatted_info = info.copy()
+        formatted_info['house_display'] = f"{int(info['house'])}宮" if info.get('house') is not None else ""
+        formatted_info['hdeg_display'] = f"{info['hdeg']:.2f}°" if info.get('hdeg') is not None else ""
+        output["planet_positions"][name] = formatted_info
+    return output
+
+
+def _longitudes():
+    rng = random.Random(0)
+    edges = [0.0, 1e-12, 29.99, 29.9917, 29.99999, 30.0, 59.999999, 180.0, 359.99, 359.999999, 5.5, 12.008333333]
+    # 分鐘剛好在 .5 的捨入邊界（round 為銀行家捨入）
+    halves = [d + (m + 0.5) / 60 for d in (0, 17, 29, 359) for m in (0, 29, 58, 59)]
+    return edges + halves + [rng.uniform(0, 360) for _ in range(3000)]
+
+
+def test_zodiac_format_matches_reference():
+    lons = _longitudes()
+    expected = [_reference_zodiac(lon) for lon in lons]
+    assert [zodiac_format(lon) for lon in lons] == expected
+    assert zodiac_format_many(lons) == expected
+    assert zodiac_format_many([]) == []
+
+
+@pytest.mark.parametrize("deg", [0.0, 5.5, 29.99999, 359.9999, 360.0, 400.25, -0.5, -12.75])
+def test_dms_format_matches_reference(deg):
+    assert dms_format(deg) == _reference_dms(deg)
+
+
+def test_negative_longitudes_fall_back():
+    lons = [-0.5, -45.25]
+    assert zodiac_format_many(lons) == [_reference_zodiac(lon) for lon in lons] == [zodiac_format(lon) for lon in lons]
+
+
+def test_house_label():
+    assert [house_label(house) for house in (1, 7, 12)] == ["1宮", "7宮", "12宮"]
+    assert house_label(None) == ""
+    assert house_label(7.0) == "7宮"
+
+
+def test_display_fields_can_be_skipped():
+    names = ["太陽", "月亮", "水星", "上升"]
+    full = astro_engine.calculate_astrology_chart(*TAIPEI, names)
+    bare = astro_engine.calculate_astrology_chart(*TAIPEI, names, display_fields=False)
+
+    for name, info in full["planet_positions"].items():
+        assert info["zodiac_position_formatted"] == _reference_zodiac(info["lon"])
+        assert info["retrograde_label"] == ("逆行" if info["is_retrograde"] else "")
+        stripped = {key: value for key, value in info.items() if key not in ("zodiac_position_formatted", "retrograde_label")}
+        assert bare["planet_positions"][name] == stripped
+
+
+def test_chart_display_matches_reference():
+    raw = astro_engine.calculate_astrology_chart(*TAIPEI, list(astro_engine.PLANET_IDS) + ["上升", "天頂", "福點", "南交"])
+    formatted = astro_engine.format_chart_data_for_display(raw)
+    expected = _reference_display(raw)
+    assert {key: formatted[key] for key in expected} == expected
+    assert formatted["house_system"] == raw["house_system"]
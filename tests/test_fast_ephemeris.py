@@ -0,0 +1,54 @@
+# tests/test_fast_ephemeris.py
+# 以 Swiss Ephemeris 星曆檔 (FLG_SWIEPH) 為基準檢查快速星曆表的誤差；星曆檔由 conftest 的 swieph_dir 提供。
+import numpy as np
+import pytest
+import swisseph as swe
+
+import astro_engine
+import fast_ephemeris
+from astro_engine import PLANET_IDS
+
+
+def _arcsec(a, b):
+    return abs((a - b + 180) % 360 - 180) * 3600
+
+
+@pytest.fixture(scope="module")
+def table(tmp_path_factory, swieph_dir):
+    swe.set_ephe_path(swieph_dir)
+    _, flags = swe.calc_ut(swe.julday(2000, 1, 1, 12.0), swe.SUN, fast_ephemeris.EPHE_FLAGS)
+    assert flags & swe.FLG_SWIEPH, f"{swieph_dir} 中的星曆檔無法使用，Swisseph 改用了 Moshier 星曆"
+    path = str(tmp_path_factory.mktemp("fast_ephemeris") / "table.npy")
+    yield fast_ephemeris.build_table(path, fast_ephemeris.DEFAULT_START_YEAR, fast_ephemeris.DEFAULT_END_YEAR,
+                                     error_samples=2000)
+    swe.set_ephe_path(astro_engine.EPHE_PATH_CONFIG)
+
+
+def test_table_includes_every_computable_body(table):
+    expected = [pid for pid in dict.fromkeys(PLANET_IDS.values())
+                if fast_ephemeris._available_bodies([pid], table.jd_start)]
+    assert sorted(table.body_ids) == sorted(expected)
+    assert {swe.CHIRON, swe.CERES, swe.PALLAS, swe.JUNO, swe.VESTA, swe.PHOLUS} <= set(table.body_ids)
+
+
+def test_positions_stay_within_body_bounds(table):
+    jd_values = np.random.default_rng(0).uniform(table.jd_start, table.jd_end, 5000)
+    for pid in table.body_ids:
+        lon_bound, speed_bound = fast_ephemeris.MAX_ERROR.get(pid, fast_ephemeris.DEFAULT_MAX_ERROR)
+        lon_error = speed_error = 0.0
+        for jd in jd_values:
+            lon, speed = table.position(jd, pid)
+            xx, flags = swe.calc_ut(jd, pid, swe.FLG_SWIEPH | swe.FLG_SPEED)
+            assert flags & swe.FLG_SWIEPH
+            lon_error = max(lon_error, _arcsec(lon, xx[0]))
+            speed_error = max(speed_error, abs(speed - xx[3]))
+        assert lon_error <= lon_bound, (pid, lon_error)
+        assert speed_error <= speed_bound, (pid, speed_error)
+
+
+def test_build_records_errors_within_bounds(table):
+    for pid in table.body_ids:
+        lon_bound, speed_bound = fast_ephemeris.MAX_ERROR.get(pid, fast_ephemeris.DEFAULT_MAX_ERROR)
+        error = table.max_error[str(pid)]
+        assert error["lon_arcsec"] <= lon_bound
+        assert error["speed_deg_per_day"] <= speed_bound
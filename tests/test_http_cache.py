@@ -0,0 +1,57 @@
+# tests/test_http_cache.py
+import os
+
+import pytest
+
+import app as app_module
+import astro_engine
+import http_cache
+
+CHART = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+         "timezone": "Asia/Taipei", "optional_planets": ["太陽", "月亮"]}
+
+
+@pytest.fixture
+def post_chart(tmp_path, monkeypatch):
+    # 只替換 ETag 取用的星曆檔清單（改列 tmp_path）；命盤計算照常使用 astro_engine.EPHE_PATH_CONFIG
+    list_files = http_cache._ephemeris_files
+    monkeypatch.setattr(http_cache, "_ephemeris_files", lambda ephe_dir: list_files(str(tmp_path)))
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda **extra: client.post("/api/v1/chart/single", json=CHART, headers={**headers, **extra})
+
+
+def test_matching_etag_returns_304(post_chart):
+    first = post_chart()
+    assert first.status_code == 200
+    assert "immutable" not in first.headers["Cache-Control"]
+    again = post_chart(**{"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_etag_follows_ephemeris_files(post_chart, tmp_path):
+    before = post_chart().headers["ETag"]
+    (tmp_path / ".download.lock").write_bytes(b"")
+    (tmp_path / "sepl_18.se1.part").write_bytes(b"partial")
+    assert post_chart().headers["ETag"] == before
+
+    (tmp_path / "sepl_18.se1").write_bytes(b"ephemeris")
+    after = post_chart().headers["ETag"]
+    assert after != before
+    assert post_chart(**{"If-None-Match": before}).status_code == 200
+
+
+def test_etag_follows_fast_table(post_chart, monkeypatch):
+    class Table:
+        jd_start, jd_end, step_days, body_ids = 2415020.5, 2488434.5, 1.0, [0, 1]
+
+    before = post_chart().headers["ETag"]
+    monkeypatch.setattr(astro_engine, "FAST_EPHEMERIS", Table())
+    assert post_chart().headers["ETag"] != before
+
+
+def test_etag_version_defaults_to_source_digest():
+    if os.getenv("ASTRO_ETAG_VERSION") or os.getenv("RENDER_GIT_COMMIT"):
+        pytest.skip("已設定版本環境變數")
+    assert http_cache.ETAG_VERSION == http_cache._source_digest() != ""
@@ -0,0 +1,98 @@
+# tests/test_rectification.py
+# 出生時間校正的評分：相位條件以條件自己的 orb 判斷（可大於 aspect_between 的內建容許度）。
+import os
+
+import pytest
+
+import app as app_module
+import rectification
+from astro_engine import ASPECTS, DEFAULT_ORB, aspect_between, aspect_motion, find_house
+
+BODIES = {"太陽", "月亮", "火星", "木星", "土星"}
+CUSPS = {house: 30.0 * (house - 1) for house in range(1, 13)}
+
+
+def _event(criteria, transits=None, solar_arc=0.0):
+    return {"criteria": rectification.parse_criteria(criteria, BODIES, ASPECTS), "weight": 1.0,
+            "transits": transits or {}, "solar_arc": solar_arc}
+
+
+def _score(natal_lons, event, name="太陽"):
+    charts = [({name: (lon, 1.0), "上升": (0.0, 0.0)}, CUSPS) for lon in natal_lons]
+    return rectification.score_candidates(charts, [event], aspect_motion, find_house)
+
+
+def test_orb_wider_than_engine_orb_is_honoured():
+    orb = DEFAULT_ORB["合相"] + 4
+    event = _event([{"type": "transit", "transit": "土星", "natal": "太陽", "aspects": ["合相"], "orb": orb}],
+                   transits={"土星": (100.0, 0.05)})
+
+    scored = _score([100.0, 109.0, 111.5, 112.5], event)
+
+    assert [score for score, _ in scored] == pytest.approx([1.0, 1 - 9 / orb, 1 - 11.5 / orb, 0.0])
+    match = scored[1][1][0]
+    assert (match["aspect_name"], match["orb"], match["aspect_type"]) == ("合相", 9.0, "入相")
+    # aspect_between 在內建容許度之外找不到相位
+    assert aspect_between("土星", "太陽", 100.0, 109.0, 0.05, 0.0) is None
+
+
+def test_matches_agree_with_aspect_between_within_engine_orbs():
+    event = _event([{"type": "transit", "transit": "火星", "natal": "太陽", "aspects": ["刑", "拱"], "orb": 2}],
+                   transits={"火星": (200.0, 0.7)})
+    natal_lons = [200.0 + offset for offset in (88.5, 91.9, 118.0, 121.0, -119.3, -90.0, 95.0)]
+
+    for lon, (score, matches) in zip(natal_lons, _score(natal_lons, event)):
+        found = aspect_between("火星", "太陽", 200.0, lon % 360, 0.7, 0.0)
+        if found is None or found[1] > 2:
+            assert matches == []
+            continue
+        aspect_name, deviation, aspect_type = found
+        assert score == pytest.approx(1 - deviation / 2)
+        assert (matches[0]["aspect_name"], matches[0]["aspect_type"]) == (aspect_name, aspect_type)
+        assert matches[0]["orb"] == round(deviation, 4)
+
+
+def test_overlapping_orbs_pick_the_nearest_aspect():
+    event = _event([{"type": "transit", "transit": "木星", "natal": "太陽", "aspects": ["倍五分相", "梅花形相"],
+                     "orb": 5}], transits={"木星": (0.0, 0.1)})
+    scored = _score([146.2, 148.0, 145.0], event)
+    assert [matches[0]["aspect_name"] for _, matches in scored] == ["倍五分相", "梅花形相", "倍五分相"]
+
+
+def test_solar_arc_and_house_criteria():
+    event = _event([
+        {"type": "solar_arc", "directed": "上升", "natal": "太陽", "aspects": ["沖"], "orb": 1.5, "weight": 2},
+        {"type": "transit_house", "transit": "月亮", "house": 3},
+    ], transits={"月亮": (65.0, 13.0)}, solar_arc=10.0)
+
+    (score, matches), = _score([191.0], event)
+
+    assert score == pytest.approx(2 * (1 - 1 / 1.5) + 1)
+    assert [match["type"] for match in matches] == ["solar_arc", "transit_house"]
+    assert matches[0]["aspect_name"] == "沖"
+
+
+@pytest.mark.parametrize("criterion, message", [
+    ({"type": "transit", "transit": "冥王星", "natal": "太陽"}, "行運天體"),
+    ({"type": "transit", "transit": "土星", "natal": "太陽", "aspects": ["不存在"]}, "相位列表"),
+    ({"type": "transit", "transit": "土星", "natal": "太陽", "orb": 0}, "orb"),
+    ({"type": "transit_house", "transit": "土星", "house": 13}, "house"),
+    ({"type": "progression"}, "type"),
+])
+def test_invalid_criteria(criterion, message):
+    with pytest.raises(ValueError, match=message):
+        rectification.parse_criteria([criterion], BODIES, ASPECTS)
+
+
+def test_endpoint_accepts_wide_orbs():
+    client = app_module.app.test_client()
+    payload = {"year": 1990, "month": 1, "day": 1, "latitude": 25.09, "longitude": 121.52, "timezone": "Asia/Taipei",
+               "step_minutes": 60, "top": 24, "events": [{"date": "2020-01-01T00:00:00", "criteria": [
+                   {"type": "transit", "transit": "土星", "natal": "上升", "aspects": ["合相"], "orb": 20}]}]}
+    body = client.post("/api/v1/chart/rectify", json=payload, headers={"X-API-Key": os.environ["ASTRO_API_KEY"]}).get_json()
+
+    orbs = [match["orb"] for candidate in body["candidates"] for match in candidate["matches"]]
+    assert any(orb > DEFAULT_ORB["合相"] for orb in orbs)
+    assert all(orb <= 20 for orb in orbs)
+    for candidate in body["candidates"]:
+        assert candidate["score"] == pytest.approx(sum(1 - match["orb"] / 20 for match in candidate["matches"]), abs=1e-3)
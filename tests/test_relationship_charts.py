@@ -0,0 +1,124 @@
+# tests/test_relationship_charts.py
+# 組合盤與時空中點盤：中點計算與手算結果比對，端點輸出與兩張本命盤的中點一致。
+import datetime
+import os
+
+import pytest
+
+import app as app_module
+import relationship_charts
+from display_format import zodiac_format
+
+PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "上升", "下降", "天頂", "天底"]
+CHART1 = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30, "latitude": 25.09, "longitude": 121.52,
+          "timezone": "Asia/Taipei"}
+CHART2 = {**CHART1, "year": 1988, "latitude": 22.63, "longitude": 120.30}
+PAYLOAD = {**{f"chart1_{key}": value for key, value in CHART1.items()},
+           **{f"chart2_{key}": value for key, value in CHART2.items()}, "optional_planets": PLANETS}
+
+
+@pytest.fixture
+def post():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda path, payload: client.post(path, json=payload, headers=headers).get_json()
+
+
+def _hand_midpoint(a, b):
+    # 由 a 沿較短的弧走到 b 的一半
+    delta = (b - a + 180) % 360 - 180
+    return (a + delta / 2) % 360
+
+
+def _angle_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    (10, 20, 15), (350, 10, 0), (10, 350, 0), (300, 60, 0), (170, 200, 185), (0, 0, 0), (359, 1, 0), (90, 200, 145),
+])
+def test_circular_midpoints(a, b, expected):
+    assert _angle_diff(float(relationship_charts.circular_midpoints([a], [b])[0]), expected) < 1e-9
+
+
+def test_circular_midpoints_are_in_range():
+    lons_a = [0.5 * n for n in range(720)]
+    lons_b = [(37.3 * n) % 360 for n in range(720)]
+    midpoints = relationship_charts.circular_midpoints(lons_a, lons_b)
+    assert ((midpoints >= 0) & (midpoints < 360)).all()
+    for a, b, mid in zip(lons_a, lons_b, midpoints.tolist()):
+        if _angle_diff(a, b) < 179.999:
+            assert _angle_diff(mid, _hand_midpoint(a, b)) < 1e-9, (a, b)
+
+
+def test_composite_positions_skips_missing_points():
+    cusps_a = {house: 30.0 * (house - 1) for house in range(1, 13)}
+    cusps_b = {house: (30.0 * (house - 1) + 20) % 360 for house in range(1, 13)}
+    points, cusps = relationship_charts.composite_positions({"太陽": 350.0, "月亮": 100.0}, {"太陽": 20.0},
+                                                            cusps_a, cusps_b, ["太陽", "月亮"])
+    assert set(points) == {"太陽"} and _angle_diff(points["太陽"], 5) < 1e-9
+    assert [round(cusps[house], 9) for house in range(1, 13)] == [(30.0 * (house - 1) + 10) % 360 for house in range(1, 13)]
+
+
+def test_midpoint_moment_rounds_to_the_second():
+    start = datetime.datetime(1988, 1, 1, 4, 30)
+    assert relationship_charts.midpoint_moment(start, datetime.datetime(1990, 1, 1, 4, 30)) == \
+        datetime.datetime(1988, 12, 31, 16, 30)
+    assert relationship_charts.midpoint_moment(start, start + datetime.timedelta(seconds=3)) == \
+        datetime.datetime(1988, 1, 1, 4, 30, 2)
+    assert relationship_charts.midpoint_moment(start + datetime.timedelta(seconds=1), start) == \
+        datetime.datetime(1988, 1, 1, 4, 30, 1)
+
+
+def test_midpoint_location_wraps_longitude():
+    assert relationship_charts.midpoint_location(25.0, 121.0, 23.0, 119.0) == pytest.approx((24.0, 120.0))
+    latitude, longitude = relationship_charts.midpoint_location(10.0, 170.0, -20.0, -170.0)
+    assert latitude == pytest.approx(-5.0)
+    assert abs(longitude) == pytest.approx(180.0)
+    assert relationship_charts.midpoint_location(0.0, -10.0, 0.0, 30.0)[1] == pytest.approx(10.0)
+    assert relationship_charts.midpoint_location(0.0, -100.0, 0.0, -120.0)[1] == pytest.approx(-110.0)
+
+
+def test_composite_endpoint_matches_hand_midpoints(post):
+    body = post("/calculate_composite_chart", PAYLOAD)
+    natal1 = body["natal_chart1_data"]["planet_positions"]
+    natal2 = body["natal_chart2_data"]["planet_positions"]
+    composite = body["composite_chart_data"]["planet_positions"]
+
+    assert set(composite) == set(PLANETS)
+    for name in ("太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "上升", "天頂"):
+        assert _angle_diff(composite[name]["lon"], _hand_midpoint(natal1[name]["lon"], natal2[name]["lon"])) < 1e-9, name
+        assert composite[name]["speed"] == 0 and composite[name]["is_retrograde"] is False
+    assert _angle_diff(composite["下降"]["lon"], composite["上升"]["lon"] + 180) < 1e-9
+    assert _angle_diff(composite["天底"]["lon"], composite["天頂"]["lon"] + 180) < 1e-9
+
+    # 顯示用宮頭只有星座度數字串，改由原始資料端點取兩張本命盤的宮頭手算中點
+    raw1 = post("/api/v1/chart/single", {**CHART1, "fields": "house_cusps"})["house_cusps"]
+    raw2 = post("/api/v1/chart/single", {**CHART2, "fields": "house_cusps"})["house_cusps"]
+    assert {cusp["house_number"]: cusp["zodiac_position_formatted"]
+            for cusp in body["composite_chart_data"]["house_cusps"]} == \
+        {int(house): zodiac_format(_hand_midpoint(lon, raw2[house])) for house, lon in raw1.items()}
+
+
+def test_davison_endpoint_is_a_chart_at_the_midpoint(post):
+    # 1988-01-01 04:30 UTC 與 1990-01-01 04:30 UTC 相隔 731 日，中點為 1988-12-31 16:30 UTC；
+    # 出生地中點為 (23.86, 120.91)
+    davison = post("/calculate_davison_chart", {**PAYLOAD, "fields": ["planet_positions", "house_cusps"]})
+    direct = post("/calculate_single_chart", {"year": 1988, "month": 12, "day": 31, "hour": 16, "minute": 30,
+                                              "latitude": 23.86, "longitude": 120.91, "timezone": "UTC",
+                                              "optional_planets": PLANETS})
+
+    assert set(davison) == {"chart_type", "davison_chart_data"}
+    chart = davison["davison_chart_data"]
+    assert set(chart["planet_positions"]) == set(direct["planet_positions"])
+    for name, info in direct["planet_positions"].items():
+        assert chart["planet_positions"][name]["lon"] == pytest.approx(info["lon"], abs=1e-9), name
+        assert chart["planet_positions"][name]["house"] == info["house"]
+    assert chart["house_cusps"] == direct["house_cusps"]
+
+
+def test_relationship_errors_name_the_source(post):
+    body = post("/calculate_davison_chart", {**PAYLOAD, "chart2_timezone": "Mars/Olympus"})
+    assert body["error_type"] == "invalid_timezone"
+    body = post("/calculate_composite_chart", {**PAYLOAD, "chart2_timezone": "Mars/Olympus"})
+    assert body["error_source"] == "chart2"
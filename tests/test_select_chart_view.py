@@ -0,0 +1,57 @@
+# tests/test_select_chart_view.py
+# appC 的比較盤／行運盤：每個人以兩人選星的聯集計算一次，再以 select_chart_view 取出各自的檢視。
+import pytest
+
+import appC
+import astro_engine
+
+TAIPEI = (1990, 1, 1, 12, 30, 25.09, 121.52, "Asia/Taipei")
+NIGHT = (1988, 7, 20, 23, 50, -33.9, 151.2, "Australia/Sydney")
+UNION = ["太陽", "月亮", "水星", "金星", "火星", "木星", "上升", "天頂", "福點", "北交", "凱龍"]
+
+
+def _canonical(chart):
+    """相位兩端的星體順序取決於集合的迭代順序，比較前依名稱排好。"""
+    def pair(asp):
+        if asp["p1_name"] <= asp["p2_name"]:
+            return asp
+        return {**asp, "p1_name": asp["p2_name"], "p2_name": asp["p1_name"],
+                "p1_details": asp["p2_details"], "p2_details": asp["p1_details"]}
+    aspects = sorted((pair(asp) for asp in chart.get("aspects") or []),
+                     key=lambda asp: (asp["aspect_name"], asp["p1_name"], asp["p2_name"]))
+    return {**chart, "aspects": aspects}
+
+
+def _payload(prefix, args):
+    keys = ("year", "month", "day", "hour", "minute", "latitude", "longitude", "timezone")
+    return {f"{prefix}{key}": value for key, value in zip(keys, args)}
+
+
+@pytest.mark.parametrize("args", [TAIPEI, NIGHT])
+@pytest.mark.parametrize("subset", [["太陽", "月亮"], ["水星", "上升", "北交"], ["太陽", "月亮", "上升", "福點"], []])
+def test_view_equals_direct_calculation(args, subset):
+    union_chart = astro_engine.calculate_astrology_chart(*args, UNION)
+    direct = astro_engine.calculate_astrology_chart(*args, subset)
+    assert _canonical(appC.select_chart_view(union_chart, subset)) == _canonical(direct)
+
+
+def test_view_passes_errors_through():
+    error = {"error": "bad", "error_type": "invalid_timezone"}
+    assert appC.select_chart_view(error, ["太陽"]) is error
+
+
+def test_comparison_views_match_single_charts():
+    client = appC.app.test_client()
+    chart1_planets, chart2_planets = ["太陽", "月亮", "金星", "福點"], ["火星", "木星", "上升"]
+    response = client.post("/calculate_comparison_chart", json={
+        **_payload("chart1_", TAIPEI), **_payload("chart2_", NIGHT),
+        "chart1_optional_planets": chart1_planets, "chart2_optional_planets": chart2_planets}).get_json()
+
+    for key, args, planets in (("chart1_data", TAIPEI, chart1_planets), ("chart2_data", NIGHT, chart2_planets)):
+        single = client.post("/calculate_single_chart", json={**_payload("", args), "optional_planets": planets}).get_json()
+        single.pop("chart_type")
+        assert _canonical(response[key]) == _canonical(single)
+    # 跨盤相位使用兩人選星的聯集
+    names = {asp["p1_name"] for asp in response["inter_aspects"]} | {asp["p2_name"] for asp in response["inter_aspects"]}
+    assert names - set(chart1_planets) - set(chart2_planets) == set()
+    assert names & set(chart2_planets) and names & set(chart1_planets)
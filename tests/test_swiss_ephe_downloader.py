@@ -0,0 +1,199 @@
+# tests/test_swiss_ephe_downloader.py
+# 以本機 http.server 模擬星曆檔鏡像站，測試續傳、雜湊驗證、跨行程檔案鎖與小行星檔案延遲下載。
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import swisseph as swe
+
+import swiss_ephe_downloader as downloader
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILES = {
+    "sepl_18.se1": os.urandom(200_000),
+    "semo_18.se1": os.urandom(50_000),
+    "ast_433.eph": os.urandom(30_000),
+}
+
+
+def _manifest(files=FILES):
+    return {name: {"sha256": hashlib.sha256(body).hexdigest(), "size": len(body)} for name, body in files.items()}
+
+
+class _MirrorHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        body = self.server.files.get(name)
+        self.server.requests.append((name, self.headers.get("Range")))
+        if body is None:
+            self.send_error(404)
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            start = int(range_header[len("bytes="):].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        for offset in range(start, len(body), 16 * 1024):
+            self.wfile.write(body[offset:offset + 16 * 1024])
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MirrorHandler)
+    server.files = dict(FILES)
+    server.requests = []
+    server.chunk_delay = 0.0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    # 行程內的就緒快取會讓後續測試跳過下載
+    monkeypatch.setattr(downloader, "_ready_files", set())
+    monkeypatch.setattr(downloader, "_failed_files", {})
+
+
+def test_resumes_partial_download_with_range(tmp_path, mirror):
+    body = FILES["sepl_18.se1"]
+    (tmp_path / "sepl_18.se1.part").write_bytes(body[:70_000])
+
+    errors = downloader.ensure_files(["sepl_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest=_manifest())
+
+    assert errors == {}
+    assert mirror.requests == [("sepl_18.se1", "bytes=70000-")]
+    assert (tmp_path / "sepl_18.se1").read_bytes() == body
+    assert not (tmp_path / "sepl_18.se1.part").exists()
+
+
+def test_truncated_existing_file_is_resumed(tmp_path, mirror):
+    body = FILES["sepl_18.se1"]
+    (tmp_path / "sepl_18.se1").write_bytes(body[:120_000])
+
+    errors = downloader.ensure_files(["sepl_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest=_manifest())
+
+    assert errors == {}
+    assert mirror.requests == [("sepl_18.se1", "bytes=120000-")]
+    assert (tmp_path / "sepl_18.se1").read_bytes() == body
+
+
+def test_rejects_checksum_mismatch(tmp_path, mirror):
+    mirror.files["sepl_18.se1"] = os.urandom(len(FILES["sepl_18.se1"]))
+
+    errors = downloader.ensure_files(["sepl_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest=_manifest())
+
+    assert "SHA-256" in errors["sepl_18.se1"]
+    assert not (tmp_path / "sepl_18.se1").exists()
+    assert not (tmp_path / "sepl_18.se1.part").exists()
+
+
+def test_refuses_files_missing_from_manifest(tmp_path, mirror):
+    errors = downloader.ensure_files(["semo_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest=_manifest({"sepl_18.se1": FILES["sepl_18.se1"]}))
+
+    assert "manifest" in errors["semo_18.se1"]
+    assert mirror.requests == []
+
+    errors = downloader.ensure_files(["semo_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest={}, allow_unverified=True)
+    assert errors == {}
+    assert (tmp_path / "semo_18.se1").read_bytes() == FILES["semo_18.se1"]
+
+
+_CONCURRENT_SCRIPT = """
+import json, sys
+import swiss_ephe_downloader as downloader
+ephe_dir, base_url, manifest = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+print(json.dumps(downloader.ensure_files(["sepl_18.se1"], ephe_dir=ephe_dir, base_url=base_url, manifest=manifest)))
+"""
+
+
+def test_file_lock_serializes_concurrent_downloaders(tmp_path, mirror):
+    # 每個區塊之間暫停，讓下載持續到第二個行程也在等鎖
+    mirror.chunk_delay = 0.05
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    args = [sys.executable, "-c", _CONCURRENT_SCRIPT, str(tmp_path), mirror.url, json.dumps(_manifest())]
+    processes = [subprocess.Popen(args, env=env, stdout=subprocess.PIPE, text=True) for _ in range(2)]
+    outputs = [process.communicate(timeout=60)[0] for process in processes]
+
+    assert [process.returncode for process in processes] == [0, 0]
+    assert [json.loads(output) for output in outputs] == [{}, {}]
+    assert mirror.requests == [("sepl_18.se1", None)]
+    assert (tmp_path / "sepl_18.se1").read_bytes() == FILES["sepl_18.se1"]
+
+
+def test_asteroid_files_are_fetched_on_first_use(tmp_path, mirror, monkeypatch):
+    manifest_path = tmp_path / "ephe_manifest.json"
+    manifest_path.write_text(json.dumps({"files": _manifest()}), encoding="utf-8")
+    ephe_dir = tmp_path / "ephe"
+    monkeypatch.setattr(downloader, "EPHE_DIR", str(ephe_dir))
+    monkeypatch.setattr(downloader, "BASE_URL", mirror.url)
+    monkeypatch.setattr(downloader, "MANIFEST_PATH", str(manifest_path))
+    monkeypatch.setattr(downloader, "DOWNLOADS_ENABLED", True)
+    monkeypatch.setattr(downloader, "CORE_FILES", ["sepl_18.se1", "semo_18.se1"])
+
+    downloader.ensure_ephe_files_exist()
+    assert sorted(name for name, _ in mirror.requests) == ["semo_18.se1", "sepl_18.se1"]
+
+    downloader.ensure_body_files(swe.MARS)
+    assert len(mirror.requests) == 2
+
+    downloader.ensure_body_files(swe.AST_OFFSET + 433)
+    assert mirror.requests[2:] == [("ast_433.eph", None)]
+    assert (ephe_dir / "ast_433.eph").read_bytes() == FILES["ast_433.eph"]
+
+    downloader.ensure_body_files(swe.AST_OFFSET + 433)
+    assert len(mirror.requests) == 3
+
+
+def test_size_only_without_manifest(tmp_path, mirror, monkeypatch):
+    # 尚未提交清單檔時預設只檢查大小，照常下載
+    monkeypatch.setattr(downloader, "ALLOW_UNVERIFIED", None)
+
+    errors = downloader.ensure_files(["semo_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url, manifest={})
+
+    assert errors == {}
+    assert (tmp_path / "semo_18.se1").read_bytes() == FILES["semo_18.se1"]
+
+
+def test_unlisted_file_on_disk_is_moved_aside(tmp_path, mirror, monkeypatch):
+    monkeypatch.setattr(downloader, "ALLOW_UNVERIFIED", None)
+    (tmp_path / "semo_18.se1").write_bytes(b"unknown origin")
+
+    errors = downloader.ensure_files(["semo_18.se1"], ephe_dir=str(tmp_path), base_url=mirror.url,
+                                     manifest=_manifest({"sepl_18.se1": FILES["sepl_18.se1"]}))
+
+    assert "manifest" in errors["semo_18.se1"]
+    # Swisseph 只找 semo_18.se1，改名後不會讀到未驗證的內容
+    assert not (tmp_path / "semo_18.se1").exists()
+    assert (tmp_path / "semo_18.se1.unverified").read_bytes() == b"unknown origin"
+    assert mirror.requests == []
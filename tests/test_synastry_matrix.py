@@ -0,0 +1,78 @@
+# tests/test_synastry_matrix.py
+import json
+import os
+
+import pytest
+
+import app as app_module
+import astro_engine
+
+PLANETS = ["太陽", "月亮", "水星", "金星", "火星", "木星", "土星", "上升", "天頂"]
+ANN = {"id": "ann", "year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 30,
+       "latitude": 25.09, "longitude": 121.52, "timezone": "Asia/Taipei"}
+BEN = {"id": "ben", "year": 1988, "month": 7, "day": 20, "hour": 23, "minute": 50,
+       "latitude": -33.9, "longitude": 151.2, "timezone": "Australia/Sydney"}
+CAT = {"id": "cat", "year": 1985, "month": 6, "day": 15, "hour": 8, "minute": 0,
+       "latitude": 51.5, "longitude": -0.12, "timezone": "Europe/London"}
+
+
+@pytest.fixture
+def post_matrix():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+
+    def post(payload):
+        response = client.post("/api/v1/chart/synastry_matrix", json=payload, headers=headers)
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return post
+
+
+def _chart(person):
+    args = [person[key] for key in ("year", "month", "day", "hour", "minute", "latitude", "longitude", "timezone")]
+    return astro_engine.calculate_astrology_chart(*args, PLANETS)
+
+
+def _aspect_rows(aspects):
+    return [(asp["p1_name"], asp["p2_name"], asp["aspect_name"], asp["aspect_type"], asp["orb"]) for asp in aspects]
+
+
+def test_pairs_match_separate_interchart_calculation(post_matrix):
+    bad = {**CAT, "id": "bad", "timezone": "Mars/Base"}
+    lines = post_matrix({"subjects": [ANN, BEN], "candidates": [CAT, bad, {**ANN, "id": "ann-again"}],
+                         "optional_planets": PLANETS})
+
+    assert lines[0] == {"type": "chart_error", "role": "candidate", "index": 1, "id": "bad",
+                        "error": lines[0]["error"], "error_type": "invalid_timezone"}
+    pairs = [line for line in lines if line["type"] == "pair"]
+    assert [(pair["subject"]["id"], pair["candidate"]["id"]) for pair in pairs] == [
+        ("ann", "cat"), ("ann", "ann-again"), ("ben", "cat"), ("ben", "ann-again")]
+    # 重複的出生資料只計算一次
+    assert lines[-1] == {"type": "summary", "subjects": 2, "candidates": 3, "charts_computed": 4,
+                         "failed_charts": 1, "pairs": 4}
+
+    charts = {"ann": _chart(ANN), "ben": _chart(BEN), "cat": _chart(CAT), "ann-again": _chart(ANN)}
+    for pair in pairs:
+        subject, candidate = charts[pair["subject"]["id"]], charts[pair["candidate"]["id"]]
+        expected = astro_engine.list_interchart_aspects(subject["planet_positions"], candidate["planet_positions"])
+        assert _aspect_rows(pair["inter_aspects"]) == _aspect_rows(expected)
+        assert pair["summary"] == astro_engine.synastry_summary(expected)
+        assert pair["subject_planets_in_candidate_houses"] == astro_engine.get_planet_overlays_in_houses(
+            subject["planet_positions"], candidate["house_cusps"])
+        assert pair["candidate_planets_in_subject_houses"] == astro_engine.get_planet_overlays_in_houses(
+            candidate["planet_positions"], subject["house_cusps"])
+
+
+def test_summary_only(post_matrix):
+    lines = post_matrix({"subject": ANN, "candidates": [BEN, CAT], "summary_only": True})
+    pairs = [line for line in lines if line["type"] == "pair"]
+    assert len(pairs) == 2
+    assert all(set(pair) == {"type", "subject", "candidate", "summary"} for pair in pairs)
+
+
+def test_pair_limit(monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_SYNASTRY_PAIRS", 3)
+    response = app_module.app.test_client().post(
+        "/api/v1/chart/synastry_matrix", json={"subjects": [ANN, BEN], "candidates": [CAT, BEN]},
+        headers={"X-API-Key": os.environ["ASTRO_API_KEY"]})
+    assert response.status_code == 413
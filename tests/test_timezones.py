@@ -0,0 +1,66 @@
+# tests/test_timezones.py
+import datetime
+import gzip
+import json
+
+import pytest
+import pytz
+
+import app as app_module
+import chart_cache
+import timezones
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    chart_cache.TIMEZONE_CACHE.clear()
+
+
+@pytest.mark.parametrize("naive, zone", [
+    (datetime.datetime(2024, 3, 10, 2, 30), "America/New_York"),   # 日光節約開始，不存在的時刻
+    (datetime.datetime(2024, 11, 3, 1, 30), "America/New_York"),   # 日光節約結束，重複的時刻
+    (datetime.datetime(1990, 1, 1, 12, 30), "Asia/Taipei"),
+    (datetime.datetime(1945, 5, 1, 0, 0), "Europe/London"),        # 雙重夏令時間
+])
+def test_resolve_matches_pytz_localize(naive, zone):
+    local_dt, utc_dt = timezones.resolve(naive, zone)
+    expected = pytz.timezone(zone).localize(naive)
+    assert local_dt == expected and local_dt.utcoffset() == expected.utcoffset()
+    assert utc_dt == expected.astimezone(pytz.utc)
+    assert timezones.to_utc(naive, zone) == utc_dt
+
+
+def test_results_are_cached():
+    naive = datetime.datetime(1990, 1, 1, 12, 30)
+    first = timezones.resolve(naive, "Asia/Taipei")
+    hits = chart_cache.TIMEZONE_CACHE.hits
+    assert timezones.resolve(naive, "Asia/Taipei") is first
+    assert chart_cache.TIMEZONE_CACHE.hits == hits + 1
+
+
+def test_override_uses_fixed_offset():
+    # 中國 1986–1991 年實施夏令時間；占星修正表讓 Asia/Chongqing 一律為 UTC+8
+    naive = datetime.datetime(1988, 7, 1, 12, 0)
+    assert pytz.timezone("Asia/Shanghai").localize(naive).utcoffset() == datetime.timedelta(hours=9)
+    local_dt, utc_dt = timezones.resolve(naive, "Asia/Chongqing")
+    assert local_dt.utcoffset() == datetime.timedelta(hours=8)
+    assert utc_dt == datetime.datetime(1988, 7, 1, 4, 0, tzinfo=pytz.utc)
+
+
+def test_unknown_zone_raises_and_is_not_cached():
+    with pytest.raises(pytz.UnknownTimeZoneError):
+        timezones.resolve(datetime.datetime(2000, 1, 1), "Mars/Base")
+    assert chart_cache.TIMEZONE_CACHE.stats()["size"] == 0
+
+
+def test_timezone_list_endpoint():
+    client = app_module.app.test_client()
+    response = client.get("/api/timezones")
+    assert response.status_code == 200
+    assert response.get_json() == list(pytz.all_timezones)
+    etag = response.headers["ETag"]
+
+    assert client.get("/api/timezones", headers={"If-None-Match": etag}).status_code == 304
+    compressed = client.get("/api/timezones", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == list(pytz.all_timezones)
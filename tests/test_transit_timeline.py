@@ -0,0 +1,34 @@
+# tests/test_transit_timeline.py
+import json
+import os
+
+import pytest
+
+import app as app_module
+
+NATAL = {
+    "natal_year": 1990, "natal_month": 5, "natal_day": 1, "natal_hour": 12, "natal_minute": 0,
+    "natal_latitude": 25.0, "natal_longitude": 121.5, "natal_timezone": "Asia/Taipei",
+    "natal_optional_planets": ["太陽"], "start": "2024-01-01T00:00:00", "end": "2024-01-05T00:00:00",
+}
+
+
+@pytest.fixture
+def post_timeline():
+    client = app_module.app.test_client()
+    headers = {"X-API-Key": os.environ["ASTRO_API_KEY"]}
+    return lambda payload: client.post("/api/v1/chart/transit_timeline", json=payload, headers=headers)
+
+
+def test_natal_chart_uses_requested_house_system(post_timeline):
+    response = post_timeline({**NATAL, "house_system": "koch"})
+    assert response.status_code == 200
+    natal = json.loads(response.get_data(as_text=True).splitlines()[0])
+    assert natal["type"] == "natal"
+    assert natal["chart"]["house_system"] == "koch"
+
+
+def test_invalid_house_system_is_rejected(post_timeline):
+    response = post_timeline({**NATAL, "house_system": "nonsense"})
+    assert response.status_code == 400
+    assert response.get_json()["error_type"] == "invalid_house_system"
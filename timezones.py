@@ -0,0 +1,86 @@
+# timezones.py
+# 時區處理：時區物件只建立一次，(時區, 當地時間) 的換算結果有快取，
+# 占星上的時區修正改由 ZONE_OVERRIDES 表格設定，/api/timezones 的回應內容也預先產生好。
+import datetime
+import gzip
+import hashlib
+import json
+import threading
+
+import pytz
+
+import chart_cache
+
+# 占星慣例的時區修正：這些時區不使用 IANA 的歷史規則，而是固定的 UTC 偏移
+# 時區名稱: (UTC 偏移分鐘數, 顯示名稱)
+ZONE_OVERRIDES = {
+    "Asia/Chongqing": (8 * 60, "UTC+08:00 (Astrological Correction for Chengdu)"),
+}
+
+_OVERRIDE_ZONES = {
+    name: datetime.timezone(datetime.timedelta(minutes=minutes), name=label)
+    for name, (minutes, label) in ZONE_OVERRIDES.items()
+}
+
+_zones = {}
+_zones_lock = threading.Lock()
+
+
+def get_zone(timezone_str):
+    """回傳時區物件（修正表優先），同名時區只建立一次。名稱無效時拋出 pytz.UnknownTimeZoneError。"""
+    zone = _OVERRIDE_ZONES.get(timezone_str) or _zones.get(timezone_str)
+    if zone is None:
+        zone = pytz.timezone(timezone_str)
+        with _zones_lock:
+            _zones[timezone_str] = zone
+    return zone
+
+
+def resolve(naive_dt, timezone_str):
+    """
+    將不含時區的當地時間換算為 (含時區的當地時間, UTC 時間)。
+    結果以 (時區名稱, 當地時間) 為鍵快取；日光節約時間重疊或跳過的時刻沿用 pytz localize 的預設 (is_dst=False)。
+    """
+    key = (timezone_str, naive_dt)
+    cached = chart_cache.TIMEZONE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    zone = get_zone(timezone_str)
+    if isinstance(zone, datetime.timezone):
+        local_dt = naive_dt.replace(tzinfo=zone)
+    else:
+        local_dt = zone.localize(naive_dt)
+    result = (local_dt, local_dt.astimezone(pytz.utc))
+    chart_cache.TIMEZONE_CACHE.set(key, result)
+    return result
+
+
+def localize(naive_dt, timezone_str):
+    return resolve(naive_dt, timezone_str)[0]
+
+
+def to_utc(naive_dt, timezone_str):
+    return resolve(naive_dt, timezone_str)[1]
+
+
+class PrecomputedPayload:
+    """預先序列化好的回應內容，附 gzip 壓縮版本與 ETag。"""
+    __slots__ = ("body", "gzip_body", "etag", "mimetype")
+
+    def __init__(self, body: bytes, mimetype="application/json"):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.mimetype = mimetype
+
+
+_timezone_list_payload = None
+
+
+def timezone_list_payload():
+    """所有 IANA 時區名稱的 JSON 陣列（與 jsonify 的輸出相同），第一次呼叫時產生。"""
+    global _timezone_list_payload
+    if _timezone_list_payload is None:
+        body = (json.dumps(list(pytz.all_timezones), separators=(",", ":")) + "\n").encode("utf-8")
+        _timezone_list_payload = PrecomputedPayload(body)
+    return _timezone_list_payload